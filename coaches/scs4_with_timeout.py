@@ -3,9 +3,7 @@ import queue
 import time
 import aiohttp
 import pandas as pd
-from bs4 import BeautifulSoup
 import json
-import re
 import logging
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
@@ -21,6 +19,11 @@ import base64
 from config import GEMINI_API_KEYS, GOOGLE_API_KEY, SEARCH_ENGINE_ID
 import random
 from concurrent.futures import ThreadPoolExecutor
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scraper_common.staff_parser import extract_staff
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -115,8 +118,8 @@ async def html_based_scraping(url, school_name, max_retries=3, timeout=60):
             # Get the page source after scrolling and loading all content
             html_content = driver.page_source
             
-            soup = BeautifulSoup(html_content, 'html.parser')
-            coaches = extract_softball_coaches(soup)
+            coaches, fp = extract_staff(url, html_content)
+            logging.info(f"Extracted {len(coaches)} coaches for {school_name} ({fp})")
             return coaches, len(coaches) > 0
 
         except (TimeoutException, WebDriverException) as e:
@@ -131,148 +134,6 @@ async def html_based_scraping(url, school_name, max_retries=3, timeout=60):
 
     return None, False
 
-def extract_softball_coaches(soup):
-    coaches = []
-    
-    # Pattern 1: Table with "Softball" header
-    softball_header = soup.find(['th', 'td'], string=re.compile(r'\bSoftball\b', re.IGNORECASE))
-    if softball_header:
-        table = softball_header.find_parent('table')
-        if table:
-            coaches.extend(extract_coaches_from_table(table))
-    
-    # Pattern 2: Div with "Softball" class or text
-    softball_div = soup.find('div', class_=lambda x: x and 'softball' in x.lower())
-    if not softball_div:
-        softball_div = soup.find('div', string=re.compile(r'\bSoftball Coaches?\b', re.IGNORECASE))
-    if softball_div:
-        coaches.extend(extract_coaches_from_divs(softball_div))
-    
-    # Pattern 3: Specific div structure (Example 1)
-    category_div = soup.find('div', class_='category', string=re.compile(r'\bSoftball Coaches?\b', re.IGNORECASE))
-    if category_div:
-        member_divs = category_div.find_next_siblings('div', class_='member')
-        for div in member_divs:
-            coach = extract_coach_from_div(div)
-            if coach:
-                coaches.append(coach)
-    
-    # Pattern 4: Specific div structure (Example 2)
-    softball_header = soup.find('h3', class_='s-text-title', string='Softball')
-    if softball_header:
-        person_cards = softball_header.find_next_siblings('div', class_='s-person-card')
-        for card in person_cards:
-            coach = extract_coach_from_person_card(card)
-            if coach:
-                coaches.append(coach)
-    
-    # Pattern 5: Specific table structure (Example 3)
-    softball_table = soup.find('table', class_=lambda x: x and 'table' in x)
-    if softball_table and softball_table.find('th', string=re.compile(r'\bSoftball\b', re.IGNORECASE)):
-        coaches.extend(extract_coaches_from_table(softball_table))
-    
-    # Pattern 6: Specific div structure (Example 4)
-    person_cards = soup.find_all('div', class_='s-person-card')
-    for card in person_cards:
-        coach = extract_coach_from_person_card(card)
-        if coach:
-            coaches.append(coach)
-    
-    return coaches
-
-def extract_coaches_from_table(table):
-    coaches = []
-    rows = table.find_all('tr')
-    for row in rows:
-        coach = extract_coach_from_row(row)
-        if coach:
-            coaches.append(coach)
-    return coaches
-
-def extract_coaches_from_divs(container):
-    coaches = []
-    member_divs = container.find_all('div', class_=lambda x: x and 'member' in x.lower())
-    for div in member_divs:
-        coach = extract_coach_from_div(div)
-        if coach:
-            coaches.append(coach)
-    return coaches
-
-def extract_coach_from_row(row):
-    cells = row.find_all(['td', 'th'])
-    if len(cells) >= 2:
-        name = cells[0].text.strip()
-        title = cells[1].text.strip() if len(cells) > 1 else ''
-        email = extract_email(row)
-        phone = extract_phone(row)
-        twitter = extract_twitter(row)
-        
-        if name and any([title, email, phone, twitter]):
-            return {
-                'Name': name,
-                'Title': title,
-                'Email': email,
-                'Phone': phone,
-                'Twitter': twitter
-            }
-    return None
-
-def extract_coach_from_div(div):
-    name_elem = div.find('a') or div.find('div', class_='name')
-    name = name_elem.text.strip() if name_elem else ''
-    title = div.find(string=re.compile(r'Head Coach|Assistant Coach', re.IGNORECASE))
-    title = title.strip() if title else ''
-    email = extract_email(div)
-    phone = extract_phone(div)
-    twitter = extract_twitter(div)
-    
-    if name and any([title, email, phone, twitter]):
-        return {
-            'Name': name,
-            'Title': title,
-            'Email': email,
-            'Phone': phone,
-            'Twitter': twitter
-        }
-    return None
-
-def extract_coach_from_person_card(card):
-    name_elem = card.find('h4') or card.find('div', class_='s-person-details__personal-single-line')
-    name = name_elem.text.strip() if name_elem else ''
-    title_elem = card.find('div', class_='s-person-details__position')
-    title = title_elem.text.strip() if title_elem else ''
-    email = extract_email(card)
-    phone = extract_phone(card)
-    twitter = extract_twitter(card)
-    
-    if name and any([title, email, phone, twitter]):
-        return {
-            'Name': name,
-            'Title': title,
-            'Email': email,
-            'Phone': phone,
-            'Twitter': twitter
-        }
-    return None
-
-def extract_email(element):
-    email_elem = element.find('a', href=lambda x: x and x.startswith('mailto:'))
-    if email_elem:
-        return email_elem['href'].replace('mailto:', '')
-    return ''
-
-def extract_phone(element):
-    phone_elem = element.find(string=re.compile(r'\d{3}[-.]?\d{3}[-.]?\d{4}'))
-    if phone_elem:
-        return re.sub(r'\D', '', phone_elem)
-    return ''
-
-def extract_twitter(element):
-    twitter_elem = element.find('a', href=lambda x: x and 'twitter.com' in x)
-    if twitter_elem:
-        return twitter_elem['href']
-    return ''
-
 async def genai_based_scraping(url, school_name):
     driver = driver_pool.get_driver()
     # service = Service(ChromeDriverManager().install())
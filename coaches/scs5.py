@@ -1,27 +1,29 @@
 import asyncio
-import queue
 import time
 import aiohttp
 import pandas as pd
-from bs4 import BeautifulSoup
 import json
-import re
 import logging
-from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.common.exceptions import TimeoutException, WebDriverException
-import google.generativeai as genai
 import base64
 from config import GEMINI_API_KEYS, GOOGLE_API_KEY, SEARCH_ENGINE_ID
-import random
-from concurrent.futures import ThreadPoolExecutor
 import psutil
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scraper_common.politeness import get_host_scheduler
+from scraper_common.render_pool import RenderPool
+from scraper_common.key_scheduler import get_key_scheduler
+from scraper_common.model_client import get_model_client, close_model_client
+from scraper_common.schemas import COACH_LIST_SCHEMA, json_config, check
+from scraper_common.staff_parser import extract_staff, get_staff_dispatch
+from scraper_common.endpoint_discovery import get_endpoint_discovery
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -30,8 +32,9 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 logging.getLogger('selenium').setLevel(logging.WARNING)
 logging.getLogger('webdriver_manager').setLevel(logging.WARNING)
 
-# Configure Gemini
-genai.configure(api_key=random.choice(GEMINI_API_KEYS))
+# Gemini keys are handed out per request by the key scheduler
+key_scheduler = get_key_scheduler(GEMINI_API_KEYS)
+model_client = get_model_client(GEMINI_API_KEYS)
 
 # Configure Chrome options
 chrome_options = Options()
@@ -42,32 +45,7 @@ chrome_options.add_argument("--disable-extensions")
 chrome_options.add_argument("--disable-gpu")
 chrome_options.add_experimental_option('excludeSwitches', ['enable-logging'])
 
-class WebDriverPool:
-    def __init__(self, max_drivers=10):
-        self.max_drivers = max_drivers
-        self.drivers = queue.Queue()
-        self.count = 0
-
-    def get_driver(self):
-        if not self.drivers.empty():
-            return self.drivers.get()
-        elif self.count < self.max_drivers:
-            service = Service(ChromeDriverManager().install())
-            driver = webdriver.Chrome(service=service, options=chrome_options)
-            self.count += 1
-            return driver
-        else:
-            return self.drivers.get(block=True)
-
-    def return_driver(self, driver):
-        self.drivers.put(driver)
-
-    def cleanup(self):
-        while not self.drivers.empty():
-            driver = self.drivers.get()
-            driver.quit()
-
-driver_pool = WebDriverPool(max_drivers=15)  # Adjust the number as needed
+render_pool = RenderPool(size=15, options=chrome_options)  # Adjust the number as needed
 
 async def load_excel_data(file_path):
     try:
@@ -78,58 +56,65 @@ async def load_excel_data(file_path):
         return None
 
 async def html_based_scraping(url, school_name, max_retries=3, timeout=60):
-    driver = driver_pool.get_driver()
     try:
         logging.info(f"Starting scraping for {school_name} at {url}")
         start_time = time.time()
 
-        # Set page load timeout
-        driver.set_page_load_timeout(timeout)
-
-        # Navigate to the page
-        logging.info(f"Navigating to {url}")
-        navigation_start = time.time()
-        driver.get(url)
-        navigation_time = time.time() - navigation_start
-        logging.info(f"Initial page load took {navigation_time:.2f} seconds")
-
-        # Wait for the body to be present
-        WebDriverWait(driver, 20).until(EC.presence_of_element_located((By.TAG_NAME, "body")))
-
-        # Collect available logs
-        browser_logs = driver.get_log('browser')
-        logging.info(f"Browser logs: {browser_logs}")
-
-        # Get memory usage
-        memory_info = driver.execute_script('return window.performance.memory;')
-        if memory_info:
-            logging.info(f"Memory usage: {memory_info}")
-        else:
-            logging.info("Memory usage information not available")
-
-        # Get CPU usage
-        process = psutil.Process(driver.service.process.pid)
-        cpu_percent = process.cpu_percent(interval=1)
-        logging.info(f"CPU usage: {cpu_percent}%")
-
-        # Get network metrics
-        # navigation_timing = driver.execute_script("return window.performance.timing.toJSON();")
-        # logging.info(f"Navigation Timing: {navigation_timing}")
-
-        # Scroll and handle dynamic content
-        scroll_start_time = time.time()
-        await scroll_and_wait_for_content(driver)
-        logging.info(f"Scrolling and waiting for content took {time.time() - scroll_start_time:.2f} seconds")
-
-        # Get the page source
-        html_content = driver.page_source
-        logging.info(f"Retrieved page source. Total size: {len(html_content)} bytes")
+        # A static page, per-sport coaches page or JSON-LD block saves the render
+        coaches, source_url = await get_endpoint_discovery('staff').find(url)
+        if coaches:
+            logging.info(f"Found {len(coaches)} coaches for {school_name} at {source_url} "
+                         f"in {time.time() - start_time:.2f} seconds")
+            return coaches, True
+
+        async with render_pool.driver() as driver:
+            # Set page load timeout
+            await driver.run(driver.raw.set_page_load_timeout, timeout)
+
+            # Navigate to the page
+            logging.info(f"Navigating to {url}")
+            navigation_start = time.time()
+            await get_host_scheduler().acquire(url)
+            await driver.get(url)
+            navigation_time = time.time() - navigation_start
+            logging.info(f"Initial page load took {navigation_time:.2f} seconds")
+
+            # Wait for the body to be present
+            await driver.run(WebDriverWait(driver.raw, 20).until, EC.presence_of_element_located((By.TAG_NAME, "body")))
+
+            # Collect available logs
+            browser_logs = await driver.run(driver.raw.get_log, 'browser')
+            logging.info(f"Browser logs: {browser_logs}")
+
+            # Get memory usage
+            memory_info = await driver.execute_script('return window.performance.memory;')
+            if memory_info:
+                logging.info(f"Memory usage: {memory_info}")
+            else:
+                logging.info("Memory usage information not available")
+
+            # Get CPU usage
+            process = psutil.Process(driver.raw.service.process.pid)
+            cpu_percent = await driver.run(process.cpu_percent, interval=1)
+            logging.info(f"CPU usage: {cpu_percent}%")
+
+            # Get network metrics
+            # navigation_timing = driver.execute_script("return window.performance.timing.toJSON();")
+            # logging.info(f"Navigation Timing: {navigation_timing}")
+
+            # Scroll and handle dynamic content
+            scroll_start_time = time.time()
+            await driver.run(scroll_and_wait_for_content, driver.raw)
+            logging.info(f"Scrolling and waiting for content took {time.time() - scroll_start_time:.2f} seconds")
+
+            # Get the page source
+            html_content = await driver.page_source()
+            logging.info(f"Retrieved page source. Total size: {len(html_content)} bytes")
 
         # Parse and extract data
         parse_start_time = time.time()
-        soup = BeautifulSoup(html_content, 'html.parser')
-        coaches = extract_softball_coaches(soup)
-        logging.info(f"Parsing and extracting data took {time.time() - parse_start_time:.2f} seconds")
+        coaches, fp = extract_staff(url, html_content)
+        logging.info(f"Parsing and extracting data ({fp}) took {time.time() - parse_start_time:.2f} seconds")
 
         total_time = time.time() - start_time
         logging.info(f"Total scraping time for {school_name}: {total_time:.2f} seconds")
@@ -140,10 +125,8 @@ async def html_based_scraping(url, school_name, max_retries=3, timeout=60):
         logging.error(f"Error scraping {school_name}: {str(e)}")
         return None, False
 
-    finally:
-        driver_pool.return_driver(driver)
-
-async def scroll_and_wait_for_content(driver, max_scroll_attempts=10, scroll_pause_time=2):
+def scroll_and_wait_for_content(driver, max_scroll_attempts=10, scroll_pause_time=2):
+    # Blocking - runs on the render pool's worker thread via driver.run()
     last_height = driver.execute_script("return document.body.scrollHeight")
     
     for _ in range(max_scroll_attempts):
@@ -151,7 +134,7 @@ async def scroll_and_wait_for_content(driver, max_scroll_attempts=10, scroll_pau
         driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
         
         # Wait to load page
-        await asyncio.sleep(scroll_pause_time)
+        time.sleep(scroll_pause_time)
         
         # Calculate new scroll height and compare with last scroll height
         new_height = driver.execute_script("return document.body.scrollHeight")
@@ -166,7 +149,7 @@ async def scroll_and_wait_for_content(driver, max_scroll_attempts=10, scroll_pau
             )
             driver.execute_script("arguments[0].click();", load_more_button)
             logging.info("Clicked 'Load More' button")
-            await asyncio.sleep(scroll_pause_time)
+            time.sleep(scroll_pause_time)
         except TimeoutException:
             pass  # No "Load More" button found
 
@@ -179,170 +162,20 @@ async def scroll_and_wait_for_content(driver, max_scroll_attempts=10, scroll_pau
         logging.warning("Timed out waiting for loading indicator to disappear")
 
 
-def extract_softball_coaches(soup):
-    coaches = []
-    extraction_start_time = time.time()
-    
-    # Pattern 1: Table with "Softball" header
-    softball_header = soup.find(['th', 'td'], string=re.compile(r'\bSoftball\b', re.IGNORECASE))
-    if softball_header:
-        table = softball_header.find_parent('table')
-        if table:
-            coaches.extend(extract_coaches_from_table(table))
-    
-    # Pattern 2: Div with "Softball" class or text
-    softball_div = soup.find('div', class_=lambda x: x and 'softball' in x.lower())
-    if not softball_div:
-        softball_div = soup.find('div', string=re.compile(r'\bSoftball Coaches?\b', re.IGNORECASE))
-    if softball_div:
-        coaches.extend(extract_coaches_from_divs(softball_div))
-    
-    # Pattern 3: Specific div structure (Example 1)
-    category_div = soup.find('div', class_='category', string=re.compile(r'\bSoftball Coaches?\b', re.IGNORECASE))
-    if category_div:
-        member_divs = category_div.find_next_siblings('div', class_='member')
-        for div in member_divs:
-            coach = extract_coach_from_div(div)
-            if coach:
-                coaches.append(coach)
-    
-    # Pattern 4: Specific div structure (Example 2)
-    softball_header = soup.find('h3', class_='s-text-title', string='Softball')
-    if softball_header:
-        person_cards = softball_header.find_next_siblings('div', class_='s-person-card')
-        for card in person_cards:
-            coach = extract_coach_from_person_card(card)
-            if coach:
-                coaches.append(coach)
-    
-    # Pattern 5: Specific table structure (Example 3)
-    softball_table = soup.find('table', class_=lambda x: x and 'table' in x)
-    if softball_table and softball_table.find('th', string=re.compile(r'\bSoftball\b', re.IGNORECASE)):
-        coaches.extend(extract_coaches_from_table(softball_table))
-    
-    # Pattern 6: Specific div structure (Example 4)
-    person_cards = soup.find_all('div', class_='s-person-card')
-    for card in person_cards:
-        coach = extract_coach_from_person_card(card)
-        if coach:
-            coaches.append(coach)
-    
-    logging.info(f"Extracted {len(coaches)} coaches in {time.time() - extraction_start_time:.2f} seconds")
-    return coaches
-
-def extract_coaches_from_table(table):
-    coaches = []
-    rows = table.find_all('tr')
-    for row in rows:
-        coach = extract_coach_from_row(row)
-        if coach:
-            coaches.append(coach)
-    return coaches
-
-def extract_coaches_from_divs(container):
-    coaches = []
-    member_divs = container.find_all('div', class_=lambda x: x and 'member' in x.lower())
-    for div in member_divs:
-        coach = extract_coach_from_div(div)
-        if coach:
-            coaches.append(coach)
-    return coaches
-
-def extract_coach_from_row(row):
-    cells = row.find_all(['td', 'th'])
-    if len(cells) >= 2:
-        name = cells[0].text.strip()
-        title = cells[1].text.strip() if len(cells) > 1 else ''
-        email = extract_email(row)
-        phone = extract_phone(row)
-        twitter = extract_twitter(row)
-        
-        if name and any([title, email, phone, twitter]):
-            return {
-                'Name': name,
-                'Title': title,
-                'Email': email,
-                'Phone': phone,
-                'Twitter': twitter
-            }
-    return None
-
-def extract_coach_from_div(div):
-    name_elem = div.find('a') or div.find('div', class_='name')
-    name = name_elem.text.strip() if name_elem else ''
-    title = div.find(string=re.compile(r'Head Coach|Assistant Coach', re.IGNORECASE))
-    title = title.strip() if title else ''
-    email = extract_email(div)
-    phone = extract_phone(div)
-    twitter = extract_twitter(div)
-    
-    if name and any([title, email, phone, twitter]):
-        return {
-            'Name': name,
-            'Title': title,
-            'Email': email,
-            'Phone': phone,
-            'Twitter': twitter
-        }
-    return None
-
-def extract_coach_from_person_card(card):
-    name_elem = card.find('h4') or card.find('div', class_='s-person-details__personal-single-line')
-    name = name_elem.text.strip() if name_elem else ''
-    title_elem = card.find('div', class_='s-person-details__position')
-    title = title_elem.text.strip() if title_elem else ''
-    email = extract_email(card)
-    phone = extract_phone(card)
-    twitter = extract_twitter(card)
-    
-    if name and any([title, email, phone, twitter]):
-        return {
-            'Name': name,
-            'Title': title,
-            'Email': email,
-            'Phone': phone,
-            'Twitter': twitter
-        }
-    return None
-
-def extract_email(element):
-    email_elem = element.find('a', href=lambda x: x and x.startswith('mailto:'))
-    if email_elem:
-        return email_elem['href'].replace('mailto:', '')
-    return ''
-
-def extract_phone(element):
-    phone_elem = element.find(string=re.compile(r'\d{3}[-.]?\d{3}[-.]?\d{4}'))
-    if phone_elem:
-        return re.sub(r'\D', '', phone_elem)
-    return ''
-
-def extract_twitter(element):
-    twitter_elem = element.find('a', href=lambda x: x and 'twitter.com' in x)
-    if twitter_elem:
-        return twitter_elem['href']
-    return ''
-
 async def genai_based_scraping(url, school_name):
-    driver = driver_pool.get_driver()
-    # service = Service(ChromeDriverManager().install())
-    # driver = webdriver.Chrome(service=service, options=chrome_options)
-
     try:
-        driver.get(url)
-        await asyncio.sleep(5)  # Allow time for JavaScript to render
-        screenshot = driver.get_screenshot_as_base64()
+        async with render_pool.driver() as driver:
+            await get_host_scheduler().acquire(url)
+            await driver.get(url)
+            await asyncio.sleep(5)  # Allow time for JavaScript to render
+            screenshot = await driver.screenshot_base64()
         coaches_data = await extract_coaches_data(screenshot, url, school_name)
         return coaches_data, len(coaches_data) > 0 if coaches_data else False
     except Exception as e:
         logging.error(f"Error in GenAI-based scraping for {school_name}: {str(e)}")
         return None, False
-    finally:
-        driver_pool.return_driver(driver)
 
 async def extract_coaches_data(screenshot_base64, url, school_name):
-    model = genai.GenerativeModel('gemini-1.5-flash')
-    
     prompt = f"""
     Analyze the screenshot of the staff directory page for {school_name} from {url}.
     Focus only on softball coaches. Extract the following information for each coach:
@@ -374,13 +207,17 @@ async def extract_coaches_data(screenshot_base64, url, school_name):
         "data": base64.b64decode(screenshot_base64)
     }
     
-    response = await model.generate_content_async([prompt, image_part])
-    try:
-        coaches_data = json.loads(response.text)
-        return coaches_data.get('coaches', [])
-    except json.JSONDecodeError:
-        logging.error(f"Failed to parse JSON from Gemini response for {school_name}")
+    response = await model_client.generate('gemini-1.5-flash', [prompt, image_part],
+                                           generation_config=json_config(COACH_LIST_SCHEMA), stream=True,
+                                           records_key='coaches')
+    reply = response.parsed
+    if not reply.usable:
+        logging.error(f"No usable JSON in Gemini response for {school_name}")
+        return []
+    data, problems = check(COACH_LIST_SCHEMA, reply.data, school_name)
+    if problems:
         return []
+    return data.get('coaches', [])
 
 async def process_school(school_data):
     url = school_data['Staff Directory']
@@ -419,11 +256,8 @@ async def process_school(school_data):
 async def process_sheet(sheet_name, df):
     logging.info(f"\nProcessing sheet: {sheet_name}")
     
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        loop = asyncio.get_event_loop()
-        futures = [loop.run_in_executor(executor, asyncio.run, process_school(row)) 
-                   for _, row in df.iterrows()]
-        results = await asyncio.gather(*futures)
+    # The render pool bounds how many pages are open at once
+    results = await asyncio.gather(*(process_school(row) for _, row in df.iterrows()))
 
     successful_scrapes = sum(1 for r in results if r['success'])
     failed_scrapes = len(results) - successful_scrapes
@@ -450,7 +284,11 @@ async def main():
             df = pd.read_excel(xls, sheet_name=sheet_name)
             await process_sheet(sheet_name, df)
     finally:
-        driver_pool.cleanup()
+        await render_pool.close()
+        get_staff_dispatch().log_stats()
+        get_endpoint_discovery('staff').log_stats()
+        key_scheduler.log_stats()
+        close_model_client()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -1,21 +1,30 @@
 import os
 import base64
-from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
 import time
-import google.generativeai as genai
 import json
 from urllib.parse import urlparse
 import pandas as pd
 import asyncio
 import aiohttp
 from concurrent.futures import ThreadPoolExecutor, as_completed
-import random
 import sys
 from dotenv import load_dotenv
 from playwright.async_api import TimeoutError as PlaywrightTimeoutError
-from PIL import Image 
-import io  
 import logging
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scraper_common.politeness import get_host_scheduler
+from scraper_common.browser_pool import BrowserPool
+from scraper_common.page_settle import settle_page
+from scraper_common.roi_capture import capture_regions
+from scraper_common.image_tiling import tile_screenshots
+from scraper_common.llm_cache import get_llm_cache
+from scraper_common.key_scheduler import get_key_scheduler
+from scraper_common.model_client import get_model_client, close_model_client
+from scraper_common.json_stream import parse_model_json
+from scraper_common.schemas import STAFF_SCHEMA, json_config, check
+
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -28,68 +37,45 @@ OXYLABS_PASSWORD = os.getenv('OXYLABS_PASSWORD')
 GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
 SEARCH_ENGINE_ID = os.getenv('SEARCH_ENGINE_ID')
 
-async def take_screenshot_async(url, context, max_retries=3, initial_timeout=60000):
+async def take_screenshot_async(url, browser_pool, max_retries=3, initial_timeout=60000):
     user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
     
     for attempt in range(max_retries):
         try:
-            page = await context.new_page()
-            await page.set_extra_http_headers({"User-Agent": user_agent})
-            
-            timeout = initial_timeout * (attempt + 1)  # Increase timeout for each retry
-            await page.goto(url, wait_until='domcontentloaded', timeout=timeout)
-            
-            # Scroll the page multiple times to ensure all content is loaded
-            for _ in range(10):  # Increased from 3 to 5
-                await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-                await asyncio.sleep(3)  # Increased from 2 to 3 seconds
-            
-            await page.wait_for_load_state('networkidle', timeout=timeout)
-            
-            screenshot = await page.screenshot(full_page=True, type='jpeg', quality=100)
-            await page.close()
-            return screenshot, None
+            async with browser_pool.page() as page:
+                await page.set_extra_http_headers({"User-Agent": user_agent})
+                
+                timeout = initial_timeout * (attempt + 1)  # Increase timeout for each retry
+                await get_host_scheduler().acquire(url)
+                response = await page.goto(url, wait_until='domcontentloaded', timeout=timeout)
+                if response is not None:
+                    get_host_scheduler().note_response(url, response.status, response.headers)
+                
+                # Scroll until lazy-loaded content stops arriving
+                await settle_page(page)
+                
+                # Only the softball block, not the whole athletics staff directory
+                screenshots = await capture_regions(page, keywords=['softball'])
+                return screenshots, None
         except PlaywrightTimeoutError:
             if attempt == max_retries - 1:
                 return None, "Timeout error after multiple attempts"
-            await asyncio.sleep(random.uniform(5, 10))  # Longer random delay between retries
         except Exception as e:
             return None, str(e)
-        finally:
-            if 'page' in locals():
-                await page.close()
     return None, "Max retries reached"
 
-def split_screenshot(screenshot_bytes, max_aspect_ratio=3.5):
-    image = Image.open(io.BytesIO(screenshot_bytes))
-    width, height = image.size
-    max_height = int(width * max_aspect_ratio)
-    
-    if height <= max_height:
-        return [screenshot_bytes]
-    
-    pieces = []
-    for y in range(0, height, max_height):
-        piece = image.crop((0, y, width, min(y + max_height, height)))
-        buffer = io.BytesIO()
-        piece.save(buffer, format="JPEG")
-        pieces.append(buffer.getvalue())
-    
-    return pieces
-
-def extract_coaching_data(screenshots):
-    api_key = random.choice(GEMINI_API_KEYS)
-    genai.configure(api_key=api_key)
-
-    generation_config = {
-        "temperature": 0.2,
-        "top_p": 0.95,
-        "top_k": 64,
-        "max_output_tokens": 8192,
-    }
-    model = genai.GenerativeModel(
-        model_name="gemini-1.5-flash",
-        generation_config=generation_config,
+# Bump when the prompt text changes so cached extractions for it are ignored
+STAFF_PROMPT_ID = 'coaches2.staff_screenshot'
+STAFF_MODEL = 'gemini-1.5-flash'
+STAFF_PROMPT_VERSION = 2
+
+async def extract_coaching_data(screenshots):
+    generation_config = json_config(
+        STAFF_SCHEMA,
+        temperature=0.2,
+        top_p=0.95,
+        top_k=64,
+        max_output_tokens=8192,
     )
     
     prompt = """
@@ -102,7 +88,7 @@ def extract_coaching_data(screenshots):
 
     Note: Phone number is always 10 digits. If some part is in the section heading and some part is in the row for the particular coach, piece together the information to find the full phone number.
 
-    Note2: For pages which are very lengthy, their screenshots have been split into multiple pieces to keep the aspect ratio of the image in a manageable range. However, all the images given to you will still belong to one single webpage. In such cases you'll need to integillently piece together the information in the variours pieces of the screenshot to find the coaches' info.
+    Note2: For pages which are very lengthy, their screenshots have been split into multiple pieces to keep the aspect ratio of the image in a manageable range. However, all the images given to you will still belong to one single webpage. In such cases you'll need to integillently piece together the information in the variours pieces of the screenshot to find the coaches' info. The screenshots may also be crops of just the relevant sections of the page.
 
     Determine if the scraping was successful or not. If not, provide a reason from the following options:
     - broken link (ie, 404 or page doesn't contain required data)
@@ -127,8 +113,6 @@ def extract_coaching_data(screenshots):
     }
 
     If you can find any softball coaching staff information, even if incomplete, set "success" to true and include the available data. If no softball coaches are found, set "success" to false and provide the reason "no softball coaches found".
-
-    Important: Do not surround the JSON with backticks or any other characters. The response should be a valid JSON string only.
     """
     
     image_parts = [
@@ -138,10 +122,25 @@ def extract_coaching_data(screenshots):
         }
         for screenshot in screenshots
     ]
-    response = model.generate_content([prompt] + image_parts)
-    return response.text
-
-async def process_url_async(url, school, context, staff_directory_url, softball_coaches_url, max_retries=3):
+    llm_cache = get_llm_cache()
+    cache_key = llm_cache.key(STAFF_PROMPT_ID, STAFF_PROMPT_VERSION, STAFF_MODEL, [prompt] + image_parts)
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    response = await get_model_client(GEMINI_API_KEYS).generate(STAFF_MODEL, [prompt] + image_parts,
+                                                               generation_config=generation_config)
+    data, complete = parse_model_json(response.text, 'coachingStaff')
+    if data is None or not (complete or data.get('coachingStaff')):
+        raise ValueError("No usable JSON in Gemini response")
+    data, problems = check(STAFF_SCHEMA, data)
+    if problems:
+        raise ValueError(f"Gemini response does not match the staff schema: {problems[0]}")
+    if complete:
+        llm_cache.put(cache_key, data)  # cut-off replies are used but not cached
+    return data
+
+async def process_url_async(url, school, browser_pool, staff_directory_url, softball_coaches_url, max_retries=3):
     logging.info(f"Processing: {school}")
     staff_failure_reason = None
     coaches_failure_reason = None
@@ -151,7 +150,7 @@ async def process_url_async(url, school, context, staff_directory_url, softball_
     async def try_url(url, max_retries):
         for attempt in range(max_retries):
             try:
-                screenshot_bytes, failure_reason = await take_screenshot_async(url, context)
+                screenshot_bytes, failure_reason = await take_screenshot_async(url, browser_pool)
                 if screenshot_bytes:
                     return screenshot_bytes, None
                 logging.warning(f"Attempt {attempt + 1}/{max_retries} failed for {url}. Reason: {failure_reason}")
@@ -184,10 +183,9 @@ async def process_url_async(url, school, context, staff_directory_url, softball_
 
     if screenshot:
         try:
-            screenshot_pieces = split_screenshot(screenshot)
+            screenshot_pieces = await tile_screenshots(screenshot)
             encoded_pieces = [base64.b64encode(piece).decode('utf-8') for piece in screenshot_pieces]
-            coaching_data = extract_coaching_data(encoded_pieces)
-            data = json.loads(coaching_data)
+            data = await extract_coaching_data(encoded_pieces)
             if not data["success"] or len(data["coachingStaff"]) == 0:
                 reason = data.get("reason", "No softball coaches found")
                 logging.warning(f"Failed: {school} - Reason: {reason}")
@@ -430,8 +428,8 @@ def save_coaches_data(all_coaches, sheet_name):
     except Exception as e:
         print(f"Error saving coaches data for {sheet_name}: {str(e)}")
 
-async def process_batch(batch, context):
-    tasks = [process_url_async(row['2024 Coaches URL'], row['School'], context, row['Staff Directory'], row['2024 Coaches URL']) for row in batch]
+async def process_batch(batch, browser_pool):
+    tasks = [process_url_async(row['2024 Coaches URL'], row['School'], browser_pool, row['Staff Directory'], row['2024 Coaches URL']) for row in batch]
     results = await asyncio.gather(*tasks)
     
     all_coaches = []
@@ -453,26 +451,28 @@ async def process_sheet(sheet_name, df):
     total_successful = 0
     total_failed = 0
 
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        context = await browser.new_context(
-            viewport={'width': 1920, 'height': 1080},
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-            java_script_enabled=True,
-            ignore_https_errors=True,
-            bypass_csp=True
-        )
-
-        await context.add_init_script("""
+    batch_size = 10
+    browser_pool = BrowserPool(
+        size=batch_size,
+        context_options={
+            'viewport': {'width': 1920, 'height': 1080},
+            'user_agent': "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+            'java_script_enabled': True,
+            'ignore_https_errors': True,
+            'bypass_csp': True
+        },
+        init_script="""
             Object.defineProperty(navigator, 'webdriver', {
                 get: () => undefined
             });
-        """)
+        """,
+        block_profile='vision'
+    )
 
-        batch_size = 10
+    async with browser_pool:
         for i in range(0, len(df), batch_size):
             batch = df.iloc[i:i+batch_size].to_dict('records')
-            coaches, failed_urls = await process_batch(batch, context)
+            coaches, failed_urls = await process_batch(batch, browser_pool)
             
             all_coaches.extend(coaches)
             all_failed_urls.extend(failed_urls)
@@ -487,8 +487,6 @@ async def process_sheet(sheet_name, df):
             save_coaches_data(all_coaches, f"{sheet_name}_intermediate")
             save_failed_urls(all_failed_urls, f"{sheet_name}_intermediate")
 
-        await browser.close()
-
     # Save final results for the sheet
     save_coaches_data(all_coaches, sheet_name)
     save_failed_urls(all_failed_urls, sheet_name)
@@ -514,6 +512,9 @@ async def main_async():
         print("=" * 50)
     
     print("Scraping completed!")
+    get_llm_cache().log_stats()
+    get_key_scheduler().log_stats()
+    close_model_client()
 
 if __name__ == "__main__":
     asyncio.run(main_async())
\ No newline at end of file
@@ -1,33 +1,28 @@
 import asyncio
-import queue
 import aiohttp
 import pandas as pd
 from bs4 import BeautifulSoup
 import json
 import re
-import google.generativeai as genai
-from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from concurrent.futures import ThreadPoolExecutor
 from config import GEMINI_API_KEYS, GOOGLE_API_KEY, SEARCH_ENGINE_ID
 import random
+import os
+import sys
 
-class APIKeyManager:
-    def __init__(self, api_keys):
-        self.api_keys = api_keys
-        self.current_index = 0
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scraper_common.render_pool import RenderPool
+from scraper_common.fetch_mode import get_fetch_mode_selector, render_with_render_pool
+from scraper_common.llm_cache import get_llm_cache
+from scraper_common.key_scheduler import get_key_scheduler
+from scraper_common.model_client import get_model_client, close_model_client
+from scraper_common.schemas import STAFF_SCHEMA, json_config, check
 
-    def get_next_key(self):
-        key = self.api_keys[self.current_index]
-        self.current_index = (self.current_index + 1) % len(self.api_keys)
-        return key
-
-api_key_manager = APIKeyManager(GEMINI_API_KEYS)
+key_scheduler = get_key_scheduler(GEMINI_API_KEYS)
+model_client = get_model_client(GEMINI_API_KEYS)
 
 # # Configure Gemini
 # genai.configure(api_key=random.choice(GEMINI_API_KEYS))
@@ -40,32 +35,15 @@ chrome_options.add_argument("--disable-extensions")
 chrome_options.add_argument("--disable-gpu")
 chrome_options.add_experimental_option('excludeSwitches', ['enable-logging'])
 
-class WebDriverPool:
-    def __init__(self, max_drivers=10):
-        self.max_drivers = max_drivers
-        self.drivers = queue.Queue()
-        self.count = 0
-
-    def get_driver(self):
-        if not self.drivers.empty():
-            return self.drivers.get()
-        elif self.count < self.max_drivers:
-            service = Service(ChromeDriverManager().install())
-            driver = webdriver.Chrome(service=service, options=chrome_options)
-            self.count += 1
-            return driver
-        else:
-            return self.drivers.get(block=True)
+render_pool = RenderPool(size=15, options=chrome_options)
 
-    def return_driver(self, driver):
-        self.drivers.put(driver)
+# "softball" alone is in every site's nav menu, the staff listing also names a head coach
+STAFF_MARKERS = ['softball', 'head coach']
 
-    def cleanup(self):
-        while not self.drivers.empty():
-            driver = self.drivers.get()
-            driver.quit()
-
-driver_pool = WebDriverPool(max_drivers=15)
+# Bump when the prompt text changes so cached extractions for it are ignored
+STAFF_PROMPT_ID = 'coaches3.staff_html'
+STAFF_MODEL = 'gemini-1.5-flash'
+STAFF_PROMPT_VERSION = 2
 
 async def load_excel_data(file_path):
     try:
@@ -75,16 +53,6 @@ async def load_excel_data(file_path):
         print(f"Error loading Excel file: {e}")
         return None
 
-async def scroll_page(driver):
-    last_height = driver.execute_script("return document.body.scrollHeight")
-    while True:
-        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-        await asyncio.sleep(2)
-        new_height = driver.execute_script("return document.body.scrollHeight")
-        if new_height == last_height:
-            break
-        last_height = new_height
-
 async def extract_relevant_html(soup):
     body = soup.find('body')
     if not body:
@@ -110,17 +78,15 @@ async def extract_relevant_html(soup):
     return '\n'.join(relevant_parts)
 
 async def gemini_based_scraping(url, school_name):
-    driver = driver_pool.get_driver()
     try:
-        driver.get(url)
-        await scroll_page(driver)
-        html_content = driver.page_source
-        soup = BeautifulSoup(html_content, 'html.parser')
+        # Static staff directories skip the browser; JS-built ones get rendered
+        page = await get_fetch_mode_selector().fetch(url, STAFF_MARKERS, render_with_render_pool(render_pool),
+                                                     template='staff')
+        if page.html is None:
+            raise ValueError("no HTML from static fetch or render")
+        soup = BeautifulSoup(page.html, 'html.parser')
         relevant_html = await extract_relevant_html(soup)
         
-        genai.configure(api_key=api_key_manager.get_next_key())
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        # model = genai.GenerativeModel('gemini-1.5-flash')
         prompt = f"""
         Analyze the HTML content of the coaching staff webpage for {school_name} and extract information ONLY for softball *coaches* (head coach and assistant coaches - sometimes you'll see interim coaches too. Include those). They will typically be found under a softball section, and will usually only be 3-4 in number. Do not include coaches from other sports or general staff members. Extract the following information for each softball coach:
         - Name
@@ -150,21 +116,30 @@ async def gemini_based_scraping(url, school_name):
             ]
         }}
         If you can find any softball coaching staff information, even if incomplete, set "success" to true and include the available data. If no softball coaches are found, set "success" to false and provide the reason "no softball coaches found".
-        Important: Do not surround the JSON with backticks or any other characters. The response should be a valid JSON string only.
         """
         
-        response = await model.generate_content_async([prompt, relevant_html])
-        try:
-            result = json.loads(response.text)
-            return result, result['success']
-        except json.JSONDecodeError:
-            print(f"Failed to parse JSON from Gemini response for {school_name}")
+        llm_cache = get_llm_cache()
+        cache_key = llm_cache.key(STAFF_PROMPT_ID, STAFF_PROMPT_VERSION, STAFF_MODEL, [prompt, relevant_html])
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            return cached, True
+
+        response = await model_client.generate(STAFF_MODEL, [prompt, relevant_html],
+                                               generation_config=json_config(STAFF_SCHEMA), stream=True,
+                                               records_key='coachingStaff')
+        reply = response.parsed
+        if not reply.usable:
+            print(f"No usable JSON in Gemini response for {school_name}")
             return None, False
+        result, problems = check(STAFF_SCHEMA, reply.data, school_name)
+        if problems:
+            return None, False
+        if reply.complete:
+            llm_cache.put(cache_key, result)  # cut-off replies are used but not cached
+        return result, result.get('success', False)
     except Exception as e:
         print(f"Error in Gemini-based scraping for {school_name}: {str(e)}")
         return None, False
-    finally:
-        driver_pool.return_driver(driver)
 
 async def process_school(school_data, url_column):
     url = school_data[url_column]
@@ -205,11 +180,13 @@ async def process_sheet(sheet_name, df):
     for url_column in ['Staff Directory']:
         print(f"\nProcessing {url_column} URLs for sheet: {sheet_name}")
         
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            loop = asyncio.get_event_loop()
-            futures = [loop.run_in_executor(executor, asyncio.run, process_school(row, url_column)) 
-                       for _, row in df.iterrows()]
-            results = await asyncio.gather(*futures)
+        semaphore = asyncio.Semaphore(10)
+
+        async def process_with_semaphore(row):
+            async with semaphore:
+                return await process_school(row, url_column)
+
+        results = await asyncio.gather(*(process_with_semaphore(row) for _, row in df.iterrows()))
 
         successful_scrapes = sum(1 for r in results if r['success'])
         failed_scrapes = len(results) - successful_scrapes
@@ -237,9 +214,6 @@ def save_failed_schools(results, output_file):
 async def main():
     input_file = r"C:\Users\dell3\source\repos\school-data-scraper-2\Freelancer_Data_Mining_Project.xlsx"
     
-    global api_key_manager
-    api_key_manager = APIKeyManager(GEMINI_API_KEYS)
-
     try:
         xls = await load_excel_data(input_file)
         if xls is not None:
@@ -252,7 +226,11 @@ async def main():
         else:
             print("Failed to load Excel file. Exiting.")
     finally:
-        driver_pool.cleanup()
+        await render_pool.close()
+        get_fetch_mode_selector().log_stats()
+        get_llm_cache().log_stats()
+        key_scheduler.log_stats()
+        close_model_client()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -1,73 +1,43 @@
 import asyncio
-import aiohttp
 import pandas as pd
-from bs4 import BeautifulSoup
 import json
-import google.generativeai as genai
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
-from concurrent.futures import ThreadPoolExecutor
 from config import GEMINI_API_KEYS, GOOGLE_API_KEY, SEARCH_ENGINE_ID
 import random
 import logging
 from urllib.parse import urlparse
 import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scraper_common.http_client import get_fetch_engine, close_fetch_engine
+from scraper_common.response_cache import get_response_cache
+from scraper_common.llm_cache import get_llm_cache
+from scraper_common.key_scheduler import get_key_scheduler
+from scraper_common.model_client import get_model_client, close_model_client
+from scraper_common.token_estimator import get_token_estimator
+from scraper_common.relevant_sections import extract_sections
+from scraper_common.compact_html import compact_elements
+from scraper_common.batch_extraction import BatchExtractor
+from scraper_common.schemas import STAFF_SCHEMA, json_config, check
+from scraper_common.wrapper_induction import get_wrapper_registry
+from scraper_common.endpoint_discovery import get_endpoint_discovery
+from scraper_common.staff_parser import as_staff_result
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-class APIKeyManager:
-    def __init__(self, api_keys):
-        self.api_keys = api_keys
-        self.current_index = 0
-
-    def get_next_key(self):
-        key = self.api_keys[self.current_index]
-        self.current_index = (self.current_index + 1) % len(self.api_keys)
-        return key
-
-api_key_manager = APIKeyManager(GEMINI_API_KEYS)
-
-# Configure Chrome options
-chrome_options = Options()
-chrome_options.add_argument("--headless=new")
-chrome_options.add_argument("--start-maximized")
-chrome_options.add_argument("--disable-extensions")
-chrome_options.add_argument("--disable-gpu")
-chrome_options.add_experimental_option('excludeSwitches', ['enable-logging'])
-
-class WebDriverPool:
-    def __init__(self, max_drivers=10):
-        self.max_drivers = max_drivers
-        self.drivers = asyncio.Queue()
-        self.count = 0
-        self.semaphore = asyncio.Semaphore(max_drivers)
-
-    async def get_driver(self):
-        async with self.semaphore:
-            if self.drivers.empty():
-                if self.count < self.max_drivers:
-                    service = Service(ChromeDriverManager().install())
-                    driver = webdriver.Chrome(service=service, options=chrome_options)
-                    self.count += 1
-                    return driver
-                else:
-                    return await self.drivers.get()
-            else:
-                return await self.drivers.get()
-
-    async def return_driver(self, driver):
-        await self.drivers.put(driver)
-
-    async def cleanup(self):
-        while not self.drivers.empty():
-            driver = await self.drivers.get()
-            driver.quit()
+key_scheduler = get_key_scheduler(GEMINI_API_KEYS)
+model_client = get_model_client(GEMINI_API_KEYS)
+wrappers = get_wrapper_registry('staff')
+staff_endpoints = get_endpoint_discovery('staff')
 
-driver_pool = WebDriverPool(max_drivers=10)
+# Bump when the prompt text changes so cached extractions for it are ignored
+STAFF_PROMPT_ID = 'coaches4.staff_html'
+STAFF_MODEL = 'gemini-1.5-flash'
+STAFF_PROMPT_VERSION = 3
+STAFF_KEYWORDS = ['softball']
+STAFF_COMPANIONS = ['coach']
 
 class CustomJSONEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -83,34 +53,47 @@ async def load_excel_data(file_path):
         logger.error(f"Error loading Excel file: {e}")
         return None
 
-async def extract_relevant_html(soup, multiplier=1):
-    body = soup.find('body')
-    if not body:
-        return ""
-    
-    lines = body.prettify().split('\n')
-    relevant_parts = []
-    
-    i = 0
-    while i < len(lines):
-        if 'softball' in lines[i].lower():
-            start = max(0, i - (10 * multiplier))
-            end = min(len(lines), i + (21 * multiplier))
-            part = lines[start:end]
-            
-            while True:
-                coach_index = next((idx for idx, line in enumerate(part) if 'coach' in line.lower()), -1)
-                if coach_index == -1 or end >= len(lines):
-                    break
-                end = min(len(lines), end + (15 * multiplier))
-                part = lines[start:end]
-            
-            relevant_parts.append('\n'.join(part))
-            i = end
-        else:
-            i += 1
-    
-    return '\n'.join(relevant_parts)
+def staff_prompt(school_name):
+    return f"""
+        Analyze the text content of the coaching staff webpage for {school_name} (table rows are tab-separated, email/phone/Twitter links are given as their address, number or handle) and extract information ONLY for softball *coaches* (head coach and assistant coaches - sometimes you'll see interim coaches too. Include those). They will typically be found under a softball section, and will usually only be 3-4 in number. Do not include coaches from other sports or general staff members. Extract the following information for each softball coach:
+        - Name
+        - Title
+        - Email address (if available)
+        - Phone number (If available. Sometimes it will be in the section heading (eg:Softball - Phone: 828-262-7310))
+        - Twitter/X handle (if available)
+        Note: Phone number is always 10 digits. If some part is in the section heading and some part is in the row for the particular coach, piece together the information to find the full phone number.
+        Determine if the scraping was successful or not. If not, provide a reason from the following options:
+        - broken link (ie, 404 or page doesn't contain required data)
+        - bot detection (ie, verify you're a human, captcha, that sort of stuff)
+        - incomplete data (only some of the fields are present on the screen and the rest require additional clicks)
+        - other 
+        Set "reason" to the reason for failing to scrape data, or null if successful. Use null for any field that is not available.
+        If you can find any softball coaching staff information, even if incomplete, set "success" to true and include the available data. If no softball coaches are found, set "success" to false and provide the reason "no softball coaches found".
+        Important: Ensure all names, including those with non-English characters, are preserved exactly as they appear in the page. Do not escape or modify any special characters in names or other fields.
+        """
+
+async def call_gemini(parts, schema=STAFF_SCHEMA):
+    # Batch replies are split per item by the batcher, which parses the text itself
+    reply = await model_client.generate(STAFF_MODEL, parts, generation_config=json_config(schema))
+    return reply.text, reply.input_tokens, reply.output_tokens
+
+async def extract_staff_single(school_name, relevant_html):
+    response = await model_client.generate(STAFF_MODEL, [staff_prompt(school_name), relevant_html],
+                                           generation_config=json_config(STAFF_SCHEMA), stream=True,
+                                           records_key='coachingStaff')
+    reply = response.parsed
+    input_tokens, output_tokens = response.input_tokens, response.output_tokens
+    if not reply.usable:
+        logger.error(f"No usable JSON in Gemini response for {school_name}")
+        return None, False, input_tokens, output_tokens
+    result, problems = check(STAFF_SCHEMA, reply.data, school_name)
+    if problems:
+        return None, False, input_tokens, output_tokens
+    return result, reply.complete, input_tokens, output_tokens
+
+# Trimmed staff sections are small, so several schools share one request
+staff_batcher = BatchExtractor(call_gemini, staff_prompt('the school named in each item header'),
+                               None, extract_staff_single, model=STAFF_MODEL, schema=STAFF_SCHEMA)
 
 async def gemini_based_scraping(url, school_name):
     user_agents = [
@@ -120,94 +103,55 @@ async def gemini_based_scraping(url, school_name):
     ]
     
     headers = {'User-Agent': random.choice(user_agents)}
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(url, headers=headers) as response:
-                if response.status == 200:
-                    html_content = await response.text()
-                    soup = BeautifulSoup(html_content, 'html.parser')
-                else:
-                    logger.warning(f"Failed to fetch {url}. Status code: {response.status}")
-                    return None, False, 0, 0
-        except Exception as e:
-            logger.error(f"Error fetching {url}: {str(e)}")
+    coaches, source_url = await staff_endpoints.find(url, headers=headers)
+    if coaches:
+        logger.info(f"{school_name}: {len(coaches)} coaches from {source_url}")
+        return as_staff_result(coaches), True, 0, 0
+
+    try:
+        response = await get_fetch_engine().get(url, headers=headers, cache=get_response_cache())
+        if response.status == 200:
+            html_content = response.text()
+        else:
+            logger.warning(f"Failed to fetch {url}. Status code: {response.status}")
             return None, False, 0, 0
+    except Exception as e:
+        logger.error(f"Error fetching {url}: {str(e)}")
+        return None, False, 0, 0
 
-    for attempt in range(4):  # 4 attempts: 1x, 2x, 4x, and full body
-        try:
-            if attempt < 3:
-                relevant_html = await extract_relevant_html(soup, multiplier=2**attempt)
-            else:
-                relevant_html = soup.find('body').prettify()
-
-            genai.configure(api_key=api_key_manager.get_next_key())
-            model = genai.GenerativeModel('gemini-1.5-flash')
-            
-            prompt = f"""
-            Analyze the HTML content of the coaching staff webpage for {school_name} and extract information ONLY for softball *coaches* (head coach and assistant coaches - sometimes you'll see interim coaches too. Include those). They will typically be found under a softball section, and will usually only be 3-4 in number. Do not include coaches from other sports or general staff members. Extract the following information for each softball coach:
-            - Name
-            - Title
-            - Email address (if available)
-            - Phone number (If available. Sometimes it will be in the section heading (eg:Softball - Phone: 828-262-7310))
-            - Twitter/X handle (if available)
-            Note: Phone number is always 10 digits. If some part is in the section heading and some part is in the row for the particular coach, piece together the information to find the full phone number.
-            Determine if the scraping was successful or not. If not, provide a reason from the following options:
-            - broken link (ie, 404 or page doesn't contain required data)
-            - bot detection (ie, verify you're a human, captcha, that sort of stuff)
-            - incomplete data (only some of the fields are present on the screen and the rest require additional clicks)
-            - other 
-            Format the output as a JSON string with the following structure:
-            {{
-                "success": true/false,
-                "reason": "reason for failing to scrape data" (or null if success),
-                "coachingStaff": [
-                    {{
-                        "name": "...",
-                        "title": "...",
-                        "email": null,
-                        "phone": null,
-                        "twitter": null
-                    }},
-                    ...
-                ]
-            }}
-            If you can find any softball coaching staff information, even if incomplete, set "success" to true and include the available data. If no softball coaches are found, set "success" to false and provide the reason "no softball coaches found".
-            Important: Ensure all names, including those with non-English characters, are preserved exactly as they appear in the HTML. Do not escape or modify any special characters in names or other fields.
-            The response should be a valid JSON string only, without any additional formatting or markdown syntax.
-            """
-
-            token_response = model.count_tokens(prompt + relevant_html)
-            input_tokens = token_response.total_tokens
-
-            response = await model.generate_content_async([prompt, relevant_html])
-            
-            output_tokens = model.count_tokens(response.text).total_tokens
-
-            # Clean the response text
-            cleaned_response = response.text.strip()
-            if cleaned_response.startswith('```json'):
-                cleaned_response = cleaned_response[7:]
-            if cleaned_response.endswith('```'):
-                cleaned_response = cleaned_response[:-3]
-
-            cleaned_response = cleaned_response.strip()
+    coaches = wrappers.extract(url, html_content)
+    if coaches:
+        # A rule learned from an earlier Gemini extraction on this site
+        logger.info(f"{school_name}: {len(coaches)} coaches from the learned rule")
+        return {'success': True, 'reason': None, 'coachingStaff': coaches}, True, 0, 0
 
-            try:
-                result = json.loads(cleaned_response)
-                if result['success']:
-                    return result, result['success'], input_tokens, output_tokens
-                elif attempt == 3:  # If it's the last attempt and still not successful
-                    return result, result['success'], input_tokens, output_tokens
-            except json.JSONDecodeError:
-                if attempt == 3:
-                    logger.error(f"Failed to parse JSON from Gemini response for {school_name} after all attempts")
-                    return None, False, input_tokens, output_tokens
-        except Exception as e:
-            if attempt == 3:
-                logger.error(f"Error in Gemini-based scraping for {school_name} after all attempts: {str(e)}")
-                return None, False, 0, 0
-
-    return None, False, 0, 0  # This line should never be reached, but it's here for completeness
+    excerpt = extract_sections(html_content, STAFF_KEYWORDS, STAFF_COMPANIONS, render=compact_elements)
+    relevant_html = excerpt.text
+
+    try:
+        llm_cache = get_llm_cache()
+        cache_key = llm_cache.key(STAFF_PROMPT_ID, STAFF_PROMPT_VERSION, STAFF_MODEL,
+                                  [staff_prompt(school_name), relevant_html])
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            wrappers.learn(url, html_content, cached['coachingStaff'])
+            return cached, True, 0, 0
+
+        if excerpt.matched:
+            result, complete, input_tokens, output_tokens = await staff_batcher.extract(school_name, relevant_html)
+        else:
+            # Whole-page fallbacks are too big to share a request
+            result, complete, input_tokens, output_tokens = await extract_staff_single(school_name, relevant_html)
+        if result is None:
+            return None, False, input_tokens, output_tokens
+        if complete:
+            llm_cache.put(cache_key, result)  # cut-off replies are used but not cached
+            if result['success']:
+                wrappers.learn(url, html_content, result['coachingStaff'])
+        return result, result['success'], input_tokens, output_tokens
+    except Exception as e:
+        logger.error(f"Error in Gemini-based scraping for {school_name}: {str(e)}")
+        return None, False, 0, 0
 
 async def process_school(school_data, url_column):
     url = school_data[url_column]
@@ -280,7 +224,8 @@ async def process_sheet(sheet_name, df):
     all_results = []
     total_tokens_used = 0
 
-    semaphore = asyncio.Semaphore(4)  # Limit to 4 concurrent requests
+    # Enough schools in flight to fill batches; the key scheduler paces the Gemini calls
+    semaphore = asyncio.Semaphore(16)
 
     async def process_with_semaphore(row, url_column):
         async with semaphore:
@@ -322,10 +267,8 @@ def save_failed_schools(results, output_file):
         f.write('\n'.join(failed_schools))
 
 async def main():
-    global api_key_manager
     input_file = r"C:\Users\dell3\source\repos\school-data-scraper-2\Freelancer_Data_Mining_Project.xlsx"
     
-    api_key_manager = APIKeyManager(GEMINI_API_KEYS)
     total_tokens_used = 0
     
     try:
@@ -342,11 +285,18 @@ async def main():
         else:
             logger.error("Failed to load Excel file. Exiting.")
     finally:
-        await driver_pool.cleanup()
+        get_response_cache().log_stats()
+        get_llm_cache().log_stats()
+        key_scheduler.log_stats()
+        get_token_estimator().log_stats()
+        staff_batcher.log_stats()
+        wrappers.log_stats()
+        staff_endpoints.log_stats()
+        close_model_client()
+        close_fetch_engine()
 
 if __name__ == "__main__":
     asyncio.run(main())
 
 # TODO: Implement timing - ie how long does it take to scrape a sheet
-# TODO: modify extract_relevant_html to further reduce token usage https://claude.ai/chat/f1e942f4-c1bd-414a-ae1b-fe7f2273ec1f
 # TODO: create more api keys
\ No newline at end of file
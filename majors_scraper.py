@@ -5,20 +5,28 @@ import requests
 from bs4 import BeautifulSoup
 import logging
 import asyncio
-import aiohttp
 from concurrent.futures import ProcessPoolExecutor, as_completed
 import time
 import random
 import base64
-from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
-import google.generativeai as genai
-import json
-import re
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
 from pymongo import MongoClient
 from datetime import datetime
 import shutil
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from scraper_common.http_client import close_fetch_engine
+from scraper_common.response_cache import get_response_cache
+from scraper_common.politeness import get_host_scheduler
+from scraper_common.browser_pool import BrowserPool
+from scraper_common.roi_capture import capture_regions
+from scraper_common.llm_cache import get_llm_cache
+from scraper_common.key_scheduler import get_key_scheduler
+from scraper_common.model_client import get_model_client, close_model_client
+from scraper_common.json_stream import parse_model_json
+from scraper_common.schemas import MAJORS_SCHEMA, json_config, check
+from scraper_common.fetch_mode import get_fetch_mode_selector, render_with_browser_pool
+from scraper_common.cms_fingerprint import ExtractorDispatch
 
 # MongoDB setup
 MONGO_URI = "mongodb://localhost:27017"
@@ -61,101 +69,136 @@ USER_AGENTS = [
     "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
 ]
 
+# What to screenshot on a majors page (see roi_capture.py)
+MAJORS_KEYWORDS = ['majors', 'programs of study', 'degree programs', 'areas of study']
+MAJORS_SELECTORS = ['#MajorsOffered']
+
+# Bump when the prompt text changes so cached extractions for it are ignored
+MAJORS_PROMPT_ID = 'majors.majors_screenshot'
+MAJORS_PROMPT_VERSION = 1
+MAJORS_MODEL = 'gemini-1.5-flash'
+
 def google_search(query, api_key, cse_id, **kwargs):
     service = build("customsearch", "v1", developerKey=api_key)
     res = service.cse().list(q=query, cx=cse_id, **kwargs).execute()
     return res['items']
 
-def extract_majors(html_content):
-    soup = BeautifulSoup(html_content, 'html.parser')
-    majors = []
-
+def majors_from_padded_div(soup):
     # Type 1: div with style="padding:15px;"
     majors_div = soup.find('div', style="padding:15px;")
     if majors_div:
-        majors = [h3.text.strip() for h3 in majors_div.find_all('h3')]
+        return [h3.text.strip() for h3 in majors_div.find_all('h3')]
+    return []
 
+def majors_from_majortable(soup):
     # Type 2: table with id='majortable'
-    if not majors:
-        majors_table = soup.find('table', id='majortable')
-        if majors_table:
-            for row in majors_table.find_all('tr')[1:]:  # Skip header row
-                cells = row.find_all('td')
-                if cells:
-                    majors.append(cells[0].text.strip())
-
+    majors = []
+    majors_table = soup.find('table', id='majortable')
+    if majors_table:
+        for row in majors_table.find_all('tr')[1:]:  # Skip header row
+            cells = row.find_all('td')
+            if cells:
+                majors.append(cells[0].text.strip())
+    return majors
+
+def majors_from_parent_lines(soup):
     # Type 3: span elements with class="parent-line"
-    if not majors:
-        parent_lines = soup.find_all('span', class_="parent-line")
-        for line in parent_lines:
-            major = line.find('p')
-            if major:
-                majors.append(major.text.strip())
+    majors = []
+    for line in soup.find_all('span', class_="parent-line"):
+        major = line.find('p')
+        if major:
+            majors.append(major.text.strip())
+    return majors
 
+def majors_from_lists(soup):
     # Type 4: Look for lists (ul, ol) containing potential majors
-    if not majors:
-        for list_elem in soup.find_all(['ul', 'ol']):
-            items = list_elem.find_all('li')
-            if len(items) > 5:  # Assuming a list of majors would have more than 5 items
-                majors.extend([item.text.strip() for item in items])
+    majors = []
+    for list_elem in soup.find_all(['ul', 'ol']):
+        items = list_elem.find_all('li')
+        if len(items) > 5:  # Assuming a list of majors would have more than 5 items
+            majors.extend([item.text.strip() for item in items])
+    return majors
 
+def majors_from_headed_lists(soup):
     # Type 5: Look for header elements (h1, h2, h3) containing "major" or "program"
-    if not majors:
-        headers = soup.find_all(['h1', 'h2', 'h3', 'h4'])
-        for header in headers:
-            if 'major' in header.text.lower() or 'program' in header.text.lower():
-                next_elem = header.find_next_sibling()
-                if next_elem and next_elem.name in ['ul', 'ol']:
-                    majors.extend([item.text.strip() for item in next_elem.find_all('li')])
-
+    majors = []
+    for header in soup.find_all(['h1', 'h2', 'h3', 'h4']):
+        if 'major' in header.text.lower() or 'program' in header.text.lower():
+            next_elem = header.find_next_sibling()
+            if next_elem and next_elem.name in ['ul', 'ol']:
+                majors.extend([item.text.strip() for item in next_elem.find_all('li')])
+    return majors
+
+def majors_from_content_div(soup):
     # If still no majors found, try to find any p tags within the main content
-    if not majors:
-        content_div = soup.find('div', id='MajorsOffered')
-        if content_div:
-            majors = [p.text.strip() for p in content_div.find_all('p') if p.text.strip()]
-
-    return list(set(majors))  # Remove duplicates
-
-async def take_screenshot_async(url, context, max_retries=5):
+    content_div = soup.find('div', id='MajorsOffered')
+    if content_div:
+        return [p.text.strip() for p in content_div.find_all('p') if p.text.strip()]
+    return []
+
+MAJORS_PATTERNS = (
+    majors_from_padded_div,
+    majors_from_majortable,
+    majors_from_parent_lines,
+    majors_from_lists,
+    majors_from_headed_lists,
+    majors_from_content_div,
+)
+
+# Page templates of the majors sites we know, told apart by a literal marker (see cms_fingerprint.py)
+MAJORS_TEMPLATES = (
+    (None, 'padded-div', ('style="padding:15px;"',)),
+    (None, 'majortable', ('id="majortable"',)),
+    (None, 'parent-line', ('class="parent-line"',)),
+)
+
+def extract_majors(html_content, patterns=MAJORS_PATTERNS):
+    soup = BeautifulSoup(html_content, 'html.parser')
+    for pattern in patterns:
+        majors = pattern(soup)
+        if majors:
+            return list(set(majors))  # Remove duplicates
+    return []
+
+majors_dispatch = ExtractorDispatch('majors', {
+    'padded-div': lambda html: extract_majors(html, (majors_from_padded_div,)),
+    'majortable': lambda html: extract_majors(html, (majors_from_majortable,)),
+    'parent-line': lambda html: extract_majors(html, (majors_from_parent_lines,)),
+}, default=extract_majors, markers=MAJORS_TEMPLATES)
+
+async def take_screenshot_async(url, browser_pool, max_retries=5):
     user_agent = random.choice(USER_AGENTS)
     
     for attempt in range(max_retries):
         try:
-            page = await context.new_page()
-            await page.set_extra_http_headers({"User-Agent": user_agent})
-            await page.goto(url, wait_until='networkidle', timeout=60000)
-            await asyncio.sleep(random.uniform(3, 8))
-            screenshot = await page.screenshot(full_page=True, type='jpeg', quality=100)
-            await page.close()
-            return screenshot, None
+            async with browser_pool.page() as page:
+                await page.set_extra_http_headers({"User-Agent": user_agent})
+                await get_host_scheduler().acquire(url)
+                response = await page.goto(url, wait_until='networkidle', timeout=60000)
+                if response is not None:
+                    get_host_scheduler().note_response(url, response.status, response.headers)
+                screenshots = await capture_regions(page, keywords=MAJORS_KEYWORDS, selectors=MAJORS_SELECTORS)
+                return screenshots, None
         except PlaywrightTimeoutError:
             if attempt == max_retries - 1:
                 return None, "Timeout error after multiple attempts"
-            await asyncio.sleep(random.uniform(5, 10))
         except Exception as e:
             return None, str(e)
-        finally:
-            if 'page' in locals():
-                await page.close()
     return None, "Max retries reached"
 
-async def extract_majors_visual(screenshot, max_retries=3):
+async def extract_majors_visual(screenshots, max_retries=3):
     for attempt in range(max_retries):
         try:
-            api_key = random.choice(GEMINI_API_KEYS)
-            genai.configure(api_key=api_key)
-
-            model = genai.GenerativeModel('gemini-1.5-flash')
-            
             image_parts = [
                 {
                     "mime_type": "image/jpeg",
                     "data": base64.b64encode(screenshot).decode('utf-8')
                 }
+                for screenshot in screenshots
             ]
             
             prompt = """
-            Analyze the screenshot of a college majors webpage and extract the following information:
+            Analyze the screenshot(s) of a college majors webpage and extract the following information:
             - List of all undergraduate majors or programs offered
             
             Be thorough in your search. Look for any text that might represent a major or program of study.
@@ -175,18 +218,27 @@ async def extract_majors_visual(screenshot, max_retries=3):
             If you can't find any majors, set success to false and provide a reason.
             """
             
-            response = model.generate_content([prompt, image_parts[0]])
+            llm_cache = get_llm_cache()
+            cache_key = llm_cache.key(MAJORS_PROMPT_ID, MAJORS_PROMPT_VERSION, MAJORS_MODEL, [prompt] + image_parts)
+            cached = llm_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+            response = await get_model_client(GEMINI_API_KEYS).generate(
+                MAJORS_MODEL, [prompt] + image_parts, generation_config=json_config(MAJORS_SCHEMA))
             
             if not response.text:
                 raise ValueError("Empty response from Gemini API")
 
-            # Clean up the response text
-            response_text = response.text.strip()
-            # Remove any markdown code block indicators
-            response_text = re.sub(r'```json\s*|\s*```', '', response_text)
-            
-            # Parse the JSON
-            data = json.loads(response_text)
+            # Tolerates code fences, trailing commas and a reply cut off mid-list
+            data, complete = parse_model_json(response.text, 'majors')
+            if data is None or not (complete or data.get('majors')):
+                raise ValueError("No usable JSON in Gemini response")
+            data, problems = check(MAJORS_SCHEMA, data)
+            if problems:
+                raise ValueError(f"Gemini response does not match the majors schema: {problems[0]}")
+            if complete:
+                llm_cache.put(cache_key, data)
             
             return data
         except Exception as e:
@@ -199,8 +251,8 @@ async def extract_majors_visual(screenshot, max_retries=3):
                 }
             await asyncio.sleep(random.uniform(1, 3))
 
-async def visual_scrape_fallback(url, school, context):
-    screenshot, error = await take_screenshot_async(url, context)
+async def visual_scrape_fallback(url, school, browser_pool):
+    screenshot, error = await take_screenshot_async(url, browser_pool)
     if error or not screenshot:
         # Perform Google search
         search_query = f"{school} undergraduate majors programs"
@@ -208,25 +260,23 @@ async def visual_scrape_fallback(url, school, context):
             search_results = google_search(search_query, GOOGLE_API_KEY, SEARCH_ENGINE_ID, num=10)
             for result in search_results:
                 search_url = result['link']
-                search_screenshot, search_error = await take_screenshot_async(search_url, context)
+                search_screenshot, search_error = await take_screenshot_async(search_url, browser_pool)
                 if not search_error and search_screenshot:
                     majors_data = await extract_majors_visual(search_screenshot)
                     if majors_data["success"] and majors_data["majors"]:
                         return url, school, majors_data["majors"], None, None, search_url
                 else:
-                    # Use Playwright as a backup
+                    # One more plain attempt on a fresh pooled page as a backup
                     try:
-                        async with async_playwright() as p:
-                            browser = await p.chromium.launch()
-                            page = await browser.new_page()
+                        async with browser_pool.page() as page:
+                            await get_host_scheduler().acquire(search_url)
                             await page.goto(search_url, wait_until="networkidle", timeout=60000)
-                            search_screenshot = await page.screenshot(full_page=True, type='jpeg', quality=100)
-                            await browser.close()
-                            
-                            if search_screenshot:
-                                majors_data = await extract_majors_visual(search_screenshot)
-                                if majors_data["success"] and majors_data["majors"]:
-                                    return url, school, majors_data["majors"], None, None, search_url
+                            search_screenshot = await capture_regions(page, keywords=MAJORS_KEYWORDS, selectors=MAJORS_SELECTORS)
+                        
+                        if search_screenshot:
+                            majors_data = await extract_majors_visual(search_screenshot)
+                            if majors_data["success"] and majors_data["majors"]:
+                                return url, school, majors_data["majors"], None, None, search_url
                     except Exception as playwright_error:
                         logger.warning(f"Playwright backup failed for {search_url}: {str(playwright_error)}")
             
@@ -241,7 +291,7 @@ async def visual_scrape_fallback(url, school, context):
     else:
         return url, school, None, f"Visual scraping failed: {majors_data['reason']}", screenshot, None
         
-async def fetch_url(session, url, school, context, max_retries=5, base_timeout=10):
+async def fetch_url(url, school, browser_pool, max_retries=5, base_timeout=10):
     headers = {
         "User-Agent": random.choice(USER_AGENTS),
         "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
@@ -252,53 +302,37 @@ async def fetch_url(session, url, school, context, max_retries=5, base_timeout=1
         "Upgrade-Insecure-Requests": "1",
     }
     
-    for attempt in range(max_retries):
-        try:
-            timeout = base_timeout * (2 ** attempt)
-            async with session.get(url, headers=headers, timeout=timeout) as response:
-                if response.status == 200:
-                    content = await response.text()
-                    majors = extract_majors(content)
-                    if majors:
-                        return url, school, majors, None, None, url
-                    else:
-                        # If no majors found, try visual scraping
-                        return await visual_scrape_fallback(url, school, context)
-                else:
-                    # For any non-200 status, try visual scraping
-                    return await visual_scrape_fallback(url, school, context)
-        except asyncio.TimeoutError:
-            if attempt == max_retries - 1:
-                return await visual_scrape_fallback(url, school, context)
-        except Exception as e:
-            if attempt == max_retries - 1:
-                return await visual_scrape_fallback(url, school, context)
-        
-        await asyncio.sleep(random.uniform(1, 3))
-
-    return await visual_scrape_fallback(url, school, context)
-
-async def process_chunk(chunk, context):
-    async with aiohttp.ClientSession() as session:
-        tasks = []
-        for _, row in chunk.iterrows():
-            url = row['Undergraduate Majors URL']
-            school = row['School']
-            if pd.notna(url):
-                tasks.append(fetch_url(session, url, school, context))
-        return await asyncio.gather(*tasks)
-
-async def process_chunk_wrapper(chunk):
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        context = await browser.new_context(viewport={'width': 1920, 'height': 1080})
-        results = await process_chunk(chunk, context)
-        await browser.close()
-        return results
-
-def save_screenshot(screenshot, school, url):
-    if screenshot:
-        filename = f"failed_screenshots/{school.replace(' ', '_')}_{url.split('//')[-1].replace('/', '_')}.jpg"
+    # Static HTML first; only render sites whose majors list needs JavaScript
+    # Extraction doubles as the content check; keep the last result so the page isn't parsed twice
+    found = {}
+
+    def find_majors(html):
+        found['majors'], found['fingerprint'] = majors_dispatch.extract(url, html)
+        return found['majors']
+
+    page = await get_fetch_mode_selector().fetch(
+        url, find_majors, render_with_browser_pool(browser_pool), template='majors',
+        headers=headers, timeout=base_timeout, retries=max_retries,
+    )
+    if page.ok:
+        logger.info(f"{school}: {len(found['majors'])} majors from the {page.mode} HTML ({found['fingerprint']})")
+        return url, school, found['majors'], None, None, url
+
+    # Neither the static nor the rendered HTML had a majors list, try visual scraping
+    return await visual_scrape_fallback(url, school, browser_pool)
+
+async def process_chunk(chunk, browser_pool):
+    tasks = []
+    for _, row in chunk.iterrows():
+        url = row['Undergraduate Majors URL']
+        school = row['School']
+        if pd.notna(url):
+            tasks.append(fetch_url(url, school, browser_pool))
+    return await asyncio.gather(*tasks)
+
+def save_screenshot(screenshots, school, url):
+    for i, screenshot in enumerate(screenshots or []):
+        filename = f"failed_screenshots/{school.replace(' ', '_')}_{url.split('//')[-1].replace('/', '_')}_{i}.jpg"
         os.makedirs(os.path.dirname(filename), exist_ok=True)
         with open(filename, "wb") as f:
             f.write(screenshot)
@@ -409,65 +443,77 @@ async def main():
     input_file = r"C:\Users\dell3\source\repos\school-data-scraper-2\Freelancer_Data_Mining_Project.xlsx"   
     xls = pd.ExcelFile(input_file)
     
-    for sheet_name in xls.sheet_names:
-        all_majors = {}
-        failed_urls = []
-        search_used = {}
-        google_search_results = {}  # New dictionary to store Google search results
+    # One warm browser for the whole run; chunks borrow pages from it
+    # Screenshots need images but not video, fonts-as-media or ad/analytics scripts
+    browser_pool = BrowserPool(size=10, block_profile='vision')
+    await browser_pool.start()
+    try:
+        for sheet_name in xls.sheet_names:
+            all_majors = {}
+            failed_urls = []
+            search_used = {}
+            google_search_results = {}  # New dictionary to store Google search results
         
-        logger.info(f"\n{'=' * 50}")
-        logger.info(f"Processing sheet: {sheet_name}")
-        logger.info(f"{'=' * 50}\n")
+            logger.info(f"\n{'=' * 50}")
+            logger.info(f"Processing sheet: {sheet_name}")
+            logger.info(f"{'=' * 50}\n")
         
-        df = pd.read_excel(input_file, sheet_name=sheet_name)
+            df = pd.read_excel(input_file, sheet_name=sheet_name)
         
-        chunk_size = 10
-        chunks = [df[i:i+chunk_size] for i in range(0, df.shape[0], chunk_size)]
+            chunk_size = 10
+            chunks = [df[i:i+chunk_size] for i in range(0, df.shape[0], chunk_size)]
         
-        for chunk_index, chunk in enumerate(chunks):
-            logger.info(f"Processing chunk {chunk_index + 1}/{len(chunks)}")
-            retry_count = 0
-            max_retries = 3
+            for chunk_index, chunk in enumerate(chunks):
+                logger.info(f"Processing chunk {chunk_index + 1}/{len(chunks)}")
+                retry_count = 0
+                max_retries = 3
             
-            while retry_count < max_retries:
-                try:
-                    results = await process_chunk_wrapper(chunk)
-                    for url, school, majors, error, screenshot, scraped_url in results:
-                        if majors:
-                            all_majors[school] = (url, majors, scraped_url)
-                            logger.info(f"Processed: {school} - Found {len(majors)} majors")
-                            search_used[school] = url != scraped_url
-                        else:
-                            failed_urls.append((school, url, error))
-                            logger.warning(f"Failed: {school} - {url} - {error}")
-                            save_screenshot(screenshot, school, url)
-                            search_used[school] = True
+                while retry_count < max_retries:
+                    try:
+                        results = await process_chunk(chunk, browser_pool)
+                        for url, school, majors, error, screenshot, scraped_url in results:
+                            if majors:
+                                all_majors[school] = (url, majors, scraped_url)
+                                logger.info(f"Processed: {school} - Found {len(majors)} majors")
+                                search_used[school] = url != scraped_url
+                            else:
+                                failed_urls.append((school, url, error))
+                                logger.warning(f"Failed: {school} - {url} - {error}")
+                                save_screenshot(screenshot, school, url)
+                                search_used[school] = True
                             
-                            # Log Google search results for failed URLs
-                            if scraped_url and scraped_url != url:
-                                google_search_results[school] = scraped_url
+                                # Log Google search results for failed URLs
+                                if scraped_url and scraped_url != url:
+                                    google_search_results[school] = scraped_url
                     
-                    # If successful, break the retry loop
-                    break
-                except Exception as e:
-                    logger.error(f"Error processing chunk {chunk_index + 1}: {str(e)}")
-                    retry_count += 1
-                    if retry_count < max_retries:
-                        logger.info(f"Retrying chunk {chunk_index + 1} (Attempt {retry_count + 1})")
-                        await asyncio.sleep(random.uniform(5, 10))
-                    else:
-                        logger.error(f"Failed to process chunk {chunk_index + 1} after {max_retries} attempts")
-            
-            # Add a delay between chunks to avoid overwhelming the server
-            await asyncio.sleep(random.uniform(2, 5))
+                        # If successful, break the retry loop
+                        break
+                    except Exception as e:
+                        logger.error(f"Error processing chunk {chunk_index + 1}: {str(e)}")
+                        retry_count += 1
+                        if retry_count < max_retries:
+                            logger.info(f"Retrying chunk {chunk_index + 1} (Attempt {retry_count + 1})")
+                            await asyncio.sleep(random.uniform(5, 10))
+                        else:
+                            logger.error(f"Failed to process chunk {chunk_index + 1} after {max_retries} attempts")
         
-        save_results(all_majors, failed_urls, sheet_name, sheet_name, search_used, google_search_results)
+            save_results(all_majors, failed_urls, sheet_name, sheet_name, search_used, google_search_results)
         
-        logger.info(f"\nFinished processing sheet: {sheet_name}")
-        logger.info(f"Total schools processed: {len(all_majors) + len(failed_urls)}")
-        logger.info(f"Successful scrapes: {len(all_majors)}")
-        logger.info(f"Failed scrapes: {len(failed_urls)}")
-        logger.info(f"{'=' * 50}\n")
+            logger.info(f"\nFinished processing sheet: {sheet_name}")
+            logger.info(f"Total schools processed: {len(all_majors) + len(failed_urls)}")
+            logger.info(f"Successful scrapes: {len(all_majors)}")
+            logger.info(f"Failed scrapes: {len(failed_urls)}")
+            logger.info(f"{'=' * 50}\n")
+    finally:
+        await browser_pool.close()
+
+    get_response_cache().log_stats()
+    get_fetch_mode_selector().log_stats()
+    majors_dispatch.log_stats()
+    get_llm_cache().log_stats()
+    get_key_scheduler().log_stats()
+    close_model_client()
+    close_fetch_engine()
 
 if __name__ == "__main__":
     start_time = time.time()
@@ -3,23 +3,27 @@
 
 import asyncio
 import base64
-import requests
-import aiohttp
-from bs4 import BeautifulSoup
+import os
+import sys
 import pandas as pd
 from datetime import datetime
-import google.generativeai as genai
-import json
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
 from webdriver_manager.chrome import ChromeDriverManager
-from concurrent.futures import ThreadPoolExecutor
-from utils import get_random_api_key
-from config import GOOGLE_API_KEY, SEARCH_ENGINE_ID
-import re
+from config import GEMINI_API_KEYS, GOOGLE_API_KEY, SEARCH_ENGINE_ID
 import logging
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scraper_common.http_client import get_fetch_engine
+from scraper_common.response_cache import get_response_cache
+from scraper_common.politeness import get_host_scheduler
+from scraper_common.page_settle import settle_driver
+from scraper_common.llm_cache import get_llm_cache
+from scraper_common.model_client import get_model_client
+from scraper_common.roster_parser import extract_roster
+from scraper_common.schemas import ROSTER_SCHEMA, json_config, check
+
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
@@ -32,120 +36,35 @@ def html_based_scraping(url, college_name):
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
         
-        response = requests.get(url, timeout=30, headers=headers)
-        response.raise_for_status()  # Raise an exception for bad status codes
+        response = get_fetch_engine().get_sync(url, timeout=30, headers=headers, cache=get_response_cache())
         
-        logger.debug(f"Response status code: {response.status_code}")
+        logger.debug(f"Response status code: {response.status}")
         logger.debug(f"Response content type: {response.headers.get('Content-Type')}")
         
-        if 'text/html' not in response.headers.get('Content-Type', ''):
-            logger.error(f"Unexpected content type for {url}")
+        if not response.ok:
+            logger.error(f"Request error for {college_name}: HTTP {response.status}")
             return None, False
         
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Try to find the roster year
-        roster_year = find_roster_year(soup)
-        logger.info(f"Roster year found: {roster_year}")
-        
-        # Try to find player elements using different possible structures
-        player_elements = find_player_elements(soup)
-        
-        if not player_elements:
-            logger.error(f"No player elements found for {college_name}")
+        if 'text/html' not in response.headers.get('Content-Type', ''):
+            logger.error(f"Unexpected content type for {url}")
             return None, False
         
-        logger.info(f"Number of players found: {len(player_elements)}")
-        
-        players = extract_player_data(player_elements, roster_year)
+        roster, fp = extract_roster(url, response.body)
+        logger.info(f"{college_name} ({fp}): {roster.summary()}, roster year {roster.roster_year}")
         
-        if players:
-            logger.info(f"Successfully extracted data for {len(players)} players")
-            return {college_name: players}, True
+        if roster.complete:
+            return {college_name: roster.players}, True
+        if roster.players:
+            logger.info(f"Roster for {college_name} is missing fields, leaving it to the screenshot pass")
         else:
             logger.error(f"No player data extracted from {url}")
-            return None, False
+        return None, False
     
-    except requests.RequestException as e:
-        logger.error(f"Request error for {college_name}: {str(e)}")
     except Exception as e:
         logger.error(f"Unexpected error scraping {college_name}: {str(e)}", exc_info=True)
     
     return None, False
 
-def find_roster_year(soup):
-    year_pattern = re.compile(r'(202[4-5]).*Roster')
-    for text in soup.stripped_strings:
-        match = year_pattern.search(text)
-        if match:
-            return int(match.group(1))
-    return datetime.now().year + 1  # Default to next year if not found
-
-def find_player_elements(soup):
-    player_elements = soup.find_all('li', class_='sidearm-roster-player')
-    if not player_elements:
-        player_elements = soup.find_all('tr', class_=lambda x: x and 'roster__player' in x)
-    if not player_elements:
-        # Try other potential selectors
-        player_elements = soup.select('.roster-players__group .table--roster tbody tr')
-    return player_elements
-
-def extract_player_data(player_elements, roster_year):
-    players = []
-    for player in player_elements:
-        player_data = {}
-        
-        # Try different methods to extract data
-        if 'sidearm-roster-player' in player.get('class', []):
-            player_data = extract_sidearm_data(player)
-        elif player.name == 'tr':
-            player_data = extract_table_data(player)
-        
-        # Calculate graduation year
-        player_data['Graduation Year'] = calculate_graduation_year(player_data.get('Year', ''), roster_year)
-        
-        if player_data.get('Name'):  # Only add player if we at least have a name
-            players.append(player_data)
-        else:
-            logger.warning(f"Skipping player due to missing name: {player_data}")
-    
-    return players
-
-def extract_sidearm_data(player):
-    return {
-        'Number': player.select_one('.sidearm-roster-player-jersey-number').text.strip() if player.select_one('.sidearm-roster-player-jersey-number') else '',
-        'Name': player.select_one('.sidearm-roster-player-name h3 a').text.strip() if player.select_one('.sidearm-roster-player-name h3 a') else '',
-        'Position': player.select_one('.sidearm-roster-player-position-long-short').text.strip() if player.select_one('.sidearm-roster-player-position-long-short') else '',
-        'Year': player.select_one('.sidearm-roster-player-academic-year').text.strip() if player.select_one('.sidearm-roster-player-academic-year') else '',
-        'Hometown': player.select_one('.sidearm-roster-player-hometown').text.strip() if player.select_one('.sidearm-roster-player-hometown') else '',
-        'High School': player.select_one('.sidearm-roster-player-highschool').text.strip() if player.select_one('.sidearm-roster-player-highschool') else '',
-    }
-
-def extract_table_data(player):
-    return {
-        'Number': player.select_one('td:nth-of-type(1)').text.strip() if player.select_one('td:nth-of-type(1)') else '',
-        'Name': player.select_one('td:nth-of-type(2) a').text.strip() if player.select_one('td:nth-of-type(2) a') else '',
-        'Position': player.select_one('td:nth-of-type(3)').text.strip() if player.select_one('td:nth-of-type(3)') else '',
-        'Year': player.select_one('td:nth-of-type(4)').text.strip() if player.select_one('td:nth-of-type(4)') else '',
-        'Hometown': player.select_one('td:nth-of-type(7)').text.strip() if player.select_one('td:nth-of-type(7)') else '',
-        'High School': player.select_one('td:nth-of-type(8)').text.strip() if player.select_one('td:nth-of-type(8)') else '',
-    }
-
-def calculate_graduation_year(year, roster_year):
-    year_map = {
-        'FR': 3, 'SO': 2, 'JR': 1, 'SR': 0, 'GR': 0,
-        'Freshman': 3, 'Sophomore': 2, 'Junior': 1, 'Senior': 0, 'Graduate': 0,
-        'Fr.': 3, 'So.': 2, 'Jr.': 1, 'Sr.': 0, 'Gr.': 0,
-        'R-FR': 4, 'R-SO': 3, 'R-JR': 2, 'R-SR': 1,
-        'Redshirt Freshman': 4, 'Redshirt Sophomore': 3, 'Redshirt Junior': 2, 'Redshirt Senior': 1,
-    }
-    
-    for key, value in year_map.items():
-        if key in year:
-            return roster_year + value
-    
-    return None  # If year couldn't be determined
-
 # def html_based_scraping(url, college_name):
 #     try:
 #         print(f"Scraping {college_name} from {url}")
@@ -251,9 +170,9 @@ async def genai_based_scraping(url, college_name, nickname):
     try:
         screenshot = await take_full_screenshot(driver, url)
         if screenshot:
-            roster_data = await extract_roster_data(screenshot, url, college_name, nickname)
-            cleaned_json = roster_data.strip().lstrip('```json').rstrip('```').strip()
-            data = json.loads(cleaned_json)
+            data = await extract_roster_data(screenshot, url, college_name, nickname)
+            if data is None:
+                raise ValueError("no usable roster JSON in the Gemini reply")
 
             if data['success']:
                 df = pd.DataFrame(data['players'])
@@ -280,21 +199,20 @@ async def fallback_search(college_name, nickname):
     }
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, params=params) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if 'items' in data:
-                        for item in data['items']:
-                            new_url = item['link']
-                            df, success = await genai_based_scraping(new_url, college_name, nickname)
-                            if success:
-                                return df, True
-                    print(f"No valid results found for {college_name}")
-                    return None, False
-                else:
-                    print(f"Google Custom Search API request failed with status code: {response.status}")
-                    return None, False
+        response = await get_fetch_engine().get(url, params=params, polite=False)
+        if response.status == 200:
+            data = response.json()
+            if 'items' in data:
+                for item in data['items']:
+                    new_url = item['link']
+                    df, success = await genai_based_scraping(new_url, college_name, nickname)
+                    if success:
+                        return df, True
+            print(f"No valid results found for {college_name}")
+            return None, False
+        else:
+            print(f"Google Custom Search API request failed with status code: {response.status}")
+            return None, False
     except Exception as e:
         print(f"Error in fallback search for {college_name}: {str(e)}")
         return None, False
@@ -303,15 +221,11 @@ async def take_full_screenshot(driver, url):
     max_retries = 3
     for attempt in range(max_retries):
         try:
+            await get_host_scheduler().acquire(url)
             driver.get(url)
-            await asyncio.sleep(5)  # Allow time for dynamic content
-            
-            # Scroll to the bottom of the page to ensure all content is loaded
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            await asyncio.sleep(2)  # Wait for any lazy-loaded content
             
-            # Scroll back to the top
-            driver.execute_script("window.scrollTo(0, 0);")
+            # Scroll until lazy-loaded content stops arriving (ends back at the top)
+            await asyncio.to_thread(settle_driver, driver)
             
             # Set window size to capture full page
             total_height = driver.execute_script("return document.body.scrollHeight")
@@ -328,18 +242,18 @@ async def take_full_screenshot(driver, url):
                 print(f"All attempts failed for {url}: {e}")
                 return None
             
-async def extract_roster_data(screenshot_base64, url, college_name, nickname):
-    genai.configure(api_key=get_random_api_key())
+# Bump when the prompt text changes so cached extractions for it are ignored
+ROSTER_PROMPT_ID = 'rosters.roster_screenshot'
+ROSTER_MODEL = 'gemini-1.5-flash'
+ROSTER_PROMPT_VERSION = 1
 
-    generation_config = {
-        "temperature": 0.2,
-        "top_p": 0.95,
-        "top_k": 64,
-        "max_output_tokens": 8192,
-    }
-    model = genai.GenerativeModel(
-        model_name="gemini-1.5-flash",
-        generation_config=generation_config,
+async def extract_roster_data(screenshot_base64, url, college_name, nickname):
+    generation_config = json_config(
+        ROSTER_SCHEMA,
+        temperature=0.2,
+        top_p=0.95,
+        top_k=64,
+        max_output_tokens=8192,
     )
     
     image_parts = [
@@ -397,11 +311,20 @@ async def extract_roster_data(screenshot_base64, url, college_name, nickname):
     If "success" is false, provide a brief explanation in the "reason" field.
     """
     
-    with ThreadPoolExecutor(max_workers=1) as executor:
-        loop = asyncio.get_running_loop()
-        response = await loop.run_in_executor(
-            executor,
-            model.generate_content,
-            [prompt, image_parts[0]]
-        )
-    return response.text
\ No newline at end of file
+    llm_cache = get_llm_cache()
+    cache_key = llm_cache.key(ROSTER_PROMPT_ID, ROSTER_PROMPT_VERSION, ROSTER_MODEL, [prompt, image_parts[0]])
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    response = await get_model_client(GEMINI_API_KEYS).generate(ROSTER_MODEL, [prompt, image_parts[0]],
+        generation_config=generation_config, stream=True, records_key='players')
+    reply = response.parsed
+    if not reply.usable:
+        return None
+    data, problems = check(ROSTER_SCHEMA, reply.data, url)
+    if problems:
+        return None
+    if reply.complete:
+        llm_cache.put(cache_key, data)  # cut-off replies are used but not cached
+    return data
\ No newline at end of file
@@ -1,37 +1,38 @@
 import asyncio
 import aiohttp
 import pandas as pd
-from bs4 import BeautifulSoup
 import json
-import google.generativeai as genai
-from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
-from concurrent.futures import ThreadPoolExecutor
 from config import GEMINI_API_KEYS, GOOGLE_API_KEY, SEARCH_ENGINE_ID
-import random
 import logging
+import os
+import sys
 from datetime import datetime
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scraper_common.render_pool import RenderPool
+from scraper_common.fetch_mode import get_fetch_mode_selector, render_with_render_pool
+from scraper_common.llm_cache import get_llm_cache
+from scraper_common.key_scheduler import get_key_scheduler
+from scraper_common.model_client import get_model_client, close_model_client
+from scraper_common.token_estimator import get_token_estimator
+from scraper_common.compact_html import compact_html
+from scraper_common.roster_parser import extract_roster, get_roster_dispatch, graduation_year
+from scraper_common.wrapper_induction import get_wrapper_registry
+from scraper_common.endpoint_discovery import get_endpoint_discovery
+from scraper_common.schemas import ROSTER_SCHEMA, json_config, check
+
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-class APIKeyManager:
-    def __init__(self, api_keys):
-        self.api_keys = api_keys
-        self.current_index = 0
-
-    def get_next_key(self):
-        key = self.api_keys[self.current_index]
-        self.current_index = (self.current_index + 1) % len(self.api_keys)
-        return key
-
-api_key_manager = APIKeyManager(GEMINI_API_KEYS)
+key_scheduler = get_key_scheduler(GEMINI_API_KEYS)
+model_client = get_model_client(GEMINI_API_KEYS)
+wrappers = get_wrapper_registry('roster')
+roster_endpoints = get_endpoint_discovery('roster')
  
 # User agent list
 user_agents = [
@@ -48,37 +49,16 @@ chrome_options.add_argument("--disable-extensions")
 chrome_options.add_argument("--disable-gpu")
 chrome_options.add_experimental_option('excludeSwitches', ['enable-logging'])
 
-class WebDriverPool:
-    def __init__(self, max_drivers=12):
-        self.max_drivers = max_drivers
-        self.drivers = asyncio.Queue()
-        self.count = 0
-        self.semaphore = asyncio.Semaphore(max_drivers)
+# We only read the DOM here, so skip images, video, fonts and trackers
+render_pool = RenderPool(size=12, options=chrome_options, user_agents=user_agents, block_profile='html')
 
-    async def get_driver(self):
-        async with self.semaphore:
-            if self.drivers.empty():
-                if self.count < self.max_drivers:
-                    service = Service(ChromeDriverManager().install())
-                    options = chrome_options
-                    options.add_argument(f"user-agent={random.choice(user_agents)}")
-                    driver = webdriver.Chrome(service=service, options=options)
-                    self.count += 1
-                    return driver
-                else:
-                    return await self.drivers.get()
-            else:
-                return await self.drivers.get()
+# A roster page that actually lists players mentions hometowns
+ROSTER_MARKERS = ['hometown']
 
-    async def return_driver(self, driver):
-        await self.drivers.put(driver)
-
-    async def cleanup(self):
-        while not self.drivers.empty():
-            driver = await self.drivers.get()
-            driver.quit()
-
-driver_pool = WebDriverPool(max_drivers=12)
+# Bump when the prompt text changes so cached extractions for it are ignored
+ROSTER_PROMPT_ID = 'rosters2.roster_html'
+ROSTER_MODEL = 'gemini-1.5-flash'
+ROSTER_PROMPT_VERSION = 3
 
 async def load_excel_data(file_path):
     try:
@@ -88,37 +68,38 @@ async def load_excel_data(file_path):
         logger.error(f"Error loading Excel file: {e}")
         return None
 
-async def scroll_page(driver):
-    last_height = driver.execute_script("return document.body.scrollHeight")
-    while True:
-        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-        await asyncio.sleep(2)  # Wait for page to load
-        new_height = driver.execute_script("return document.body.scrollHeight")
-        if new_height == last_height:
-            break
-        last_height = new_height
-
 async def gemini_based_scraping(url, school_name, nickname):
-    driver = await driver_pool.get_driver()
+    roster, source_url = await roster_endpoints.find(url)
+    if roster is not None:
+        logger.info(f"{school_name}: {roster.summary()} from {source_url}")
+        return roster.as_result(), True, 0, 0
     try:
-        driver.get(url)
-        await scroll_page(driver)
-        html_content = driver.page_source
-        soup = BeautifulSoup(html_content, 'html.parser')
+        # Most Sidearm rosters are complete in the static HTML; render only when they aren't
+        page = await get_fetch_mode_selector().fetch(url, ROSTER_MARKERS, render_with_render_pool(render_pool),
+                                                     template='roster')
+        if page.html is None:
+            raise ValueError("no HTML from static fetch or render")
+        roster, fp = extract_roster(url, page.html)
+        if roster.complete:
+            # Every player row is in the markup; no need to ask Gemini
+            logger.info(f"{school_name} ({fp}): {roster.summary()}")
+            return roster.as_result(), True, 0, 0
+        players = wrappers.extract(url, page.html)
+        if players:
+            # A rule learned from an earlier Gemini extraction on this site
+            for player in players:
+                player['graduationYear'] = graduation_year(player['year'], roster.roster_year)
+            logger.info(f"{school_name}: {len(players)} players from the learned rule for {fp}")
+            return {'success': True, 'reason': None, 'rosterYear': roster.roster_year, 'players': players}, True, 0, 0
+        page_text = compact_html(page.html).text
     except Exception as e:
         logger.error(f"Error fetching {url} with Selenium: {str(e)}")
-        await driver_pool.return_driver(driver)
         return None, False, 0, 0
-    finally:
-        await driver_pool.return_driver(driver)
 
     try:
         current_year = datetime.now().year
-        genai.configure(api_key=api_key_manager.get_next_key())
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        
         prompt = f"""
-        Analyze the HTML content of the college softball roster webpage from {url}. The expected school name is "{school_name}" and the team nickname or name should be related to "{nickname}". Focus ONLY on player information, ignoring any coach or staff data that might be present. Extract the following information for each player:
+        Analyze the text content of the college softball roster webpage from {url} (table rows are tab-separated, player cards are listed as "field: value" lines). The expected school name is "{school_name}" and the team nickname or name should be related to "{nickname}". Focus ONLY on player information, ignoring any coach or staff data that might be present. Extract the following information for each player:
         - Name
         - Position
         - Year (Fr, So, Jr, Sr, Grad, etc)
@@ -156,22 +137,32 @@ async def gemini_based_scraping(url, school_name, nickname):
         3. The roster year cannot be determined
         4. The school name or team name/nickname on the page doesn't match the expected "{school_name}" or "{nickname}"
         If "success" is false, provide a brief explanation in the "reason" field.
-        Important: Do not surround the JSON with backticks or any other characters. The response should be a valid JSON string only.
         """
 
-        token_response = model.count_tokens(prompt + str(soup))
-        input_tokens = token_response.total_tokens
-
-        response = await model.generate_content_async([prompt, str(soup)])
-        
-        output_tokens = model.count_tokens(response.text).total_tokens
-
-        try:
-            result = json.loads(response.text)
-            return result, result['success'], input_tokens, output_tokens
-        except json.JSONDecodeError:
-            logger.error(f"Failed to parse JSON from Gemini response for {school_name}")
+        llm_cache = get_llm_cache()
+        cache_key = llm_cache.key(ROSTER_PROMPT_ID, ROSTER_PROMPT_VERSION, ROSTER_MODEL, [prompt, page_text])
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            wrappers.learn(url, page.html, cached['players'])
+            return cached, True, 0, 0
+
+        response = await model_client.generate(ROSTER_MODEL, [prompt, page_text],
+                                               generation_config=json_config(ROSTER_SCHEMA), stream=True,
+                                               records_key='players')
+        reply = response.parsed
+        input_tokens, output_tokens = response.input_tokens, response.output_tokens
+
+        if not reply.usable:
+            logger.error(f"No usable JSON in Gemini response for {school_name}")
+            return None, False, input_tokens, output_tokens
+        result, problems = check(ROSTER_SCHEMA, reply.data, school_name)
+        if problems:
             return None, False, input_tokens, output_tokens
+        if reply.complete:
+            llm_cache.put(cache_key, result)  # cut-off replies are used but not cached
+            if result.get('success'):
+                wrappers.learn(url, page.html, result['players'])
+        return result, result.get('success', False), input_tokens, output_tokens
     except Exception as e:
         logger.error(f"Error in Gemini-based scraping for {school_name}: {str(e)}")
         return None, False, 0, 0
@@ -291,10 +282,8 @@ def save_failed_schools(results, output_file):
         f.write('\n'.join(failed_schools))
 
 async def main():
-    global api_key_manager
     input_file = r"C:\Users\dell3\source\repos\school-data-scraper-2\Freelancer_Data_Mining_Project.xlsx"
     
-    api_key_manager = APIKeyManager(GEMINI_API_KEYS)
     total_tokens_used = 0
     
     try:
@@ -313,7 +302,15 @@ async def main():
     except Exception as e:
         logger.error(f"An error occurred in the main function: {str(e)}")
     finally:
-        await driver_pool.cleanup()
+        await render_pool.close()
+        get_fetch_mode_selector().log_stats()
+        get_roster_dispatch().log_stats()
+        wrappers.log_stats()
+        roster_endpoints.log_stats()
+        get_llm_cache().log_stats()
+        key_scheduler.log_stats()
+        get_token_estimator().log_stats()
+        close_model_client()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -1,5 +1,6 @@
 import asyncio
-import aiohttp
+import os
+import sys
 from bs4 import BeautifulSoup
 import json
 import google.generativeai as genai
@@ -12,6 +13,9 @@ logger = logging.getLogger(__name__)
 
 from config import GEMINI_API_KEYS
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scraper_common.http_client import get_fetch_engine
+
 class APIKeyManager:
     def __init__(self, api_keys):
         self.api_keys = api_keys
@@ -38,12 +42,11 @@ async def scrape_url(url):
     ]
     
     headers = {'User-Agent': random.choice(user_agents)}
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, headers=headers) as response:
-            if response.status == 200:
-                return await response.text()
-            else:
-                return None
+    response = await get_fetch_engine().get(url, headers=headers)
+    if response.status == 200:
+        return response.text()
+    else:
+        return None
 
 async def process_with_gemini(html_content, url):
     genai.configure(api_key=api_key_manager.get_next_key())
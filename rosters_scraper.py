@@ -1,16 +1,10 @@
 import base64
 import asyncio
-import random
 from concurrent.futures import ThreadPoolExecutor, as_completed
-import requests
-import aiohttp
 from ssl import SSLError
 import sys
-from bs4 import BeautifulSoup
 import pandas as pd
 from datetime import datetime
-import google.generativeai as genai
-import json
 from urllib.parse import urlparse
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
@@ -18,6 +12,16 @@ from selenium.webdriver.chrome.service import Service
 from webdriver_manager.chrome import ChromeDriverManager
 from selenium.common.exceptions import WebDriverException
 import time
+from scraper_common.http_client import get_fetch_engine, close_fetch_engine
+from scraper_common.response_cache import get_response_cache
+from scraper_common.politeness import get_host_scheduler
+from scraper_common.page_settle import settle_driver
+from scraper_common.llm_cache import get_llm_cache
+from scraper_common.key_scheduler import get_key_scheduler
+from scraper_common.model_client import get_model_client, close_model_client
+from scraper_common.roster_parser import get_roster_dispatch
+from scraper_common.endpoint_discovery import get_endpoint_discovery
+from scraper_common.schemas import ROSTER_SCHEMA, json_config, check
 
 #------------------- API KEYS ----------------------------------------
 # Python code to load and parse the environment variables:
@@ -38,53 +42,21 @@ SEARCH_ENGINE_ID = os.getenv('SEARCH_ENGINE_ID')
 
 #--------------------------------------------------------------------------
 
-def get_random_api_key():
-    return random.choice(GEMINI_API_KEYS)
+key_scheduler = get_key_scheduler(GEMINI_API_KEYS)
+model_client = get_model_client(GEMINI_API_KEYS)
 
 async def html_based_scraping(url):
     try:
-        response = requests.get(url, timeout=10)
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Try multiple selectors to find player elements
-        player_selectors = [
-            'li.sidearm-roster-player',
-            'div.roster_player',
-            'tr.roster_row'
-        ]
-        
-        players = []
-        for selector in player_selectors:
-            players = soup.select(selector)
-            if players:
-                break
-        
-        if not players:
-            print(f"No players found using HTML selectors for {url}")
-            return None, False
-        
-        roster_data = []
-        for player in players:
-            player_data = {}
-            
-            # Try multiple selectors for each piece of information
-            name_selectors = ['.sidearm-roster-player-name', '.name', 'td:nth-of-type(2)']
-            for selector in name_selectors:
-                name_elem = player.select_one(selector)
-                if name_elem:
-                    player_data['Name'] = name_elem.text.strip()
-                    break
-            
-            # Add similar multi-selector attempts for other fields (position, number, etc.)
-            
-            if player_data:  # Only add if we found at least some data
-                roster_data.append(player_data)
-        
-        if roster_data:
-            return pd.DataFrame(roster_data), True
-        else:
-            print(f"No player data extracted from {url}")
+        # The page itself, or its print / list view when the page is rendered client-side
+        roster, source_url = await get_endpoint_discovery('roster').find(url)
+        if roster is None:
+            print(f"No complete HTML roster for {url}")
             return None, False
+        print(f"HTML roster for {url} from {source_url}: {roster.summary()}")
+        df = pd.DataFrame(roster.players)
+        df['Roster Year'] = roster.roster_year
+        df['URL'] = url
+        return df, True
     
     except Exception as e:
         print(f"HTML-based scraping failed for {url}: {str(e)}")
@@ -95,15 +67,11 @@ async def take_full_screenshot(driver, url):
     max_retries = 3
     for attempt in range(max_retries):
         try:
+            await get_host_scheduler().acquire(url)
             driver.get(url)
-            await asyncio.sleep(5)  # Allow time for dynamic content
-            
-            # Scroll to the bottom of the page to ensure all content is loaded
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            await asyncio.sleep(2)  # Wait for any lazy-loaded content
             
-            # Scroll back to the top
-            driver.execute_script("window.scrollTo(0, 0);")
+            # Scroll until lazy-loaded content stops arriving (ends back at the top)
+            await asyncio.to_thread(settle_driver, driver)
             
             # Set window size to capture full page
             total_height = driver.execute_script("return document.body.scrollHeight")
@@ -120,18 +88,18 @@ async def take_full_screenshot(driver, url):
                 print(f"All attempts failed for {url}: {e}")
                 return None
 
-async def extract_roster_data(screenshot_base64, url, school_name, nickname):
-    genai.configure(api_key=get_random_api_key())
+# Bump when the prompt text changes so cached extractions for it are ignored
+ROSTER_PROMPT_ID = 'rosters_scraper.roster_screenshot'
+ROSTER_MODEL = 'gemini-1.5-flash'
+ROSTER_PROMPT_VERSION = 1
 
-    generation_config = {
-        "temperature": 0.2,
-        "top_p": 0.95,
-        "top_k": 64,
-        "max_output_tokens": 8192,
-    }
-    model = genai.GenerativeModel(
-        model_name="gemini-1.5-flash",
-        generation_config=generation_config,
+async def extract_roster_data(screenshot_base64, url, school_name, nickname):
+    generation_config = json_config(
+        ROSTER_SCHEMA,
+        temperature=0.2,
+        top_p=0.95,
+        top_k=64,
+        max_output_tokens=8192,
     )
     
     image_parts = [
@@ -190,14 +158,23 @@ async def extract_roster_data(screenshot_base64, url, school_name, nickname):
     """
     # 4. The school name or team name/nickname on the page doesn't match the expected "{school_name}" or "{nickname}"
     
-    with ThreadPoolExecutor(max_workers=1) as executor:
-        loop = asyncio.get_running_loop()
-        response = await loop.run_in_executor(
-            executor,
-            model.generate_content,
-            [prompt, image_parts[0]]
-        )
-    return response.text
+    llm_cache = get_llm_cache()
+    cache_key = llm_cache.key(ROSTER_PROMPT_ID, ROSTER_PROMPT_VERSION, ROSTER_MODEL, [prompt, image_parts[0]])
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    response = await model_client.generate(ROSTER_MODEL, [prompt, image_parts[0]],
+        generation_config=generation_config, stream=True, records_key='players')
+    reply = response.parsed
+    if not reply.usable:
+        return None
+    data, problems = check(ROSTER_SCHEMA, reply.data, url)
+    if problems:
+        return None
+    if reply.complete:
+        llm_cache.put(cache_key, data)  # cut-off replies are used but not cached
+    return data
 
 async def search_oxylabs(query):
     url = "https://realtime.oxylabs.io/v1/queries"
@@ -218,17 +195,16 @@ async def search_oxylabs(query):
     }
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=payload, headers=headers) as response:
-                if response.status == 200:
-                    results = await response.json()
-                    # Extract organic search result URLs
-                    organic_results = results.get('results', [{}])[0].get('content', {}).get('results', {}).get('organic', [])
-                    return [result['url'] for result in organic_results if 'url' in result]
-                else:
-                    print(f"Oxylabs API request failed with status code: {response.status}")
-                    print(await response.text())
-                    return []
+        response = await get_fetch_engine().post(url, json=payload, headers=headers, polite=False)
+        if response.status == 200:
+            results = response.json()
+            # Extract organic search result URLs
+            organic_results = results.get('results', [{}])[0].get('content', {}).get('results', {}).get('organic', [])
+            return [result['url'] for result in organic_results if 'url' in result]
+        else:
+            print(f"Oxylabs API request failed with status code: {response.status}")
+            print(response.text())
+            return []
     except Exception as e:
         print(f"Error in Oxylabs API request: {str(e)}")
         return []
@@ -240,10 +216,8 @@ async def fallback_search(college_name, nickname, driver):
         for url in search_results:
             screenshot = await take_full_screenshot(driver, url)
             if screenshot:
-                roster_data = await extract_roster_data(screenshot, url, college_name, nickname)
-                cleaned_json = roster_data.strip().lstrip('```json').rstrip('```').strip()
-                data = json.loads(cleaned_json)
-                if data['success']:
+                data = await extract_roster_data(screenshot, url, college_name, nickname)
+                if data is not None and data.get('success'):
                     print(f"Fallback search successful for {college_name} using URL: {url}")
                     return data, url
         print(f"Fallback search failed for {college_name}")
@@ -286,9 +260,9 @@ async def process_roster(driver, url, college_name, nickname):
         screenshot = await take_full_screenshot(driver, url)
         if screenshot:
             print(f"Successfully captured screenshot for {college_name}")
-            roster_data = await extract_roster_data(screenshot, url, college_name, nickname)
-            cleaned_json = roster_data.strip().lstrip('```json').rstrip('```').strip()
-            data = json.loads(cleaned_json)
+            data = await extract_roster_data(screenshot, url, college_name, nickname)
+            if data is None:
+                raise ValueError("no usable roster JSON in the Gemini reply")
 
             if data['success']:
                 print(f"Successfully extracted roster data for {college_name}")
@@ -461,5 +435,13 @@ async def main():
     else:
         print("No failed URLs to report.")
 
+    get_response_cache().log_stats()
+    get_roster_dispatch().log_stats()
+    get_endpoint_discovery('roster').log_stats()
+    get_llm_cache().log_stats()
+    key_scheduler.log_stats()
+    close_model_client()
+    close_fetch_engine()
+
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,4 @@
+# scraper_common - infrastructure shared by the coaches, rosters and majors scrapers
+#
+# Scripts in the repo root can import this package directly. Scripts in the
+# sub-folders (coaches2/, rosters2/, ...) add the repo root to sys.path first.
@@ -0,0 +1,201 @@
+# batch_extraction.py - pack several schools' page excerpts into one Gemini request
+#
+# Once pages are trimmed to their relevant sections, the ~1 KB instruction
+# prompt is a large part of every request, and each request spends one of a
+# key's per-minute slots. BatchExtractor collects items submitted concurrently,
+# packs them into one request (shared instructions, each item under an
+# "### ITEM <id>" header) and splits the JSON reply back per item. Any item whose
+# result is missing or fails validation, or a batch that fails outright, falls
+# back to the caller's single-item extraction.
+#
+# Batch size follows the token budget: items are packed until their estimated
+# input reaches BATCH_TOKEN_BUDGET or their expected output reaches
+# BATCH_OUTPUT_BUDGET, and the item cap halves when a batch reply comes back
+# incomplete and creeps back up after clean batches.
+#
+# With a `schema` (see schemas.py) the batch request is constrained to an object
+# holding one schema-shaped result per item id, and item results are decoded and
+# validated against it.
+#
+# Results come with a `complete` flag like parse_model_json's: False for an item
+# repaired from a reply cut off inside it, which callers use but don't cache.
+#
+#     batcher = BatchExtractor(call, instructions, None, single, schema=STAFF_SCHEMA)
+#     result, complete, input_tokens, output_tokens = await batcher.extract(school_name, excerpt_text)
+
+import asyncio
+import logging
+
+from .config import BATCH_TOKEN_BUDGET, BATCH_OUTPUT_BUDGET, BATCH_OUTPUT_TOKENS_PER_ITEM, BATCH_MAX_ITEMS, BATCH_MAX_WAIT
+from .json_stream import parse_model_json
+from .schemas import batch_schema, check
+from .token_estimator import get_token_estimator
+
+logger = logging.getLogger(__name__)
+
+BATCH_FORMAT = """
+The input below holds {count} separate items. Each starts with a line "### ITEM <id> - <name>".
+Apply the instructions above to every item on its own, using only that item's content.
+Return a single JSON object whose keys are the item ids ({ids}) and whose values are each item's
+result in the structure described above. Include every id. Return only the JSON object.
+"""
+
+def parse_batch_reply(text):
+    """(item id -> result dict, ids of complete items) from a batch reply; ({}, set()) when it isn't JSON.
+
+    A cut-off reply keeps the items read before the cut; all but the last of
+    them closed before it.
+    """
+    data, complete = parse_model_json(text)
+    if isinstance(data, list):
+        # Some replies come back as [{"id": ..., "result": {...}}, ...]
+        data = {str(entry.get('id')): entry.get('result', entry) for entry in data if isinstance(entry, dict)}
+    if not isinstance(data, dict):
+        return {}, set()
+    items = {str(k): v for k, v in data.items()}
+    return items, set(items) if complete else set(list(items)[:-1])
+
+
+class BatchItem:
+    def __init__(self, label, text, tokens, future):
+        self.label = label
+        self.text = text
+        self.tokens = tokens
+        self.future = future
+
+
+class BatchExtractor:
+    """Batches concurrent extract() calls.
+
+    call(parts) -> (reply text, input tokens, output tokens) sends one request
+    (called as call(parts, response_schema) when `schema` is set);
+    validate(result) -> bool accepts an item's result (optional with a schema);
+    single(label, text) -> (result, complete, input tokens, output tokens) is the
+    one-item path used as fallback.
+    """
+
+    def __init__(self, call, instructions, validate, single, token_budget=BATCH_TOKEN_BUDGET,
+                 output_budget=BATCH_OUTPUT_BUDGET, output_per_item=BATCH_OUTPUT_TOKENS_PER_ITEM,
+                 max_items=BATCH_MAX_ITEMS, max_wait=BATCH_MAX_WAIT, model='gemini-1.5-flash', schema=None):
+        self.call = call
+        self.instructions = instructions
+        self.validate = validate
+        self.single = single
+        self.schema = schema
+        self.token_budget = token_budget
+        self.max_items = max(1, min(max_items, output_budget // max(1, output_per_item)))
+        self.item_cap = self.max_items
+        self.max_wait = max_wait
+        self.estimator = get_token_estimator(model)
+        self._pending = []
+        self._pending_tokens = 0
+        self._timer = None
+        self._tasks = set()
+        self.batches = 0
+        self.batched_items = 0
+        self.fallbacks = 0
+
+    async def extract(self, label, text):
+        """Result of one item, extracted together with whatever else is pending."""
+        future = asyncio.get_running_loop().create_future()
+        tokens = self.estimator.budget(text)
+        if tokens >= self.token_budget:
+            return await self.single(label, text)  # too big to share a request
+        if self._pending_tokens + tokens > self.token_budget:
+            self._flush()
+        self._pending.append(BatchItem(label, text, tokens, future))
+        self._pending_tokens += tokens
+        if len(self._pending) >= self.item_cap:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        items, self._pending, self._pending_tokens = self._pending, [], 0
+        if items:
+            task = asyncio.ensure_future(self._run(items))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, items):
+        try:
+            if len(items) == 1:
+                results = [await self.single(items[0].label, items[0].text)]  # nothing to share the prompt with
+            else:
+                results = await self._run_batch(items)
+        except Exception as e:
+            for item in items:
+                if not item.future.done():
+                    item.future.set_exception(e)
+            return
+        for item, result in zip(items, results):
+            if item.future.done():
+                continue
+            if isinstance(result, Exception):
+                item.future.set_exception(result)
+            else:
+                item.future.set_result(result)
+
+    async def _run_batch(self, items):
+        ids = [str(i + 1) for i in range(len(items))]
+        header = self.instructions + BATCH_FORMAT.format(count=len(items), ids=', '.join(ids))
+        body = '\n\n'.join(f"### ITEM {item_id} - {item.label}\n{item.text}" for item_id, item in zip(ids, items))
+        try:
+            if self.schema is not None:
+                reply, input_tokens, output_tokens = await self.call([header, body], batch_schema(self.schema, ids))
+            else:
+                reply, input_tokens, output_tokens = await self.call([header, body])
+            parsed, complete = parse_batch_reply(reply)
+        except Exception as e:
+            logger.warning(f"Batch of {len(items)} failed ({e}), extracting items one by one")
+            parsed, complete, input_tokens, output_tokens = {}, set(), 0, 0
+
+        self.batches += 1
+        total = sum(item.tokens for item in items) or 1
+        results = [None] * len(items)
+        retry = []
+        for index, (item_id, item) in enumerate(zip(ids, items)):
+            result = self._accept(parsed.get(item_id), item.label)
+            if result is not None:
+                share = item.tokens / total
+                results[index] = (result, item_id in complete, int(input_tokens * share), int(output_tokens * share))
+            else:
+                retry.append(index)
+        self.batched_items += len(items) - len(retry)
+        self._adapt(len(items), len(retry))
+
+        if retry:
+            self.fallbacks += len(retry)
+            logger.info(f"Batch of {len(items)}: {len(retry)} items missing or invalid, retrying them singly")
+            singles = await asyncio.gather(*(self.single(items[i].label, items[i].text) for i in retry),
+                                           return_exceptions=True)
+            for index, result in zip(retry, singles):
+                results[index] = result
+        return results
+
+    def _accept(self, result, label):
+        """The item's result, decoded against the schema if there is one; None when it doesn't pass."""
+        if result is None:
+            return None
+        if self.schema is not None:
+            result, problems = check(self.schema, result, label)
+            if problems:
+                return None
+        if self.validate is not None and not self.validate(result):
+            return None
+        return result
+
+    def _adapt(self, size, failed):
+        # Halve after a reply that dropped items (usually truncated output), grow back by one after clean ones
+        if failed * 4 > size:
+            self.item_cap = max(2, size // 2)
+        elif not failed and size >= self.item_cap:
+            self.item_cap = min(self.max_items, self.item_cap + 1)
+
+    def log_stats(self):
+        logger.info(f"Batch extraction: {self.batched_items} items in {self.batches} batches, "
+                    f"{self.fallbacks} fell back to single requests, item cap now {self.item_cap}")
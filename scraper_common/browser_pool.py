@@ -0,0 +1,157 @@
+# browser_pool.py - long-lived Playwright browser handing out warm pages
+#
+# One Chromium is launched per run and `size` context/page slots are created up
+# front, so browser startup is paid once instead of per chunk or per school.
+# A slot's page and context are recycled after BROWSER_MAX_NAVIGATIONS uses, when
+# the page's JS heap grows past BROWSER_MAX_HEAP_MB, or when a use raised.
+# Pass block_profile ('html' or 'vision', see resource_blocking.py) to keep ads,
+# trackers and heavy media out of every context.
+#
+#     async with BrowserPool(size=10) as pool:
+#         async with pool.page() as page:
+#             await page.goto(url)
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from playwright.async_api import async_playwright
+
+from .config import BROWSER_POOL_SIZE, BROWSER_MAX_NAVIGATIONS, BROWSER_MAX_HEAP_MB
+from .resource_blocking import block_requests, block_stats
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONTEXT_OPTIONS = {
+    'viewport': {'width': 1920, 'height': 1080},
+}
+
+HEAP_SIZE_SCRIPT = "() => (performance.memory ? performance.memory.usedJSHeapSize : 0)"
+
+
+class PageSlot:
+    def __init__(self, index):
+        self.index = index
+        self.context = None
+        self.page = None
+        self.uses = 0
+        self.broken = False
+
+
+class BrowserPool:
+    def __init__(self, size=BROWSER_POOL_SIZE, max_navigations=BROWSER_MAX_NAVIGATIONS,
+                 max_heap_mb=BROWSER_MAX_HEAP_MB, headless=True, context_options=None,
+                 init_script=None, launch_options=None, block_profile=None):
+        self.size = size
+        self.max_navigations = max_navigations
+        self.max_heap_bytes = max_heap_mb * 1024 * 1024
+        self.headless = headless
+        self.context_options = context_options or DEFAULT_CONTEXT_OPTIONS
+        self.init_script = init_script
+        self.launch_options = launch_options or {}
+        self.block_profile = block_profile
+        self._playwright = None
+        self._browser = None
+        self._slots = None
+        self._launch_lock = asyncio.Lock()
+        self.recycled = 0
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def start(self):
+        self._playwright = await async_playwright().start()
+        await self._launch()
+        slots = [PageSlot(i) for i in range(self.size)]
+        await asyncio.gather(*(self._open_slot(slot) for slot in slots))
+        self._slots = asyncio.Queue()
+        for slot in slots:
+            self._slots.put_nowait(slot)
+        logger.info(f"Browser pool ready with {self.size} warm pages")
+
+    async def _launch(self):
+        async with self._launch_lock:
+            if self._browser is None or not self._browser.is_connected():
+                self._browser = await self._playwright.chromium.launch(headless=self.headless, **self.launch_options)
+
+    async def _open_slot(self, slot):
+        if self._browser is None or not self._browser.is_connected():
+            logger.warning("Browser disconnected, relaunching")
+            await self._launch()
+        slot.context = await self._browser.new_context(**self.context_options)
+        if self.init_script:
+            await slot.context.add_init_script(self.init_script)
+        if self.block_profile:
+            await block_requests(slot.context, self.block_profile)
+        slot.page = await slot.context.new_page()
+        slot.uses = 0
+        slot.broken = False
+
+    async def _close_slot(self, slot):
+        try:
+            if slot.context is not None:
+                await slot.context.close()
+        except Exception as e:
+            logger.debug(f"Error closing browser context: {e}")
+        slot.context = None
+        slot.page = None
+
+    async def _needs_recycle(self, slot):
+        if slot.broken or slot.page is None or slot.page.is_closed():
+            return True
+        if slot.uses >= self.max_navigations:
+            return True
+        try:
+            heap = await slot.page.evaluate(HEAP_SIZE_SCRIPT)
+        except Exception:
+            return True
+        return heap > self.max_heap_bytes
+
+    async def acquire(self):
+        slot = await self._slots.get()
+        try:
+            if slot.page is None:
+                await self._open_slot(slot)
+        except Exception:
+            self._slots.put_nowait(slot)
+            raise
+        return slot
+
+    async def release(self, slot):
+        slot.uses += 1
+        try:
+            if await self._needs_recycle(slot):
+                self.recycled += 1
+                await self._close_slot(slot)
+        finally:
+            self._slots.put_nowait(slot)
+
+    @asynccontextmanager
+    async def page(self):
+        """Borrow a warm page for one navigation."""
+        slot = await self.acquire()
+        try:
+            yield slot.page
+        except BaseException:
+            slot.broken = True
+            raise
+        finally:
+            await self.release(slot)
+
+    async def close(self):
+        if self._slots is not None:
+            while not self._slots.empty():
+                await self._close_slot(self._slots.get_nowait())
+        if self._browser is not None:
+            await self._browser.close()
+            self._browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+        logger.info(f"Browser pool closed ({self.recycled} pages recycled)")
+        if self.block_profile:
+            block_stats.log_stats()
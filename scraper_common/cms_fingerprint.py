@@ -0,0 +1,178 @@
+# cms_fingerprint.py - tell which athletics CMS (and template) served a page, and extract with the matching code
+#
+# Most of the sites we scrape run on a handful of platforms: Sidearm (the
+# classic templates and the newer Nuxt-based ones), PrestoSports,
+# WMT/Learfield and Stretch Internet. The HTML extractors used to find out by
+# trying selector after selector; fingerprint() instead looks for a few literal
+# markers (generator meta, script hosts, class prefixes) with plain substring
+# searches, which takes microseconds, and ExtractorDispatch runs only the
+# extractor written for that template. Pages nobody has an extractor for get
+# the dispatcher's default (a generic sweep, or None so the caller goes
+# straight to Gemini).
+#
+# The last classification per (site, page kind) is kept in
+# .scraper_cache/cms_fingerprints.json. Pages that carry no markers of their
+# own (a bare staff table, a stripped print view) are extracted as the site's
+# last fingerprinted page was.
+#
+#     roster_dispatch = ExtractorDispatch('roster', {
+#         'sidearm/classic': parse_sidearm_cards,
+#         'prestosports': parse_table,
+#     }, default=parse_anything)
+#     result, fp = roster_dispatch.extract(url, html)
+#     if not result:
+#         ...  # send the page to Gemini
+
+import logging
+import threading
+import time
+from collections import Counter
+
+from .json_store import JsonStore
+from .politeness import registrable_domain
+
+logger = logging.getLogger(__name__)
+
+# (platform, template, markers): the first entry with any marker present wins, so more
+# specific templates come before the platform-wide catch-all. Markers are matched
+# case-sensitively, as they appear in the markup.
+CMS_MARKERS = (
+    ('sidearm', 'nextgen', ('s-person-card', 's-person-details', 's-text-title', 'c-rosterpage')),
+    ('sidearm', 'classic', ('sidearm-roster-player', 'sidearm-table', 'sidearm-staff-', 'sidearm-roster-')),
+    ('sidearm', None, ('content="SIDEARM', 'sidearmsports.com', 'sidearmstats', '/sidearm.')),
+    ('prestosports', None, ('content="PrestoSports', 'prestosports.com', 'presto-sport', 'prestosports')),
+    ('wmt', 'cards', ('roster-card-item', 'roster-staff-card')),
+    ('wmt', None, ('wmt.digital', 'wmt.games', 'wmtdigital', 'learfield', 'Learfield')),
+    ('stretch', None, ('stretchinternet.com', 'Stretch Internet', 'stretchsites')),
+)
+
+UNKNOWN = 'unknown'
+
+
+class Fingerprint:
+    __slots__ = ('platform', 'template', 'source')
+
+    def __init__(self, platform=None, template=None, source=None):
+        self.platform = platform
+        self.template = template
+        self.source = source  # 'markup', 'host' (remembered for the site) or None
+
+    @property
+    def known(self):
+        return self.platform is not None or self.template is not None
+
+    def keys(self):
+        """Extractor keys for this fingerprint, most specific first."""
+        keys = []
+        if self.platform and self.template:
+            keys.append(f"{self.platform}/{self.template}")
+        keys.extend(k for k in (self.platform, self.template) if k)
+        return keys
+
+    def __str__(self):
+        if not self.known:
+            return UNKNOWN
+        return '/'.join(k for k in (self.platform, self.template) if k)
+
+
+def fingerprint(html, markers=CMS_MARKERS):
+    """Fingerprint of a page (str or bytes) from the first marker table entry it matches."""
+    if not html:
+        return Fingerprint()
+    is_bytes = isinstance(html, (bytes, bytearray))
+    for platform, template, entry_markers in markers:
+        for marker in entry_markers:
+            if (marker.encode() if is_bytes else marker) in html:
+                return Fingerprint(platform, template, 'markup')
+    return Fingerprint()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_fingerprint_store():
+    """Return the process-wide store of per-site classifications."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = JsonStore('cms_fingerprints')
+        return _store
+
+
+class ExtractorDispatch:
+    """Runs the extractor registered for a page's fingerprint.
+
+    `extractors` maps 'platform/template', 'platform' or 'template' keys to
+    callables(html, **options) -> result; the most specific key present is used.
+    `default` handles pages without a registered extractor; leave it None to hand
+    those to the LLM path. A falsy result counts as nothing found.
+    """
+
+    def __init__(self, kind, extractors, default=None, markers=CMS_MARKERS, store=None):
+        self.kind = kind
+        self.extractors = extractors
+        self.default = default
+        self.markers = markers
+        self.store = store or get_fingerprint_store()
+        self._lock = threading.Lock()
+        self.outcomes = Counter()
+
+    def _key(self, url):
+        return f"{registrable_domain(url)}|{self.kind}"
+
+    def classify(self, url, html):
+        """Fingerprint of `html`, falling back to the site's last one; remembers new classifications."""
+        fp = fingerprint(html, self.markers)
+        key = self._key(url)
+        entry = self.store.get(key)
+        if fp.known:
+            if entry is None or (entry['platform'], entry['template']) != (fp.platform, fp.template):
+                logger.info(f"{key} fingerprinted as {fp}")
+                self.store.set(key, {'platform': fp.platform, 'template': fp.template, 'updated_at': time.time()})
+        elif entry is not None:
+            fp = Fingerprint(entry['platform'], entry['template'], 'host')
+        return fp
+
+    def extractor_for(self, fp):
+        for key in fp.keys():
+            if key in self.extractors:
+                return key, self.extractors[key]
+        return None, self.default
+
+    def _count(self, outcome):
+        with self._lock:
+            self.outcomes[outcome] += 1
+
+    def extract(self, url, html, **options):
+        """(result, fingerprint). result is None when no extractor applies or it found nothing.
+
+        `options` are passed on to the extractor.
+        """
+        fp = self.classify(url, html)
+        key, extractor = self.extractor_for(fp)
+        if extractor is None:
+            self._count('unhandled')
+            logger.debug(f"No {self.kind} extractor for {fp} ({url})")
+            return None, fp
+        result = extractor(html, **options)
+        if result:
+            self._count('template' if key else 'generic')
+            return result, fp
+        if key and self.default is not None:
+            # Misclassified, or the site changed its template
+            result = self.default(html, **options)
+            if result:
+                logger.info(f"{self.kind} extractor {key} found nothing on {url}, the generic one did")
+                self._count('generic')
+                return result, fp
+        self._count('empty')
+        logger.debug(f"{self.kind} extractor {key or 'default'} found nothing on {url} ({fp})")
+        return None, fp
+
+    def log_stats(self):
+        o = self.outcomes
+        logger.info(
+            f"{self.kind} extraction: {o['template']} by template extractors, {o['generic']} by the generic one, "
+            f"{o['empty']} found nothing, {o['unhandled']} left to the model"
+        )
@@ -0,0 +1,232 @@
+# compact_html.py - render HTML as compact text for LLM prompts
+#
+# Markup is most of the tokens in str(soup) and none of the information. This
+# keeps what the extraction prompts read and drops the rest:
+#   - table rows become tab-separated lines (a roster table is a TSV),
+#   - repeated sibling blocks with several fields (staff cards, Sidearm player
+#     cards) become "key: value" lines, keys taken from the field's class name,
+#   - links keep only mailto:/tel:/Twitter targets, images only their alt text,
+#   - everything else is whitespace-collapsed text, one line per block element.
+#
+#     compacted = compact_html(page.html)
+#     reply = await model_client.generate(model, [prompt, compacted.text], generation_config=json_config(STAFF_SCHEMA))
+
+import logging
+import re
+from collections import Counter
+from urllib.parse import unquote, urlsplit
+
+from .relevant_sections import parse_html
+from .token_estimator import get_token_estimator
+
+logger = logging.getLogger(__name__)
+
+BLOCK_TAGS = frozenset((
+    'address', 'article', 'aside', 'blockquote', 'body', 'dd', 'div', 'dl', 'dt', 'figcaption', 'figure',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'li', 'main', 'ol', 'p', 'section', 'table',
+    'tbody', 'thead', 'tfoot', 'tr', 'ul',
+))
+# Words that say where a field sits rather than what it holds
+_GENERIC_CLASS_WORDS = frozenset((
+    'sidearm', 'roster', 'player', 'players', 'staff', 'member', 'members', 'coach', 'coaches', 'person',
+    'people', 'card', 'item', 'field', 'text', 'info', 'details', 'detail', 'value', 'data', 'col',
+    'row', 'list', 'wrap', 'wrapper', 'inner', 'content', 'block', 'container', 'bio', 'profile', 'js',
+    'bold', 'strong', 'italic', 'hide', 'hidden', 'visible', 'sr', 'only', 'mobile', 'desktop', 'label',
+))
+_GENERIC_LINK_TEXT = frozenset(('', 'email', 'e-mail', 'email me', 'phone', 'call', 'twitter', 'x', 'follow'))
+MIN_CARD_SIBLINGS = 3
+MIN_CARD_FIELDS = 2
+MAX_CARD_FIELDS = 20
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_CLASS_SPLIT_RE = re.compile(r'[-_]+')
+
+
+class Compacted:
+    def __init__(self, text, before_tokens, after_tokens):
+        self.text = text
+        self.before_tokens = before_tokens
+        self.after_tokens = after_tokens
+
+    @property
+    def ratio(self):
+        return self.after_tokens / self.before_tokens if self.before_tokens else 1.0
+
+
+def _clean(text):
+    return _WHITESPACE_RE.sub(' ', text or '').strip()
+
+
+def link_target(href):
+    """Contact target of a link: the address, the phone number or the @handle; None for other links."""
+    href = (href or '').strip()
+    lowered = href.lower()
+    if lowered.startswith('mailto:'):
+        return unquote(href[7:].split('?')[0])
+    if lowered.startswith('tel:'):
+        return unquote(href[4:])
+    parts = urlsplit(href)
+    if parts.netloc.lower().removeprefix('www.') in ('twitter.com', 'x.com'):
+        handle = parts.path.strip('/').split('/')[0]
+        if handle and handle not in ('intent', 'share', 'home'):
+            return '@' + handle
+    return None
+
+
+def _class_key(el):
+    """Field name from a class like 'sidearm-roster-player-hometown' -> 'hometown'."""
+    for cls in (el.get('class') or '').split():
+        words = [w for w in _CLASS_SPLIT_RE.split(cls.lower()) if w and w not in _GENERIC_CLASS_WORDS]
+        if words and not words[-1].isdigit():
+            return words[-1]
+    return None
+
+
+def _signature(el):
+    classes = (el.get('class') or '').split()
+    return el.tag, classes[0] if classes else ''
+
+
+class _Writer:
+    def __init__(self):
+        self.lines = []
+        self.inline = []
+
+    def text(self, text):
+        text = _clean(text)
+        if text:
+            self.inline.append(text)
+
+    def newline(self):
+        if self.inline:
+            self.lines.append(' '.join(self.inline))
+            self.inline = []
+
+    def line(self, text):
+        self.newline()
+        if text:
+            self.lines.append(text)
+
+    def result(self):
+        self.newline()
+        return '\n'.join(self.lines)
+
+
+def _inline_text(el):
+    """All text of an element on one line, with link targets and alt text."""
+    writer = _Writer()
+    _walk_inline(el, writer)
+    return ' '.join(writer.inline)
+
+
+def _walk_inline(el, writer):
+    if el.tag == 'a':
+        text = _clean(el.text_content())
+        target = link_target(el.get('href'))
+        if target and (text.lower() in _GENERIC_LINK_TEXT or target.lower() in text.lower()):
+            writer.text(target)
+        elif target:
+            writer.text(f"{text} {target}")
+        else:
+            writer.text(text)
+        return
+    if el.tag == 'img':
+        writer.text(el.get('alt'))
+        return
+    writer.text(el.text)
+    for child in el:
+        if isinstance(child.tag, str):
+            _walk_inline(child, writer)
+        writer.text(child.tail)
+
+
+def _has_parts(el):
+    """True when an element holds several fields: block children or two or more classed children."""
+    if any(isinstance(d.tag, str) and d.tag in BLOCK_TAGS for d in el.iterdescendants()):
+        return True
+    return sum(1 for c in el if isinstance(c.tag, str) and _class_key(c)) >= 2
+
+
+def _card_fields(node, fields, key=None):
+    """Append (key, value) pairs for a card: one per innermost element that holds a single field."""
+    text = _clean(node.text)
+    if text:
+        fields.append((key, text))
+    for child in node:
+        if isinstance(child.tag, str):
+            child_key = _class_key(child) or key
+            if _has_parts(child):
+                _card_fields(child, fields, child_key)
+            else:
+                value = _inline_text(child)
+                if value:
+                    fields.append((child_key, value))
+        tail = _clean(child.tail)
+        if tail:
+            fields.append((key, tail))
+    return fields
+
+
+def _is_card(el, sibling_counts):
+    if el.tag in ('tr', 'td', 'th', 'table', 'tbody', 'thead') or sibling_counts[_signature(el)] < MIN_CARD_SIBLINGS:
+        return False
+    leaves = sum(1 for node in el.iter() if isinstance(node.tag, str) and node is not el and _clean(node.text))
+    return MIN_CARD_FIELDS <= leaves <= MAX_CARD_FIELDS and el.find('.//table') is None
+
+
+def _row_line(row):
+    cells = [c for c in row if isinstance(c.tag, str) and c.tag in ('td', 'th')]
+    return '\t'.join(_inline_text(c) for c in cells).strip('\t')
+
+
+def _walk(el, writer, sibling_counts=None):
+    tag = el.tag
+    if tag == 'tr':
+        writer.line(_row_line(el))
+        return
+    if tag == 'br':
+        writer.newline()
+        return
+    if tag in ('a', 'img'):
+        _walk_inline(el, writer)
+        return
+    if sibling_counts is not None and _is_card(el, sibling_counts):
+        writer.newline()
+        for key, value in _card_fields(el, []):
+            writer.line(f"{key}: {value}" if key else value)
+        writer.lines.append('')
+        return
+
+    block = tag in BLOCK_TAGS
+    if block:
+        writer.newline()
+    writer.text(el.text)
+    children = [c for c in el if isinstance(c.tag, str)]
+    counts = Counter(_signature(c) for c in children)
+    for child in el:
+        if isinstance(child.tag, str):
+            _walk(child, writer, counts)
+        writer.text(child.tail)
+    if block:
+        writer.newline()
+
+
+def compact_elements(elements):
+    """Compact text of a list of sibling elements (e.g. a group from relevant_sections.select_sections)."""
+    writer = _Writer()
+    counts = Counter(_signature(el) for el in elements)
+    for el in elements:
+        _walk(el, writer, counts)
+    text = writer.result()
+    return re.sub(r'\n{3,}', '\n\n', text).strip()
+
+
+def compact_html(html, model='gemini-1.5-flash'):
+    """Compact text of a whole page, with before/after token counts."""
+    root = parse_html(html)
+    body = root.find('body')
+    text = compact_elements([body if body is not None else root])
+    estimator = get_token_estimator(model)
+    compacted = Compacted(text, estimator.estimate(html or ''), estimator.estimate(text))
+    logger.info(f"Compacted HTML: {compacted.before_tokens} -> {compacted.after_tokens} tokens ({compacted.ratio:.0%})")
+    return compacted
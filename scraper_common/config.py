@@ -0,0 +1,103 @@
+# config.py for the shared scraping infrastructure
+
+import os
+
+# Shared HTTP client (http_client.py)
+HTTP_MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS', '100'))
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.getenv('HTTP_MAX_CONNECTIONS_PER_HOST', '6'))
+HTTP_DNS_CACHE_TTL = int(os.getenv('HTTP_DNS_CACHE_TTL', '600'))  # seconds
+HTTP_KEEPALIVE_TIMEOUT = int(os.getenv('HTTP_KEEPALIVE_TIMEOUT', '60'))  # seconds
+HTTP_TIMEOUT = int(os.getenv('HTTP_TIMEOUT', '30'))  # seconds
+
+# On-disk caches (response_cache.py and friends) live under this folder
+CACHE_DIR = os.getenv('SCRAPER_CACHE_DIR', os.path.join(os.getcwd(), '.scraper_cache'))
+# Serve cached pages without revalidating if they are younger than this (seconds, 0 = always revalidate)
+HTTP_CACHE_MAX_AGE = int(os.getenv('HTTP_CACHE_MAX_AGE', '0'))
+
+# Per-host politeness (politeness.py). Rates are requests per second per registrable domain.
+HOST_RATE = float(os.getenv('HOST_RATE', '1.0'))
+HOST_BURST = float(os.getenv('HOST_BURST', '3'))
+# Overrides, e.g. HOST_RATES="sidearmsports.com=4,prestosports.com=2"
+HOST_RATES = os.getenv('HOST_RATES', '')
+# Upper bound on how long a single Retry-After header may pause a host (seconds)
+HOST_MAX_RETRY_AFTER = float(os.getenv('HOST_MAX_RETRY_AFTER', '600'))
+
+# Playwright browser pool (browser_pool.py)
+BROWSER_POOL_SIZE = int(os.getenv('BROWSER_POOL_SIZE', '10'))
+BROWSER_MAX_NAVIGATIONS = int(os.getenv('BROWSER_MAX_NAVIGATIONS', '50'))  # recycle a page after this many uses
+BROWSER_MAX_HEAP_MB = int(os.getenv('BROWSER_MAX_HEAP_MB', '512'))  # ...or once its JS heap grows past this
+
+# Async Selenium render pool (render_pool.py), recycles drivers after BROWSER_MAX_NAVIGATIONS too
+RENDER_POOL_SIZE = int(os.getenv('RENDER_POOL_SIZE', '10'))
+
+# Lazy-load settling (page_settle.py), seconds
+SETTLE_MAX_WAIT = float(os.getenv('SETTLE_MAX_WAIT', '15'))
+SETTLE_QUIET_PERIOD = float(os.getenv('SETTLE_QUIET_PERIOD', '0.75'))
+SETTLE_POLL_INTERVAL = float(os.getenv('SETTLE_POLL_INTERVAL', '0.15'))
+
+# Resource blocking for headless renders (resource_blocking.py)
+# Extra ad/analytics hosts to block, comma separated
+BLOCK_EXTRA_DOMAINS = os.getenv('BLOCK_EXTRA_DOMAINS', '')
+
+# Region-of-interest screenshots (roi_capture.py)
+ROI_PADDING = int(os.getenv('ROI_PADDING', '24'))  # px around each region
+ROI_MERGE_GAP = int(os.getenv('ROI_MERGE_GAP', '120'))  # merge regions closer than this vertically
+ROI_MAX_REGIONS = int(os.getenv('ROI_MAX_REGIONS', '8'))
+ROI_MAX_COVERAGE = float(os.getenv('ROI_MAX_COVERAGE', '0.8'))  # take the full page if regions cover more than this
+ROI_MAX_QUALITY = int(os.getenv('ROI_MAX_QUALITY', '90'))  # JPEG quality for small regions...
+ROI_MIN_QUALITY = int(os.getenv('ROI_MIN_QUALITY', '65'))  # ...down to this for very large ones
+
+# Screenshot trimming and tiling (image_tiling.py)
+TILE_MAX_ASPECT = float(os.getenv('TILE_MAX_ASPECT', '3.5'))  # max tile height as a multiple of its width
+TILE_JPEG_QUALITY = int(os.getenv('TILE_JPEG_QUALITY', '85'))
+TILE_MIN_BLANK_BAND = int(os.getenv('TILE_MIN_BLANK_BAND', '40'))  # px; blank bands at least this tall get collapsed...
+TILE_KEEP_GAP = int(os.getenv('TILE_KEEP_GAP', '16'))  # ...down to this many px
+TILING_WORKERS = int(os.getenv('TILING_WORKERS', '0'))  # 0 = one per CPU
+
+# Gemini API key scheduling (key_scheduler.py), quotas are per key per minute
+GEMINI_KEY_RPM = int(os.getenv('GEMINI_KEY_RPM', '15'))
+GEMINI_KEY_TPM = int(os.getenv('GEMINI_KEY_TPM', '1000000'))
+GEMINI_KEY_BACKOFF = float(os.getenv('GEMINI_KEY_BACKOFF', '10'))  # first pause after a 429, doubles per repeat
+GEMINI_KEY_MAX_BACKOFF = float(os.getenv('GEMINI_KEY_MAX_BACKOFF', '300'))
+
+# Relevant-section extraction (relevant_sections.py)
+RELEVANT_TOKEN_BUDGET = int(os.getenv('RELEVANT_TOKEN_BUDGET', '8000'))  # max tokens of page excerpt per LLM call
+
+# Multi-item Gemini requests (batch_extraction.py)
+BATCH_TOKEN_BUDGET = int(os.getenv('BATCH_TOKEN_BUDGET', '24000'))  # estimated input tokens per batch
+BATCH_OUTPUT_BUDGET = int(os.getenv('BATCH_OUTPUT_BUDGET', '8000'))  # stay under the model's max output tokens
+BATCH_OUTPUT_TOKENS_PER_ITEM = int(os.getenv('BATCH_OUTPUT_TOKENS_PER_ITEM', '600'))
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '10'))
+BATCH_MAX_WAIT = float(os.getenv('BATCH_MAX_WAIT', '1.0'))  # seconds to wait for a batch to fill
+
+# Gemini REST client (model_client.py)
+# Point at a local stand-in with e.g. GEMINI_API_BASE=http://127.0.0.1:8089/v1beta
+GEMINI_API_BASE = os.getenv('GEMINI_API_BASE', 'https://generativelanguage.googleapis.com/v1beta')
+GEMINI_KEY_IN_FLIGHT = int(os.getenv('GEMINI_KEY_IN_FLIGHT', '5'))  # concurrent requests per key
+GEMINI_TIMEOUT = int(os.getenv('GEMINI_TIMEOUT', '180'))  # seconds per model call
+GEMINI_MAX_ATTEMPTS = int(os.getenv('GEMINI_MAX_ATTEMPTS', '3'))  # tries per call, moving to another key after a 429
+
+# Offline Gemini stand-in (gemini_stub_server.py)
+GEMINI_STUB_HOST = os.getenv('GEMINI_STUB_HOST', '127.0.0.1')
+GEMINI_STUB_PORT = int(os.getenv('GEMINI_STUB_PORT', '8089'))
+GEMINI_STUB_RECORDINGS = os.getenv('GEMINI_STUB_RECORDINGS', os.path.join(CACHE_DIR, 'gemini_recordings'))
+# Real API base to forward misses to (their replies get recorded); empty = synthesize replies
+GEMINI_STUB_UPSTREAM = os.getenv('GEMINI_STUB_UPSTREAM', '')
+GEMINI_STUB_LATENCY = float(os.getenv('GEMINI_STUB_LATENCY', '1.5'))  # median seconds before the first byte
+GEMINI_STUB_LATENCY_SIGMA = float(os.getenv('GEMINI_STUB_LATENCY_SIGMA', '0.5'))  # log-normal spread
+GEMINI_STUB_TOKENS_PER_SECOND = float(os.getenv('GEMINI_STUB_TOKENS_PER_SECOND', '250'))  # output speed
+GEMINI_STUB_RATE_LIMIT_RATE = float(os.getenv('GEMINI_STUB_RATE_LIMIT_RATE', '0'))  # share of calls answered 429
+GEMINI_STUB_KEY_RPM = int(os.getenv('GEMINI_STUB_KEY_RPM', '0'))  # enforce a per-key quota, 0 = off
+GEMINI_STUB_MALFORMED_RATE = float(os.getenv('GEMINI_STUB_MALFORMED_RATE', '0'))  # share of replies broken on purpose
+GEMINI_STUB_SEED = os.getenv('GEMINI_STUB_SEED', '')
+
+# HTML roster parsing (roster_parser.py)
+ROSTER_MIN_COVERAGE = float(os.getenv('ROSTER_MIN_COVERAGE', '0.8'))  # share of players that must have each core field
+
+# Learned extraction rules (wrapper_induction.py)
+WRAPPER_MIN_AGREEMENT = float(os.getenv('WRAPPER_MIN_AGREEMENT', '0.9'))  # share of the model's records a new rule must reproduce
+WRAPPER_MIN_SHAPE = float(os.getenv('WRAPPER_MIN_SHAPE', '0.8'))  # share of extracted values that must look right
+WRAPPER_MAX_FAILURES = int(os.getenv('WRAPPER_MAX_FAILURES', '2'))  # rejected pages in a row before a rule is dropped
+
+# Lightweight roster/staff endpoints (endpoint_discovery.py)
+ENDPOINT_RECHECK_DAYS = float(os.getenv('ENDPOINT_RECHECK_DAYS', '30'))  # re-probe sites where no variant worked after this long
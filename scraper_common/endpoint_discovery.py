@@ -0,0 +1,254 @@
+# endpoint_discovery.py - find the lightweight version of a roster or staff page before rendering it
+#
+# Many of the roster and staff pages we render in headless Chrome have a
+# cheaper twin on the same host: Sidearm's print and list views of a roster
+# (plain tables), a per-sport coaches page instead of the whole staff
+# directory, or the schema.org JSON-LD block in the page itself. Discovery
+# tries the static page and those variants with plain HTTP fetches (through
+# the response cache and the host scheduler), parses them with roster_parser /
+# staff_parser and stops at the first one that gives a complete result. A staff
+# directory counts only if it has a section for the sport; anything else is
+# left to Gemini rather than guessed at.
+#
+# Which variant worked is remembered per (site, page kind) in
+# .scraper_cache/endpoints.json, so later runs fetch it straight away; sites
+# where every variant was fetched and none worked are not probed again for
+# ENDPOINT_RECHECK_DAYS (a timeout, 429 or 5xx leaves the site to be retried).
+#
+#     roster, variant_url = await get_endpoint_discovery('roster').find(roster_url)
+#     if roster is not None:
+#         result = roster.as_result()  # no render, no Gemini call
+#
+#     coaches, variant_url = await get_endpoint_discovery('staff').find(staff_directory_url)
+
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlencode, urlsplit, urlunsplit, parse_qsl
+
+from .config import ENDPOINT_RECHECK_DAYS
+from .http_client import get_fetch_engine
+from .json_store import JsonStore
+from .politeness import registrable_domain
+from .response_cache import get_response_cache
+from .roster_parser import extract_roster
+from .staff_parser import SPORT, extract_staff
+
+logger = logging.getLogger(__name__)
+
+_LD_JSON_RE = re.compile(r'<script[^>]+type=["\']application/ld\+json["\'][^>]*>(.*?)</script>', re.I | re.S)
+_SPORT_RE = re.compile(rf'\b{SPORT}\b', re.I)
+
+
+def with_query(url, **params):
+    """`url` with the given query parameters added or replaced."""
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query))
+    query.update(params)
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def with_path(url, path):
+    """Another page on the same host."""
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme, parts.netloc, path, '', ''))
+
+
+# ---------------- parsers: (url, html) -> result or None ----------------
+
+def parse_roster_page(url, html):
+    roster, _ = extract_roster(url, html)
+    return roster if roster.complete else None
+
+
+def parse_staff_page(url, html):
+    """Coaches under a section for the sport; a whole-department directory without one yields nothing."""
+    coaches, _ = extract_staff(url, html)
+    return coaches or None
+
+
+def parse_sport_staff_page(url, html):
+    """Coaches from a page that is the sport's own, sections or not."""
+    coaches, _ = extract_staff(url, html, sport_page=True)
+    return coaches or None
+
+
+def _ld_nodes(data):
+    """Every dict in a JSON-LD document, @graph and nested values included."""
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, dict):
+            yield node
+            stack.extend(v for v in node.values() if isinstance(v, (dict, list)))
+
+
+def _ld_types(node):
+    types = node.get('@type') or []
+    return set(types if isinstance(types, list) else [types])
+
+
+def _ld_person(person):
+    same_as = person.get('sameAs') or []
+    same_as = same_as if isinstance(same_as, list) else [same_as]
+    return {
+        'Name': re.sub(r'\s+', ' ', str(person.get('name') or '')).strip(),
+        'Title': str(person.get('jobTitle') or '').strip(),
+        'Email': str(person.get('email') or '').replace('mailto:', '').strip(),
+        'Phone': re.sub(r'\D', '', str(person.get('telephone') or '')),
+        'Twitter': next((s for s in same_as if 'twitter.com' in str(s) or 'x.com' in str(s)), ''),
+    }
+
+
+def parse_staff_json_ld(url, html):
+    """Coaches from schema.org SportsTeam.coach entries, or Person entries whose job title names the sport."""
+    coaches = {}
+    for block in _LD_JSON_RE.findall(html):
+        try:
+            data = json.loads(block)
+        except ValueError:
+            continue
+        for node in _ld_nodes(data):
+            types = _ld_types(node)
+            people = []
+            if 'SportsTeam' in types and _SPORT_RE.search(f"{node.get('sport', '')} {node.get('name', '')}"):
+                people = node.get('coach') or []
+                people = people if isinstance(people, list) else [people]
+            elif 'Person' in types and _SPORT_RE.search(str(node.get('jobTitle') or '')):
+                people = [node]
+            for person in people:
+                if isinstance(person, dict):
+                    coach = _ld_person(person)
+                    if coach['Name'] and coach['Name'].casefold() not in coaches:
+                        coaches[coach['Name'].casefold()] = coach
+    return list(coaches.values()) or None
+
+
+# ---------------- variants: (name, url -> url, parser) ----------------
+
+ROSTER_VARIANTS = (
+    ('page', lambda url: url, parse_roster_page),  # the static page itself, when it isn't rendered client-side
+    ('print-view', lambda url: with_query(url, print='true'), parse_roster_page),  # Sidearm: one plain table
+    ('list-view', lambda url: with_query(url, view='2'), parse_roster_page),  # Sidearm's list layout
+    ('presto-list', lambda url: with_query(url, view='list'), parse_roster_page),
+)
+
+STAFF_VARIANTS = (
+    ('json-ld', lambda url: url, parse_staff_json_ld),
+    ('page', lambda url: url, parse_staff_page),
+    ('sport-coaches', lambda url: with_path(url, f'/sports/{SPORT}/coaches'), parse_sport_staff_page),  # Sidearm
+    ('presto-coaches', lambda url: with_path(url, '/sports/sball/coaches/index'), parse_sport_staff_page),
+    ('print-view', lambda url: with_query(url, print='true'), parse_staff_page),
+)
+
+VARIANTS = {'roster': ROSTER_VARIANTS, 'staff': STAFF_VARIANTS}
+
+NONE = 'none'
+
+PERMANENT_STATUSES = (404, 410)  # a variant answered with these doesn't exist on the site
+
+
+class EndpointDiscovery:
+    def __init__(self, kind, variants, store=None, timeout=15):
+        self.kind = kind
+        self.variants = variants
+        self.store = store or JsonStore('endpoints')
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self.outcomes = Counter()
+
+    def _key(self, url):
+        return f"{registrable_domain(url)}|{self.kind}"
+
+    def _count(self, outcome):
+        with self._lock:
+            self.outcomes[outcome] += 1
+
+    async def _try(self, url, variant, headers, pages):
+        """(result, variant url, whether the fetch failed in a way that may not last)."""
+        name, make_url, parse = variant
+        variant_url = make_url(url)
+        if variant_url not in pages:  # several variants may read the same page
+            try:
+                response = await get_fetch_engine().get(variant_url, headers=headers, timeout=self.timeout,
+                                                        cache=get_response_cache())
+            except Exception as e:
+                logger.debug(f"{self.kind} variant {name} of {url} failed: {e}")
+                pages[variant_url] = (None, True)
+            else:
+                # A missing page says the variant isn't there; throttling and server errors say nothing
+                transient = not response.ok and response.status not in PERMANENT_STATUSES
+                pages[variant_url] = (response.text() if response.ok else None, transient)
+        html, transient = pages[variant_url]
+        if html is None:
+            return None, variant_url, transient
+        try:
+            return parse(variant_url, html), variant_url, False
+        except Exception as e:
+            logger.debug(f"{self.kind} variant {name} of {url} failed: {e}")
+            return None, variant_url, False
+
+    async def find(self, url, headers=None):
+        """(result, url it came from) from the first variant of `url` that parses completely, else (None, None).
+
+        Roster results are complete RosterParse objects, staff results lists of
+        coach records as staff_parser returns them. The site is marked as having
+        no variant only when every one was fetched and none parsed; after a
+        timeout, a 429 or a 5xx it is tried again next time.
+        """
+        key = self._key(url)
+        entry = self.store.get(key)
+        variants = self.variants
+        if entry is not None:
+            if entry['variant'] == NONE:
+                if time.time() - entry['updated_at'] < ENDPOINT_RECHECK_DAYS * 86400:
+                    self._count('skipped')
+                    return None, None
+            else:
+                # The variant that worked last time first, then the rest
+                variants = sorted(variants, key=lambda v: v[0] != entry['variant'])
+
+        pages = {}
+        unsettled = False
+        for variant in variants:
+            result, variant_url, transient = await self._try(url, variant, headers, pages)
+            if result:
+                self._count('remembered' if entry and variant[0] == entry['variant'] else 'found')
+                if entry is None or entry['variant'] != variant[0]:
+                    logger.info(f"{self.kind} endpoint for {key}: {variant[0]} ({variant_url})")
+                    self.store.set(key, {'variant': variant[0], 'updated_at': time.time()})
+                return result, variant_url
+            unsettled = unsettled or transient
+
+        if unsettled:
+            self._count('unsettled')
+            return None, None
+        self._count('none')
+        self.store.set(key, {'variant': NONE, 'updated_at': time.time()})
+        return None, None
+
+    def log_stats(self):
+        o = self.outcomes
+        logger.info(
+            f"{self.kind} endpoints: {o['remembered']} from the remembered variant, {o['found']} newly found, "
+            f"{o['none']} without one, {o['unsettled']} undecided after fetch errors, "
+            f"{o['skipped']} skipped (known to have none)"
+        )
+
+
+_discoveries = {}
+_discoveries_lock = threading.Lock()
+
+
+def get_endpoint_discovery(kind):
+    """Return the process-wide endpoint discovery for 'roster' or 'staff' pages."""
+    with _discoveries_lock:
+        if kind not in _discoveries:
+            store = next((d.store for d in _discoveries.values()), None)  # one store per file
+            _discoveries[kind] = EndpointDiscovery(kind, VARIANTS[kind], store)
+        return _discoveries[kind]
@@ -0,0 +1,172 @@
+# fetch_mode.py - try a plain HTTP fetch first, render only when the page needs it
+#
+# Plenty of the pages we render in a browser (majors lists, most Sidearm rosters)
+# parse fine from the static HTML. FetchModeSelector.fetch() does the cheap
+# fetch, checks it for content markers and only escalates to a headless render
+# when they are missing. The decision is remembered per (site, page template) in
+# .scraper_cache/fetch_modes.json, so the next run goes straight to whichever
+# path worked.
+#
+#     selector = get_fetch_mode_selector()
+#     page = await selector.fetch(url, ['hometown'], render_with_render_pool(render_pool), template='roster')
+#     if page.ok:
+#         soup = BeautifulSoup(page.html, 'html.parser')
+
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from .http_client import get_fetch_engine
+from .json_store import JsonStore
+from .page_settle import settle_page
+from .politeness import get_host_scheduler, registrable_domain
+from .response_cache import get_response_cache
+
+logger = logging.getLogger(__name__)
+
+STATIC = 'static'
+RENDER = 'render'
+
+
+class PageResult:
+    def __init__(self, url, html, mode, status=None, found=False):
+        self.url = url
+        self.html = html
+        self.mode = mode
+        self.status = status
+        self.found = found
+
+    @property
+    def ok(self):
+        return self.html is not None and self.found
+
+
+def path_template(url):
+    """Rough page template from the URL path: digits collapse, only the first two segments count."""
+    segments = [s for s in urlsplit(url).path.lower().split('/') if s][:2]
+    return '/' + '/'.join(re.sub(r'\d+', '{n}', s) for s in segments)
+
+
+def has_markers(html, markers):
+    """`markers` is a list of case-insensitive substrings that must all appear, or a callable(html) -> bool."""
+    if not html:
+        return False
+    if callable(markers):
+        return bool(markers(html))
+    lowered = html.lower()
+    return all(marker.lower() in lowered for marker in markers)
+
+
+def render_with_browser_pool(browser_pool, timeout=60000):
+    """Renderer backed by a Playwright BrowserPool."""
+    async def render(url):
+        async with browser_pool.page() as page:
+            await get_host_scheduler().acquire(url)
+            response = await page.goto(url, wait_until='domcontentloaded', timeout=timeout)
+            if response is not None:
+                get_host_scheduler().note_response(url, response.status, response.headers)
+            await settle_page(page)
+            return await page.content()
+    return render
+
+
+def render_with_render_pool(render_pool):
+    """Renderer backed by a Selenium RenderPool."""
+    async def render(url):
+        async with render_pool.driver() as driver:
+            await get_host_scheduler().acquire(url)
+            await driver.get(url)
+            await driver.settle()
+            return await driver.page_source()
+    return render
+
+
+class FetchModeSelector:
+    def __init__(self, store=None):
+        self.store = store or JsonStore('fetch_modes')
+        self._lock = threading.Lock()
+        self.outcomes = Counter()
+
+    def _key(self, url, template):
+        return f"{registrable_domain(url)}|{template or path_template(url)}"
+
+    def known_mode(self, url, template=None):
+        entry = self.store.get(self._key(url, template))
+        return entry['mode'] if entry else None
+
+    def _remember(self, url, template, mode):
+        key = self._key(url, template)
+        entry = self.store.get(key)
+        if entry is None or entry['mode'] != mode:
+            logger.info(f"Fetch mode for {key}: {mode}")
+            self.store.set(key, {'mode': mode, 'updated_at': time.time()})
+
+    def _count(self, outcome):
+        with self._lock:
+            self.outcomes[outcome] += 1
+
+    async def _fetch_static(self, url, headers, timeout, retries):
+        engine = get_fetch_engine()
+        for attempt in range(retries):
+            try:
+                response = await engine.get(url, headers=headers, timeout=timeout * (2 ** attempt),
+                                            cache=get_response_cache())
+                return response.status, response.text() if response.ok else None
+            except Exception as e:
+                if attempt == retries - 1:
+                    logger.debug(f"Static fetch of {url} failed: {e}")
+        return None, None
+
+    async def fetch(self, url, markers, render, template=None, headers=None, timeout=10, retries=1):
+        """Cheapest fetch whose HTML has the markers. `render` is an async callable(url) -> html.
+
+        Returns a PageResult; when neither path finds the markers, `found` is False
+        and `html` is whatever the last attempt produced.
+        """
+        known = self.known_mode(url, template)
+        status, html = None, None
+
+        if known != RENDER:
+            status, html = await self._fetch_static(url, headers, timeout, retries)
+            if has_markers(html, markers):
+                self._count('static')
+                self._remember(url, template, STATIC)
+                return PageResult(url, html, STATIC, status, found=True)
+
+        try:
+            rendered = await render(url)
+        except Exception as e:
+            logger.warning(f"Render of {url} failed: {e}")
+            self._count('failed')
+            return PageResult(url, html, known or STATIC, status)
+
+        found = has_markers(rendered, markers)
+        if found:
+            self._count('render' if known == RENDER else 'escalated')
+            self._remember(url, template, RENDER)
+        else:
+            self._count('failed')
+        return PageResult(url, rendered, RENDER, status, found=found)
+
+    def log_stats(self):
+        o = self.outcomes
+        logger.info(
+            f"Fetch modes: {o['static']} static, {o['escalated']} escalated to render, "
+            f"{o['render']} rendered directly, {o['failed']} without content"
+        )
+
+
+_selector = None
+_selector_lock = threading.Lock()
+
+
+def get_fetch_mode_selector():
+    """Return the process-wide fetch mode selector."""
+    global _selector
+    with _selector_lock:
+        if _selector is None:
+            _selector = FetchModeSelector()
+        return _selector
@@ -0,0 +1,315 @@
+# gemini_stub_server.py - local stand-in for the Gemini generateContent API
+#
+# Lets the pipelines run (and be load-tested) without live keys. Serves the same
+# REST endpoints model_client.py calls, :generateContent and
+# :streamGenerateContent?alt=sse, for text and inline image inputs:
+#   - a request whose inputs (model, generation config, text, images) were seen
+#     before is answered from its recording under GEMINI_STUB_RECORDINGS,
+#   - otherwise it is forwarded to GEMINI_STUB_UPSTREAM (the real API, using the
+#     caller's key) and the reply recorded, or, with no upstream, a reply is
+#     synthesized from the request's response schema,
+#   - replies are delayed by a log-normal time to first byte plus output time at
+#     GEMINI_STUB_TOKENS_PER_SECOND, and streamed in pieces at that pace,
+#   - GEMINI_STUB_RATE_LIMIT_RATE / GEMINI_STUB_KEY_RPM produce 429s and
+#     GEMINI_STUB_MALFORMED_RATE breaks replies (code fences, chatter, trailing
+#     commas, cut off mid-record) to exercise the recovery paths.
+# GET /stats returns the counters.
+#
+#     python -m scraper_common.gemini_stub_server
+#     GEMINI_API_BASE=http://127.0.0.1:8089/v1beta GEMINI_API_KEYS=k1,k2,k3 python coaches4_copy2/v3.py
+
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import threading
+import time
+from collections import defaultdict, deque
+
+import aiohttp
+from aiohttp import web
+
+from .config import (
+    GEMINI_STUB_HOST,
+    GEMINI_STUB_PORT,
+    GEMINI_STUB_RECORDINGS,
+    GEMINI_STUB_UPSTREAM,
+    GEMINI_STUB_LATENCY,
+    GEMINI_STUB_LATENCY_SIGMA,
+    GEMINI_STUB_TOKENS_PER_SECOND,
+    GEMINI_STUB_RATE_LIMIT_RATE,
+    GEMINI_STUB_KEY_RPM,
+    GEMINI_STUB_MALFORMED_RATE,
+    GEMINI_STUB_SEED,
+)
+from .llm_cache import input_digest
+from .token_estimator import raw_count, IMAGE_TOKENS
+
+logger = logging.getLogger(__name__)
+
+CHUNK_TOKENS = 20  # output tokens per streamed piece
+MALFORMED_MODES = ('fence', 'chatter', 'trailing_comma', 'truncate')
+_FIRST_NAMES = ('Alex', 'Jordan', 'Taylor', 'Morgan', 'Casey', 'Riley', 'Avery', 'Quinn', 'Reese', 'Skyler')
+_LAST_NAMES = ('Garcia', 'Smith', 'Nguyen', 'Johnson', 'Williams', 'Brown', 'Lopez', 'Davis', 'Miller', 'Wilson')
+
+
+def request_parts(body):
+    """SDK-style parts (text strings and {'mime_type', 'data'} dicts) of a REST request body."""
+    parts = []
+    for content in body.get('contents') or []:
+        for part in content.get('parts') or []:
+            if 'text' in part:
+                parts.append(part['text'])
+            else:
+                inline = part.get('inline_data') or part.get('inlineData') or {}
+                parts.append({'mime_type': inline.get('mime_type') or inline.get('mimeType', ''),
+                              'data': inline.get('data', '')})
+    return parts
+
+
+def prompt_tokens(parts):
+    return sum(IMAGE_TOKENS if isinstance(p, dict) else raw_count(p) for p in parts)
+
+
+def synthesize(schema, rng, name=''):
+    """A plausible value for a response schema (Gemini dialect, as in schemas.py)."""
+    if schema is None:
+        return {}
+    if schema.get('nullable') and rng.random() < 0.15:
+        return None
+    kind = str(schema.get('type', 'OBJECT')).upper()
+    if kind == 'OBJECT':
+        return {key: synthesize(sub, rng, key) for key, sub in (schema.get('properties') or {}).items()}
+    if kind == 'ARRAY':
+        return [synthesize(schema.get('items'), rng, name) for _ in range(rng.randint(2, 20))]
+    if kind == 'BOOLEAN':
+        return rng.random() < 0.9
+    if kind in ('INTEGER', 'NUMBER'):
+        return rng.randint(2024, 2029) if 'year' in name.lower() else rng.randint(0, 99)
+    if schema.get('enum'):
+        return rng.choice(schema['enum'])
+    lowered = name.lower()
+    first, last = rng.choice(_FIRST_NAMES), rng.choice(_LAST_NAMES)
+    if lowered == 'name':
+        return f"{first} {last}"
+    if 'email' in lowered:
+        return f"{first[0].lower()}{last.lower()}@example.edu"
+    if 'phone' in lowered:
+        return f"555-{rng.randint(100, 999)}-{rng.randint(1000, 9999)}"
+    if 'twitter' in lowered:
+        return f"@{first.lower()}{last.lower()}"
+    return f"{name or 'value'} {rng.randint(1, 999)}"
+
+
+def malform(text, mode, rng):
+    """(broken text, finish reason) for one of MALFORMED_MODES."""
+    if mode == 'fence':
+        return f"```json\n{text}\n```", 'STOP'
+    if mode == 'chatter':
+        return f"Here is the extracted data:\n{text}", 'STOP'
+    if mode == 'trailing_comma':
+        index = text.rfind('}', 0, len(text) - 1)
+        return (text[:index + 1] + ',' + text[index + 1:] if index > 0 else text), 'STOP'
+    return text[:int(len(text) * rng.uniform(0.4, 0.9))], 'MAX_TOKENS'
+
+
+def _error(status, message, reason):
+    return web.json_response({'error': {'code': status, 'message': message, 'status': reason}}, status=status)
+
+
+class Recordings:
+    def __init__(self, folder=GEMINI_STUB_RECORDINGS):
+        self.folder = folder
+
+    def _path(self, digest):
+        return os.path.join(self.folder, digest[:2], digest + '.json')
+
+    def get(self, digest):
+        try:
+            with open(self._path(digest), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, digest, entry):
+        path = self._path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+class GeminiStub:
+    def __init__(self, recordings=None, upstream=GEMINI_STUB_UPSTREAM, latency=GEMINI_STUB_LATENCY,
+                 latency_sigma=GEMINI_STUB_LATENCY_SIGMA, tokens_per_second=GEMINI_STUB_TOKENS_PER_SECOND,
+                 rate_limit_rate=GEMINI_STUB_RATE_LIMIT_RATE, key_rpm=GEMINI_STUB_KEY_RPM,
+                 malformed_rate=GEMINI_STUB_MALFORMED_RATE, seed=GEMINI_STUB_SEED):
+        self.recordings = recordings or Recordings()
+        self.upstream = upstream.rstrip('/')
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.rate_limit_rate = rate_limit_rate
+        self.key_rpm = key_rpm
+        self.malformed_rate = malformed_rate
+        self.rng = random.Random(seed or None)
+        self._key_calls = defaultdict(deque)
+        self._session = None
+        self.stats = defaultdict(int)
+        self.active = 0
+
+    # ---------------- faults and timing ----------------
+
+    def _rate_limited(self, key):
+        if self.rate_limit_rate and self.rng.random() < self.rate_limit_rate:
+            return True
+        if not self.key_rpm:
+            return False
+        now = time.monotonic()
+        calls = self._key_calls[key]
+        while calls and calls[0] <= now - 60:
+            calls.popleft()
+        if len(calls) >= self.key_rpm:
+            return True
+        calls.append(now)
+        return False
+
+    def _first_byte_delay(self):
+        if self.latency <= 0:
+            return 0.0
+        return self.rng.lognormvariate(math.log(self.latency), self.latency_sigma)
+
+    # ---------------- reply sources ----------------
+
+    async def _forward(self, model, body, key):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=300))
+        url = f"{self.upstream}/models/{model}:generateContent"
+        async with self._session.post(url, json=body, headers={'x-goog-api-key': key}) as response:
+            data = await response.json(content_type=None)
+            return response.status, data
+
+    async def _reply(self, model, body, parts, digest, key):
+        """(entry dict with text/usageMetadata/finishReason, source) or an error web.Response."""
+        entry = self.recordings.get(digest)
+        if entry is not None:
+            return entry, 'recorded'
+        if self.upstream:
+            status, data = await self._forward(model, body, key)
+            if status != 200:
+                return web.json_response(data, status=status)
+            candidate = (data.get('candidates') or [{}])[0]
+            entry = {
+                'model': model,
+                'text': ''.join(p.get('text', '') for p in (candidate.get('content') or {}).get('parts') or []),
+                'finishReason': candidate.get('finishReason', 'STOP'),
+                'usageMetadata': data.get('usageMetadata'),
+                'recorded_at': time.time(),
+            }
+            self.recordings.put(digest, entry)
+            return entry, 'forwarded'
+        schema = (body.get('generationConfig') or {}).get('responseSchema') or \
+            (body.get('generationConfig') or {}).get('response_schema')
+        text = json.dumps(synthesize(schema, random.Random(digest)), ensure_ascii=False)
+        return {'text': text, 'finishReason': 'STOP', 'usageMetadata': None}, 'synthesized'
+
+    # ---------------- handlers ----------------
+
+    async def handle(self, request):
+        model, _, method = request.match_info['call'].partition(':')
+        if method not in ('generateContent', 'streamGenerateContent'):
+            return _error(404, f"Unknown method {method}", 'NOT_FOUND')
+        key = request.headers.get('x-goog-api-key') or request.query.get('key', '')
+        self.stats['requests'] += 1
+        if self._rate_limited(key):
+            self.stats['rate_limited'] += 1
+            return _error(429, 'Resource has been exhausted (e.g. check quota).', 'RESOURCE_EXHAUSTED')
+        try:
+            body = await request.json()
+        except ValueError:
+            return _error(400, 'Invalid JSON payload received.', 'INVALID_ARGUMENT')
+
+        self.active += 1
+        self.stats['peak_active'] = max(self.stats['peak_active'], self.active)
+        try:
+            parts = request_parts(body)
+            config = json.dumps(body.get('generationConfig') or {}, sort_keys=True)
+            digest = input_digest([f"model:{model}", config] + parts)
+            started = time.monotonic()
+            reply = await self._reply(model, body, parts, digest, key)
+            if isinstance(reply, web.Response):
+                self.stats['upstream_errors'] += 1
+                return reply
+            entry, source = reply
+            self.stats[source] += 1
+
+            text, finish_reason = entry['text'], entry.get('finishReason', 'STOP')
+            if self.malformed_rate and self.rng.random() < self.malformed_rate:
+                text, finish_reason = malform(text, self.rng.choice(MALFORMED_MODES), self.rng)
+                self.stats['malformed'] += 1
+            usage = dict(entry.get('usageMetadata') or {})
+            usage.setdefault('promptTokenCount', prompt_tokens(parts))
+            if finish_reason != entry.get('finishReason', 'STOP') or 'candidatesTokenCount' not in usage:
+                usage['candidatesTokenCount'] = raw_count(text)
+            usage['totalTokenCount'] = usage['promptTokenCount'] + usage['candidatesTokenCount']
+
+            # Recorded/synthesized replies wait out the modelled latency; forwarded ones already took real time
+            delay = self._first_byte_delay() if source != 'forwarded' else 0.0
+            delay = max(0.0, delay - (time.monotonic() - started))
+            if method == 'streamGenerateContent':
+                return await self._stream(request, text, finish_reason, usage, delay)
+            await asyncio.sleep(delay + usage['candidatesTokenCount'] / self.tokens_per_second)
+            return web.json_response(_response_body(text, finish_reason, usage))
+        finally:
+            self.active -= 1
+
+    async def _stream(self, request, text, finish_reason, usage, delay):
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+        await asyncio.sleep(delay)
+        pieces = max(1, usage['candidatesTokenCount'] // CHUNK_TOKENS)
+        size = max(1, -(-len(text) // pieces))
+        chunks = [text[i:i + size] for i in range(0, len(text), size)] or ['']
+        for index, chunk in enumerate(chunks):
+            await asyncio.sleep(CHUNK_TOKENS / self.tokens_per_second)
+            last = index == len(chunks) - 1
+            body = _response_body(chunk, finish_reason if last else None, usage if last else None)
+            await response.write(b'data: ' + json.dumps(body, ensure_ascii=False).encode('utf-8') + b'\r\n\r\n')
+        await response.write_eof()
+        return response
+
+    async def handle_stats(self, request):
+        return web.json_response(dict(self.stats, active=self.active))
+
+    async def close(self, app=None):
+        if self._session is not None:
+            await self._session.close()
+        logger.info(f"Gemini stub: {dict(self.stats)}")
+
+
+def _response_body(text, finish_reason=None, usage=None):
+    candidate = {'content': {'role': 'model', 'parts': [{'text': text}]}, 'index': 0}
+    if finish_reason:
+        candidate['finishReason'] = finish_reason
+    body = {'candidates': [candidate]}
+    if usage:
+        body['usageMetadata'] = usage
+    return body
+
+
+def build_app(stub=None):
+    stub = stub or GeminiStub()
+    app = web.Application(client_max_size=64 * 1024 * 1024)  # several full-page screenshots per request
+    app.router.add_post('/{version}/models/{call}', stub.handle)
+    app.router.add_get('/stats', stub.handle_stats)
+    app.on_cleanup.append(stub.close)
+    return app
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    logger.info(f"Gemini stub listening on http://{GEMINI_STUB_HOST}:{GEMINI_STUB_PORT}/v1beta")
+    web.run_app(build_app(), host=GEMINI_STUB_HOST, port=GEMINI_STUB_PORT, access_log=None, print=None)
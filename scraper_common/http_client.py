@@ -0,0 +1,321 @@
+# http_client.py - one long-lived, pooled HTTP session shared by every scraper in the process
+#
+# The scrapers mix plain asyncio, asyncio.run() inside worker threads and fully
+# synchronous code, and an aiohttp session is bound to the event loop it was
+# created on. So the engine runs its own event loop on a daemon thread and every
+# caller (any loop, any thread, or sync code) hands its request to that loop.
+# That keeps a single connection pool, DNS cache and keep-alive set for the
+# whole run instead of one per school.
+
+import asyncio
+import atexit
+import json
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlparse
+
+import aiohttp
+from multidict import CIMultiDict
+
+from .config import (
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_CONNECTIONS_PER_HOST,
+    HTTP_DNS_CACHE_TTL,
+    HTTP_KEEPALIVE_TIMEOUT,
+    HTTP_TIMEOUT,
+)
+from .politeness import get_host_scheduler
+
+logger = logging.getLogger(__name__)
+
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.1.1 Safari/605.1.15",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36 Edg/91.0.864.59",
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+]
+
+DEFAULT_HEADERS = {
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.5",
+}
+
+
+class FetchResponse:
+    """Fully-read response, safe to pass between threads and event loops."""
+
+    def __init__(self, url, status, headers, body, elapsed, encoding=None, from_cache=False):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.elapsed = elapsed
+        self.encoding = encoding
+        self.from_cache = from_cache
+
+    @property
+    def ok(self):
+        return 200 <= self.status < 300
+
+    def text(self):
+        return self.body.decode(self.encoding or 'utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.text())
+
+
+class FetchStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.bytes = 0
+        self.total_latency = 0.0
+        self.new_connections = 0
+        self.reused_connections = 0
+        self.dns_cache_hits = 0
+        self.dns_cache_misses = 0
+        self.latency_by_host = defaultdict(list)
+
+    def record(self, url, elapsed, size):
+        with self.lock:
+            self.requests += 1
+            self.bytes += size
+            self.total_latency += elapsed
+            self.latency_by_host[urlparse(url).netloc].append(elapsed)
+
+    def summary(self):
+        with self.lock:
+            avg = self.total_latency / self.requests if self.requests else 0.0
+            return {
+                'requests': self.requests,
+                'errors': self.errors,
+                'bytes': self.bytes,
+                'avg_latency': avg,
+                'new_connections': self.new_connections,
+                'reused_connections': self.reused_connections,
+                'dns_cache_hits': self.dns_cache_hits,
+                'dns_cache_misses': self.dns_cache_misses,
+                'hosts': len(self.latency_by_host),
+            }
+
+
+class FetchEngine:
+    def __init__(self, limit=HTTP_MAX_CONNECTIONS, limit_per_host=HTTP_MAX_CONNECTIONS_PER_HOST,
+                 dns_cache_ttl=HTTP_DNS_CACHE_TTL, keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+                 timeout=HTTP_TIMEOUT):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = timeout
+        self.stats = FetchStats()
+        self._loop = None
+        self._thread = None
+        self._session = None
+        self._start_lock = threading.Lock()
+
+    # ---------------- event loop thread ----------------
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                ready = threading.Event()
+                self._thread = threading.Thread(target=self._run_loop, args=(ready,), name='fetch-engine', daemon=True)
+                self._thread.start()
+                ready.wait()
+        return self._loop
+
+    def _run_loop(self, ready):
+        asyncio.set_event_loop(self._loop)
+        self._loop.call_soon(ready.set)
+        self._loop.run_forever()
+
+    def _submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_started())
+
+    def _trace_config(self):
+        stats = self.stats
+
+        async def on_create(session, ctx, params):
+            stats.new_connections += 1
+
+        async def on_reuse(session, ctx, params):
+            stats.reused_connections += 1
+
+        async def on_dns_hit(session, ctx, params):
+            stats.dns_cache_hits += 1
+
+        async def on_dns_miss(session, ctx, params):
+            stats.dns_cache_misses += 1
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(on_create)
+        trace_config.on_connection_reuseconn.append(on_reuse)
+        trace_config.on_dns_cache_hit.append(on_dns_hit)
+        trace_config.on_dns_cache_miss.append(on_dns_miss)
+        return trace_config
+
+    def _get_session(self):
+        # Only ever called on the engine loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                use_dns_cache=True,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers=DEFAULT_HEADERS,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                trace_configs=[self._trace_config()],
+            )
+        return self._session
+
+    async def _request(self, method, url, headers=None, params=None, json=None, data=None,
+                       timeout=None, allow_redirects=True, ssl=None, cache=None, polite=True):
+        if cache is not None and method == 'GET' and not params:
+            return await self._cached_get(url, cache, headers=headers, timeout=timeout,
+                                          allow_redirects=allow_redirects, ssl=ssl, polite=polite)
+
+        scheduler = get_host_scheduler() if polite else None
+        if scheduler is not None:
+            await scheduler.acquire(url)
+
+        session = self._get_session()
+        request_headers = {'User-Agent': random.choice(USER_AGENTS)}
+        request_headers.update(headers or {})
+        kwargs = {}
+        if timeout is not None:
+            kwargs['timeout'] = aiohttp.ClientTimeout(total=timeout)
+        if ssl is not None:
+            kwargs['ssl'] = ssl
+
+        start = time.perf_counter()
+        try:
+            async with session.request(method, url, headers=request_headers, params=params, json=json,
+                                       data=data, allow_redirects=allow_redirects, **kwargs) as response:
+                body = await response.read()
+                try:
+                    encoding = response.get_encoding()
+                except Exception:
+                    encoding = 'utf-8'
+                elapsed = time.perf_counter() - start
+                self.stats.record(url, elapsed, len(body))
+                if scheduler is not None:
+                    scheduler.note_response(url, response.status, response.headers)
+                return FetchResponse(str(response.url), response.status, CIMultiDict(response.headers),
+                                     body, elapsed, encoding)
+        except Exception:
+            with self.stats.lock:
+                self.stats.errors += 1
+            raise
+
+    async def _cached_get(self, url, cache, headers=None, **kwargs):
+        loop = asyncio.get_running_loop()
+        entry = await loop.run_in_executor(None, cache.load, url)
+        if entry is not None and cache.is_fresh(entry):
+            cache.count('hits')
+            return _from_cache_entry(url, entry)
+
+        request_headers = dict(headers or {})
+        if entry is not None:
+            request_headers.update(entry.conditional_headers())
+        response = await self._request('GET', url, headers=request_headers, **kwargs)
+
+        if response.status == 304 and entry is not None:
+            cache.count('revalidated')
+            await loop.run_in_executor(None, cache.mark_revalidated, url, entry, response.headers)
+            return _from_cache_entry(response.url, entry, elapsed=response.elapsed)
+        cache.count('misses')
+        await loop.run_in_executor(None, cache.store, url, response.status, response.headers,
+                                   response.body, response.encoding)
+        return response
+
+    # ---------------- public API ----------------
+
+    async def request(self, method, url, **kwargs):
+        """Run a request on the shared session from any event loop.
+
+        Pass cache=get_response_cache() on a GET to serve/revalidate it from disk.
+        Requests go through the per-host politeness scheduler unless polite=False
+        (use that for APIs such as Oxylabs or Google Custom Search).
+        """
+        return await asyncio.wrap_future(self._submit(self._request(method, url, **kwargs)))
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+    def request_sync(self, method, url, **kwargs):
+        """Blocking variant for the synchronous (requests-style) code paths."""
+        return self._submit(self._request(method, url, **kwargs)).result()
+
+    def get_sync(self, url, **kwargs):
+        return self.request_sync('GET', url, **kwargs)
+
+    def log_stats(self):
+        s = self.stats.summary()
+        logger.info(
+            f"Fetch engine: {s['requests']} requests to {s['hosts']} hosts, avg latency {s['avg_latency']:.3f}s, "
+            f"{s['new_connections']} new / {s['reused_connections']} reused connections, "
+            f"DNS cache {s['dns_cache_hits']} hits / {s['dns_cache_misses']} misses, {s['errors']} errors"
+        )
+
+    def close(self):
+        with self._start_lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+
+        async def _close_session():
+            if self._session is not None and not self._session.closed:
+                await self._session.close()
+
+        try:
+            asyncio.run_coroutine_threadsafe(_close_session(), loop).result(timeout=10)
+        except Exception as e:
+            logger.debug(f"Error closing fetch engine session: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join(timeout=10)
+        loop.close()
+        self._session = None
+
+
+def _from_cache_entry(url, entry, elapsed=0.0):
+    return FetchResponse(url, entry.meta['status'], CIMultiDict(entry.meta['headers']), entry.body,
+                         elapsed, entry.meta.get('encoding'), from_cache=True)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_fetch_engine():
+    """Return the process-wide fetch engine, creating it on first use."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = FetchEngine()
+        return _engine
+
+
+def close_fetch_engine():
+    global _engine
+    with _engine_lock:
+        engine, _engine = _engine, None
+    if engine is not None:
+        engine.log_stats()
+        engine.close()
+
+
+atexit.register(close_fetch_engine)
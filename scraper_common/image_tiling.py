@@ -0,0 +1,157 @@
+# image_tiling.py - trim whitespace out of long screenshots and tile them at clean cut points
+#
+# Long staff/majors screenshots are mostly empty bands, and cropping them into
+# fixed-height pieces cuts lines of text in half. tile_screenshot():
+#   1. finds near-uniform rows with NumPy and collapses long blank bands to a
+#      small gap,
+#   2. drops content bands that repeat exactly (sticky headers, repeated footers),
+#   3. cuts tiles inside whitespace gaps (or at the least-inked row when a window
+#      has none) so no tile is taller than max_aspect_ratio x width.
+# Decoding and re-encoding is CPU-bound, so batches run on a process pool.
+
+import asyncio
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from .config import (
+    TILE_MAX_ASPECT,
+    TILE_JPEG_QUALITY,
+    TILE_MIN_BLANK_BAND,
+    TILE_KEEP_GAP,
+    TILING_WORKERS,
+)
+
+logger = logging.getLogger(__name__)
+
+# A row is blank when at most this fraction of its pixels differ from the row's
+# median by more than INK_THRESHOLD grey levels (survives thin borders and JPEG noise)
+INK_THRESHOLD = 24
+BLANK_INK_FRACTION = 0.002
+# Bands shorter than this are never treated as repeats (rules, spacers)
+MIN_DEDUPE_BAND = 24
+
+
+def _runs(mask):
+    """Start/end (exclusive) indices of the True runs in a 1-D boolean array."""
+    padded = np.concatenate(([0], mask.astype(np.int8), [0]))
+    edges = np.flatnonzero(np.diff(padded))
+    return edges[0::2], edges[1::2]
+
+
+def row_ink(gray):
+    """Fraction of 'inked' pixels in each row of a 2-D greyscale array."""
+    median = np.median(gray, axis=1, keepdims=True)
+    return (np.abs(gray - median) > INK_THRESHOLD).mean(axis=1)
+
+
+def _band_signature(gray_band):
+    # Coarse, JPEG-noise tolerant fingerprint of a band
+    coarse = (gray_band[::4, ::4] // 32).astype(np.uint8)
+    return hashlib.blake2b(coarse.tobytes() + str(coarse.shape).encode(), digest_size=16).digest()
+
+
+def compact_rows(gray, min_blank_band=TILE_MIN_BLANK_BAND, keep_gap=TILE_KEEP_GAP):
+    """Boolean mask of the rows worth keeping: long blank bands shrink to keep_gap, repeated bands go."""
+    height = gray.shape[0]
+    blank = row_ink(gray) <= BLANK_INK_FRACTION
+    keep = np.ones(height, dtype=bool)
+
+    starts, ends = _runs(blank)
+    long_gaps = (ends - starts) >= min_blank_band
+    for start, end in zip(starts[long_gaps], ends[long_gaps]):
+        keep[start + keep_gap // 2:end - (keep_gap - keep_gap // 2)] = False
+
+    # Content bands are whatever lies between the long blank gaps
+    band_starts = np.concatenate(([0], ends[long_gaps]))
+    band_ends = np.concatenate((starts[long_gaps], [height]))
+    seen = set()
+    for start, end in zip(band_starts, band_ends):
+        if end - start < MIN_DEDUPE_BAND:
+            continue
+        signature = _band_signature(gray[start:end])
+        if signature in seen:
+            keep[start:end] = False
+        else:
+            seen.add(signature)
+    return keep, blank
+
+
+def cut_points(blank, ink, max_height):
+    """Tile boundaries: the last blank row in the back half of each window, else its least-inked row."""
+    height = len(blank)
+    cuts = [0]
+    start = 0
+    while height - start > max_height:
+        low, high = start + max_height // 2, start + max_height
+        gaps = np.flatnonzero(blank[low:high])
+        cut = low + (gaps[-1] if gaps.size else int(np.argmin(ink[low:high])))
+        cuts.append(cut)
+        start = cut
+    cuts.append(height)
+    return cuts
+
+
+def tile_screenshot(image_bytes, max_aspect_ratio=TILE_MAX_ASPECT, quality=TILE_JPEG_QUALITY):
+    """Whitespace-trimmed JPEG tiles of one screenshot, in page order."""
+    image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
+    pixels = np.asarray(image)
+    gray = np.asarray(image.convert('L'), dtype=np.int16)
+    width = pixels.shape[1]
+    max_height = max(1, int(width * max_aspect_ratio))
+
+    keep, blank = compact_rows(gray)
+    if keep.all() and pixels.shape[0] <= max_height:
+        return [image_bytes]
+
+    pixels, gray, blank = pixels[keep], gray[keep], blank[keep]
+    if pixels.shape[0] == 0:
+        return []
+    cuts = cut_points(blank, row_ink(gray), max_height)
+
+    tiles = []
+    for top, bottom in zip(cuts, cuts[1:]):
+        buffer = io.BytesIO()
+        Image.fromarray(pixels[top:bottom]).save(buffer, format='JPEG', quality=quality)
+        tiles.append(buffer.getvalue())
+    logger.debug(f"Tiled {image.height}px screenshot into {len(tiles)} tiles, kept {keep.mean():.0%} of rows")
+    return tiles
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_tiling_pool():
+    """Return the process pool shared by every tiling call in this process."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=TILING_WORKERS or None)
+        return _pool
+
+
+def tile_batch(screenshots, max_aspect_ratio=TILE_MAX_ASPECT, quality=TILE_JPEG_QUALITY):
+    """Tile a batch of screenshots across the process pool. Returns one list of tiles per screenshot."""
+    pool = get_tiling_pool()
+    futures = [pool.submit(tile_screenshot, s, max_aspect_ratio, quality) for s in screenshots]
+    return [f.result() for f in futures]
+
+
+async def tile_screenshots(screenshots, max_aspect_ratio=TILE_MAX_ASPECT, quality=TILE_JPEG_QUALITY):
+    """Async variant: tiles every screenshot on the process pool and flattens the result."""
+    loop = asyncio.get_running_loop()
+    pool = get_tiling_pool()
+    results = await asyncio.gather(*(
+        loop.run_in_executor(pool, tile_screenshot, s, max_aspect_ratio, quality) for s in screenshots
+    ))
+    tiles = [tile for result in results for tile in result]
+    before = sum(len(s) for s in screenshots)
+    logger.info(f"Tiling: {len(screenshots)} screenshots -> {len(tiles)} tiles, "
+                f"{before // 1024} KB -> {sum(len(t) for t in tiles) // 1024} KB")
+    return tiles
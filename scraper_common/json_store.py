@@ -0,0 +1,59 @@
+# json_store.py - small persistent key/value stores kept as one JSON file under CACHE_DIR
+#
+# For per-host memory that should survive between runs (which fetch mode works
+# for a site, which CMS it runs, ...). Loaded lazily, written atomically on
+# every change; the stores hold a few thousand small entries at most.
+
+import json
+import logging
+import os
+import threading
+
+from .config import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+
+class JsonStore:
+    def __init__(self, name, cache_dir=None):
+        self.path = os.path.join(cache_dir or CACHE_DIR, f"{name}.json")
+        self._lock = threading.Lock()
+        self._data = None
+
+    def _load(self):
+        # Caller holds the lock
+        if self._data is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._data = json.load(f)
+            except FileNotFoundError:
+                self._data = {}
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not read {self.path}, starting empty: {e}")
+                self._data = {}
+        return self._data
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._data, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._load().get(key, default)
+
+    def set(self, key, value):
+        with self._lock:
+            self._load()[key] = value
+            self._save()
+
+    def delete(self, key):
+        with self._lock:
+            if self._load().pop(key, None) is not None:
+                self._save()
+
+    def items(self):
+        with self._lock:
+            return list(self._load().items())
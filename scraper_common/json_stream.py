@@ -0,0 +1,207 @@
+# json_stream.py - tolerant, incremental parsing of the JSON Gemini sends back
+#
+# Extraction replies are one JSON object holding a list of records (players,
+# coaches). json.loads() on the whole reply loses everything when the reply is
+# wrapped in a code fence, has a trailing comma, or stops mid-record because it
+# hit max_output_tokens. JsonScanner reads the reply as it streams in:
+#   - it skips fences and anything else around the top-level value,
+#   - emits each record of the `records_key` list as soon as its object closes,
+#   - drops trailing commas,
+#   - and, if the reply is cut off, closes it after the last complete record
+#     (or field of the top-level object), so the records before the cut survive.
+# Callers retry only when no usable records came back.
+#
+#     reply = await model_client.generate(model, parts, generation_config=json_config(ROSTER_SCHEMA), stream=True,
+#                                         records_key='players', on_record=lambda p: logger.info(p['name']))
+#     if reply.parsed.usable:  # the StreamResult consume_stream built from the streamed chunks
+#         data = reply.parsed.data
+
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+_CLOSERS = {'{': '}', '[': ']'}
+
+
+class _Open:
+    __slots__ = ('opener', 'start', 'key', 'in_record')
+
+    def __init__(self, opener, start, key, in_record):
+        self.opener = opener
+        self.start = start
+        self.key = key
+        self.in_record = in_record
+
+
+class JsonScanner:
+    def __init__(self, records_key=None, on_record=None):
+        self.records_key = records_key
+        self.on_record = on_record
+        self.text = ''
+        self.records = []
+        self.first_record_at = None
+        self._started_at = time.monotonic()
+        self._pos = 0
+        self._begin = None  # index of the top-level '{' / '['
+        self.end = None  # index just past the top-level value, once it closed
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string = None
+        self._key = None
+        self._last_sig = None  # index of the last non-whitespace character outside strings
+        self._dangling = []  # indices of commas directly before a closing bracket
+        self._cut = None  # (index, closers) of the last point the reply can be cut off cleanly
+
+    def _closers(self):
+        return ''.join(_CLOSERS[o.opener] for o in reversed(self._stack))
+
+    def _can_cut(self):
+        return not (self._stack and self._stack[-1].in_record)
+
+    def feed(self, chunk):
+        self.text += chunk
+        text = self.text
+        for i in range(self._pos, len(text)):
+            if self.end is not None:
+                break
+            c = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == '\\':
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    self._last_string = text[self._string_start:i + 1]
+                continue
+            if self._begin is None:
+                if c in '{[':
+                    self._begin = i
+                else:
+                    continue  # fence or chatter before the JSON
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+            elif c == ':':
+                self._key = self._last_string
+            elif c == ',':
+                if self._stack and self._stack[-1].opener == '{':
+                    self._key = None
+                if self._can_cut():
+                    self._cut = (i, self._closers())
+            elif c in '{[':
+                parent = self._stack[-1] if self._stack else None
+                key = self._key if parent is not None and parent.opener == '{' else None
+                in_record = parent is not None and (parent.in_record or (c == '{' and parent.opener == '['))
+                self._stack.append(_Open(c, i, key, in_record))
+                self._key = None
+                if self._can_cut():
+                    self._cut = (i + 1, self._closers())
+            elif c in '}]':
+                if self._last_sig is not None and text[self._last_sig] == ',':
+                    self._dangling.append(self._last_sig)
+                if not self._stack:
+                    break
+                closed = self._stack.pop()
+                if self._stack and self._stack[-1].opener == '[' and closed.opener == '{':
+                    self._record(closed.start, i + 1, self._stack[-1])
+                if not self._stack:
+                    self.end = i + 1
+                elif self._can_cut():
+                    self._cut = (i + 1, self._closers())
+            if not c.isspace():
+                self._last_sig = i
+        self._pos = len(text)
+
+    def _record(self, start, end, array):
+        if self.records_key is None or array.key is None or _decode_key(array.key) != self.records_key:
+            return
+        try:
+            record = json.loads(self._slice(start, end))
+        except ValueError:
+            return
+        self.records.append(record)
+        if self.first_record_at is None:
+            self.first_record_at = time.monotonic() - self._started_at
+        if self.on_record is not None:
+            self.on_record(record)
+
+    def _slice(self, start, end):
+        pieces = []
+        position = start
+        for index in self._dangling:
+            if start <= index < end:
+                pieces.append(self.text[position:index])
+                position = index + 1
+        pieces.append(self.text[position:end])
+        return ''.join(pieces)
+
+    @property
+    def complete(self):
+        return self.end is not None
+
+    def result(self):
+        """(parsed value or None, complete) for everything fed so far."""
+        if self._begin is None:
+            return None, False
+        if self.end is not None:
+            body = self._slice(self._begin, self.end)
+        elif self._cut is not None:
+            body = self._slice(self._begin, self._cut[0]) + self._cut[1]
+        else:
+            return None, False
+        try:
+            return json.loads(body), self.end is not None
+        except ValueError:
+            return None, False
+
+
+def _decode_key(raw):
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return raw.strip('"')
+
+
+def parse_model_json(text, records_key=None):
+    """(value, complete) from a whole reply, repairing fences, trailing commas and truncation."""
+    scanner = JsonScanner(records_key)
+    scanner.feed(text or '')
+    return scanner.result()
+
+
+class StreamResult:
+    def __init__(self, text, data, records, complete, first_record_at=None):
+        self.text = text
+        self.data = data
+        self.records = records
+        self.complete = complete
+        self.first_record_at = first_record_at
+
+    @property
+    def usable(self):
+        """Worth keeping: a complete reply, or a cut-off one that still holds records."""
+        return self.data is not None and (self.complete or bool(self.records))
+
+
+async def consume_stream(response, records_key=None, on_record=None):
+    """Read a streamed reply (async iterator of chunks with .text, e.g. model_client's SSE events) through a JsonScanner."""
+    scanner = JsonScanner(records_key, on_record)
+    try:
+        async for chunk in response:
+            try:
+                scanner.feed(chunk.text)
+            except ValueError:
+                continue  # chunks carrying only finish/safety metadata have no text
+    except Exception as e:
+        if not scanner.records:
+            raise
+        logger.warning(f"Stream broke off after {len(scanner.records)} records ({e}), keeping them")
+    data, complete = scanner.result()
+    if not complete and data is not None:
+        logger.info(f"Reply cut off, recovered {len(scanner.records)} complete records")
+    return StreamResult(scanner.text, data, scanner.records, complete, scanner.first_record_at)
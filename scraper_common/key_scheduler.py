@@ -0,0 +1,189 @@
+# key_scheduler.py - hand out Gemini API keys according to their per-minute quotas
+#
+# Round-robin and random.choice() know nothing about quotas, so bursts run into
+# 429s and then sit in retry sleeps. KeyScheduler tracks the requests and tokens
+# each key has spent in a sliding window and gives every caller the key that can
+# take its request soonest, waiting only when all keys are at quota. A 429 pauses
+# just that key with exponential backoff, and the other keys carry on.
+#
+#     scheduler = get_key_scheduler(GEMINI_API_KEYS)
+#     async with scheduler.lease(estimated_tokens) as lease:  # model_client.generate() does this per request
+#         reply = await post(model, parts, lease.key)  # key sent as the x-goog-api-key header
+#         lease.report(tokens_used)
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+from .config import GEMINI_KEY_RPM, GEMINI_KEY_TPM, GEMINI_KEY_BACKOFF, GEMINI_KEY_MAX_BACKOFF
+
+logger = logging.getLogger(__name__)
+
+WINDOW = 60.0  # seconds; Gemini quotas are per minute
+
+
+def is_rate_limit_error(exc):
+    """True for a 429 / quota error from the SDK or from a raw HTTP call."""
+    if type(exc).__name__ in ('ResourceExhausted', 'TooManyRequests'):
+        return True
+    if getattr(exc, 'status', None) == 429 or getattr(exc, 'code', None) == 429:
+        return True
+    text = str(exc)
+    return '429' in text or 'RESOURCE_EXHAUSTED' in text or 'quota' in text.lower()
+
+
+class KeyState:
+    def __init__(self, key):
+        self.key = key
+        self.requests = deque()  # start times of requests in the window (may be in the future)
+        self.tokens = deque()    # [start time, tokens] per request
+        self.blocked_until = 0.0
+        self.strikes = 0
+        self.total_requests = 0
+        self.rate_limited = 0
+
+    def _expire(self, now):
+        while self.requests and self.requests[0] <= now - WINDOW:
+            self.requests.popleft()
+        while self.tokens and self.tokens[0][0] <= now - WINDOW:
+            self.tokens.popleft()
+
+    def available_at(self, now, tokens, rpm, tpm):
+        """Earliest time this key can start a request of `tokens` tokens."""
+        self._expire(now)
+        start = max(now, self.blocked_until)
+        if self.requests:
+            start = max(start, self.requests[-1])  # first come, first served on each key
+        if len(self.requests) >= rpm:
+            start = max(start, self.requests[-rpm] + WINDOW)
+        if tpm and tokens:
+            # Walk forward until enough of the window's tokens have aged out
+            used = sum(entry[1] for entry in self.tokens)
+            for entry_time, entry_tokens in self.tokens:
+                if used + tokens <= tpm:
+                    break
+                used -= entry_tokens
+                start = max(start, entry_time + WINDOW)
+        return start
+
+
+class KeyLease:
+    def __init__(self, scheduler, state, entry):
+        self.key = state.key
+        self._scheduler = scheduler
+        self._state = state
+        self._entry = entry
+
+    def report(self, tokens):
+        """Replace the token estimate with what the request actually used."""
+        with self._scheduler._lock:
+            self._entry[1] = tokens
+
+
+class KeyScheduler:
+    def __init__(self, keys, rpm=GEMINI_KEY_RPM, tpm=GEMINI_KEY_TPM, backoff=GEMINI_KEY_BACKOFF,
+                 max_backoff=GEMINI_KEY_MAX_BACKOFF):
+        keys = [k.strip() for k in keys if k and k.strip()]
+        if not keys:
+            raise ValueError("KeyScheduler needs at least one API key")
+        self.rpm = rpm
+        self.tpm = tpm
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._states = [KeyState(k) for k in dict.fromkeys(keys)]
+        self._by_key = {s.key: s for s in self._states}
+        self._lock = threading.Lock()
+        self.total_wait = 0.0
+
+    @property
+    def key_count(self):
+        return len(self._states)
+
+    def reserve(self, tokens=0):
+        """Book the soonest slot on any key. Returns (lease, seconds to wait before using it)."""
+        with self._lock:
+            now = time.monotonic()
+            state = min(self._states, key=lambda s: s.available_at(now, tokens, self.rpm, self.tpm))
+            start = state.available_at(now, tokens, self.rpm, self.tpm)
+            state.requests.append(start)
+            entry = [start, tokens]
+            state.tokens.append(entry)
+            state.total_requests += 1
+            delay = start - now
+            self.total_wait += delay
+        return KeyLease(self, state, entry), delay
+
+    async def acquire(self, tokens=0):
+        lease, delay = self.reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return lease
+
+    def acquire_sync(self, tokens=0):
+        lease, delay = self.reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+        return lease
+
+    def note_rate_limited(self, key, retry_after=None):
+        """Pause one key after a 429: Retry-After if given, else exponential backoff."""
+        with self._lock:
+            state = self._by_key[key]
+            state.strikes += 1
+            state.rate_limited += 1
+            pause = retry_after if retry_after is not None else self.backoff * 2 ** (state.strikes - 1)
+            pause = min(pause, self.max_backoff)
+            state.blocked_until = max(state.blocked_until, time.monotonic() + pause)
+        logger.warning(f"Gemini key ...{key[-4:]} rate limited, pausing it for {pause:.0f}s")
+
+    def note_success(self, key):
+        with self._lock:
+            self._by_key[key].strikes = 0
+
+    @asynccontextmanager
+    async def lease(self, tokens=0):
+        """Borrow a key for one request; a 429 raised inside backs that key off."""
+        lease = await self.acquire(tokens)
+        try:
+            yield lease
+        except Exception as e:
+            if is_rate_limit_error(e):
+                self.note_rate_limited(lease.key)
+            raise
+        self.note_success(lease.key)
+
+    @contextmanager
+    def lease_sync(self, tokens=0):
+        lease = self.acquire_sync(tokens)
+        try:
+            yield lease
+        except Exception as e:
+            if is_rate_limit_error(e):
+                self.note_rate_limited(lease.key)
+            raise
+        self.note_success(lease.key)
+
+    def log_stats(self):
+        requests = sum(s.total_requests for s in self._states)
+        limited = sum(s.rate_limited for s in self._states)
+        logger.info(f"Key scheduler: {requests} requests over {len(self._states)} keys, "
+                    f"{limited} rate limited, {self.total_wait:.1f}s spent waiting for quota")
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_key_scheduler(keys=None):
+    """Return the process-wide key scheduler, created from `keys` (or $GEMINI_API_KEYS) on first use."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            if keys is None:
+                keys = os.getenv('GEMINI_API_KEYS', '').split(',')
+            _scheduler = KeyScheduler(keys)
+        return _scheduler
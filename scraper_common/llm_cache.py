@@ -0,0 +1,170 @@
+# llm_cache.py - persistent cache of parsed Gemini extraction results
+#
+# Most schools' pages don't change between runs, so re-sending the same HTML or
+# screenshot to Gemini just burns tokens and time. Entries are keyed on
+#     sha256(normalized inputs) + prompt id + prompt version + model name
+# and hold the parsed JSON result. The inputs include the rendered prompt, so
+# per-school details (name, URL, year) are part of the key. Each prompt keeps
+# a *_PROMPT_VERSION constant next to its text. Bumping it moves that prompt to
+# a fresh folder and leaves every other prompt's entries alone.
+#
+# Only successful extractions are kept. A "success": false reply (bot
+# detection, incomplete data, a page that was still loading) may not be the
+# page's last word, so it is never stored, and one left over from an older
+# run counts as a miss.
+#
+#     cache = get_llm_cache()
+#     key = cache.key(STAFF_PROMPT_ID, STAFF_PROMPT_VERSION, 'gemini-1.5-flash', [prompt, html])
+#     result = cache.get(key)
+#     if result is None:
+#         reply = await model_client.generate('gemini-1.5-flash', [prompt, html],
+#                                             generation_config=json_config(STAFF_SCHEMA), stream=True,
+#                                             records_key='coachingStaff')
+#         result = reply.parsed.data
+#         if reply.parsed.complete:
+#             cache.put(key, result)
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+
+from .config import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+_COMMENT_RE = re.compile(r'<!--.*?-->', re.S)
+# Attributes that change on every page load without changing the content
+_VOLATILE_ATTR_RE = re.compile(r'\s(?:nonce|data-csrf|csrf-token|data-request-id)="[^"]*"', re.I)
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_text(text):
+    """Drop comments and per-request attributes and collapse whitespace, so re-serialized HTML hashes the same."""
+    text = _COMMENT_RE.sub('', text)
+    text = _VOLATILE_ATTR_RE.sub('', text)
+    return _WHITESPACE_RE.sub(' ', text).strip()
+
+
+def _input_bytes(part):
+    """Bytes that identify one model input: text, raw image bytes or an SDK-style {'mime_type', 'data'} part."""
+    if isinstance(part, dict):
+        data = part.get('data')
+        if isinstance(data, str):
+            # Image parts carry base64 text in some scripts and raw bytes in others
+            data = base64.b64decode(data)
+        return part.get('mime_type', '').encode() + b'\0' + (data or b'')
+    if isinstance(part, (bytes, bytearray)):
+        return bytes(part)
+    return normalize_text(str(part)).encode('utf-8')
+
+
+def input_digest(inputs):
+    """sha256 hex digest of a list of model inputs (text and image parts)."""
+    digest = hashlib.sha256()
+    for part in inputs:
+        data = _input_bytes(part)
+        digest.update(len(data).to_bytes(8, 'big'))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def _failed(result):
+    return isinstance(result, dict) and result.get('success') is False
+
+
+class CacheKey:
+    def __init__(self, prompt_id, prompt_version, model, digest):
+        self.prompt_id = prompt_id
+        self.prompt_version = prompt_version
+        self.model = model
+        self.digest = digest
+
+    def __str__(self):
+        return f"{self.prompt_id}@v{self.prompt_version}/{self.model}/{self.digest[:12]}"
+
+
+class LLMCache:
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir or os.path.join(CACHE_DIR, 'llm')
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, prompt_id, prompt_version, model, inputs):
+        return CacheKey(prompt_id, prompt_version, model, input_digest(inputs))
+
+    def _version_dir(self, prompt_id, prompt_version):
+        return os.path.join(self.cache_dir, prompt_id, f"v{prompt_version}")
+
+    def _path(self, key):
+        # SDK model names look like 'models/gemini-1.5-flash'
+        model_dir = key.model.replace('/', '_')
+        folder = os.path.join(self._version_dir(key.prompt_id, key.prompt_version), model_dir, key.digest[:2])
+        return os.path.join(folder, key.digest + '.json')
+
+    def get(self, key):
+        """Cached result for `key`, or None."""
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+        if entry is None or _failed(entry['result']):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        logger.info(f"LLM cache hit for {key}")
+        return entry['result']
+
+    def put(self, key, result):
+        """Store `result` for `key`, unless it is a failed extraction."""
+        if _failed(result):
+            logger.debug(f"Not caching failed extraction for {key}")
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {
+            'prompt_id': key.prompt_id,
+            'prompt_version': key.prompt_version,
+            'model': key.model,
+            'stored_at': time.time(),
+            'result': result,
+        }
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def prune(self, prompt_id, current_version):
+        """Delete a prompt's entries from every version except `current_version`."""
+        prompt_dir = os.path.join(self.cache_dir, prompt_id)
+        if not os.path.isdir(prompt_dir):
+            return
+        for name in os.listdir(prompt_dir):
+            if name != f"v{current_version}":
+                shutil.rmtree(os.path.join(prompt_dir, name), ignore_errors=True)
+                logger.info(f"Pruned stale LLM cache entries for {prompt_id} {name}")
+
+    def log_stats(self):
+        logger.info(f"LLM cache: {self.hits} hits, {self.misses} misses")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    """Return the process-wide LLM result cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache()
+        return _cache
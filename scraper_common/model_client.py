@@ -0,0 +1,289 @@
+# model_client.py - one async Gemini client shared by every scraper in the process
+#
+# The SDK paths mixed blocking generate_content() inside async pipelines,
+# asyncio.to_thread() wrappers and genai.configure(), which sets the API key
+# for the whole process, so concurrent calls could go out on each other's key.
+# ModelClient talks to the REST API directly with aiohttp, passing each call's
+# key in its own request header. Like the fetch engine, it runs its own event
+# loop on a daemon thread, so it works the same from asyncio.run() in worker
+# threads, from the main loop and from sync code.
+#
+# Every call takes a lease from the key scheduler (quota and 429 backoff) and
+# holds one of key_count * GEMINI_KEY_IN_FLIGHT slots, so ten schools in flight
+# means ten overlapping model calls as long as the keys have quota. A 429 or
+# 5xx is retried, on whichever key the scheduler picks next, up to
+# GEMINI_MAX_ATTEMPTS times.
+#
+#     client = get_model_client(GEMINI_API_KEYS)
+#     reply = await client.generate('gemini-1.5-flash', [prompt, page_text],
+#                                   generation_config=json_config(ROSTER_SCHEMA), stream=True, records_key='players')
+#     if reply.parsed.usable:
+#         data = reply.parsed.data
+#     # reply.text, reply.input_tokens, reply.output_tokens
+
+import asyncio
+import atexit
+import base64
+import json
+import logging
+import threading
+import time
+
+import aiohttp
+
+from .config import GEMINI_API_BASE, GEMINI_KEY_IN_FLIGHT, GEMINI_TIMEOUT, GEMINI_MAX_ATTEMPTS
+from .json_stream import consume_stream
+from .key_scheduler import get_key_scheduler
+from .token_estimator import get_token_estimator
+
+logger = logging.getLogger(__name__)
+
+
+class ModelError(Exception):
+    """Non-200 reply from the generative API. `status` is the HTTP status (429 = rate limited)."""
+
+    def __init__(self, status, message):
+        super().__init__(f"Gemini API error {status}: {message[:300]}")
+        self.status = status
+
+
+class ModelReply:
+    def __init__(self, text, usage_metadata=None, finish_reason=None, parsed=None, latency=0.0):
+        self.text = text
+        self.usage_metadata = usage_metadata  # REST usageMetadata dict, read by TokenEstimator.usage()
+        self.finish_reason = finish_reason
+        self.parsed = parsed  # json_stream.StreamResult for streamed calls
+        self.latency = latency
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+
+def _rest_part(part):
+    """SDK-style prompt part -> REST part. Image dicts may carry raw bytes or base64 text."""
+    if isinstance(part, str):
+        return {'text': part}
+    if isinstance(part, (bytes, bytearray)):
+        part = {'mime_type': 'image/jpeg', 'data': part}
+    data = part['data']
+    if isinstance(data, (bytes, bytearray)):
+        data = base64.b64encode(data).decode('ascii')
+    return {'inline_data': {'mime_type': part.get('mime_type', 'image/jpeg'), 'data': data}}
+
+
+def _camel(name):
+    head, *rest = name.split('_')
+    return head + ''.join(word.title() for word in rest)
+
+
+def _rest_config(generation_config):
+    # Only the top-level keys: property names inside response_schema are ours
+    return {_camel(k): v for k, v in generation_config.items()}
+
+
+def _candidate(data):
+    """(text, finish reason) of the first candidate of a REST reply (chunk)."""
+    candidates = data.get('candidates') or []
+    if not candidates:
+        return '', None
+    parts = (candidates[0].get('content') or {}).get('parts') or []
+    return ''.join(p.get('text', '') for p in parts), candidates[0].get('finishReason')
+
+
+class _Chunk:
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        self.text = text
+
+
+class _SseEvents:
+    """Async iterator over the text chunks of a streamGenerateContent?alt=sse reply."""
+
+    def __init__(self, response):
+        self.response = response
+        self.usage_metadata = None
+        self.finish_reason = None
+
+    async def __aiter__(self):
+        async for line in self.response.content:
+            line = line.strip()
+            if not line.startswith(b'data:'):
+                continue
+            data = json.loads(line[5:])
+            if data.get('usageMetadata'):
+                self.usage_metadata = data['usageMetadata']
+            text, finish_reason = _candidate(data)
+            if finish_reason:
+                self.finish_reason = finish_reason
+            if text:
+                yield _Chunk(text)
+
+
+class ModelClient:
+    def __init__(self, scheduler, base=GEMINI_API_BASE, in_flight=None, timeout=GEMINI_TIMEOUT,
+                 max_attempts=GEMINI_MAX_ATTEMPTS):
+        self.scheduler = scheduler
+        self.base = base.rstrip('/')
+        self.in_flight = in_flight or scheduler.key_count * GEMINI_KEY_IN_FLIGHT
+        self.timeout = timeout
+        self.max_attempts = max(1, max_attempts)
+        self._loop = None
+        self._thread = None
+        self._session = None
+        self._semaphore = None
+        self._start_lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.active = 0
+        self.peak_active = 0
+
+    # ---------------- event loop thread ----------------
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                ready = threading.Event()
+                self._thread = threading.Thread(target=self._run_loop, args=(ready,), name='model-client', daemon=True)
+                self._thread.start()
+                ready.wait()
+        return self._loop
+
+    def _run_loop(self, ready):
+        asyncio.set_event_loop(self._loop)
+        self._loop.call_soon(ready.set)
+        self._loop.run_forever()
+
+    def _submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_started())
+
+    def _get_session(self):
+        # Only ever called on the client loop
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.in_flight, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+            self._semaphore = asyncio.Semaphore(self.in_flight)
+        return self._session
+
+    # ---------------- requests ----------------
+
+    async def _post(self, model, body, key, stream, records_key, on_record):
+        session = self._get_session()
+        method = 'streamGenerateContent' if stream else 'generateContent'
+        url = f"{self.base}/models/{model}:{method}"
+        params = {'alt': 'sse'} if stream else None
+        start = time.perf_counter()
+        async with session.post(url, json=body, params=params, headers={'x-goog-api-key': key}) as response:
+            if response.status != 200:
+                raise ModelError(response.status, await response.text())
+            if stream:
+                events = _SseEvents(response)
+                parsed = await consume_stream(events, records_key, on_record)
+                return ModelReply(parsed.text, events.usage_metadata, events.finish_reason, parsed,
+                                  time.perf_counter() - start)
+            data = await response.json(content_type=None)
+        text, finish_reason = _candidate(data)
+        return ModelReply(text, data.get('usageMetadata'), finish_reason, latency=time.perf_counter() - start)
+
+    async def _generate(self, model, parts, generation_config, stream, records_key, on_record):
+        model = model.split('/')[-1]
+        estimator = get_token_estimator(model)
+        body = {'contents': [{'role': 'user', 'parts': [_rest_part(p) for p in parts]}]}
+        if generation_config:
+            body['generationConfig'] = _rest_config(generation_config)
+        self._get_session()
+        async with self._semaphore:
+            self.active += 1
+            self.peak_active = max(self.peak_active, self.active)
+            try:
+                for attempt in range(1, self.max_attempts + 1):
+                    try:
+                        async with self.scheduler.lease(estimator.budget(parts)) as lease:
+                            reply = await self._post(model, body, lease.key, stream, records_key, on_record)
+                            reply.input_tokens, reply.output_tokens = estimator.usage(reply, parts, reply.text)
+                            lease.report(reply.input_tokens + reply.output_tokens)
+                    except (ModelError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                        status = getattr(e, 'status', None)
+                        retryable = status is None or status == 429 or status >= 500
+                        if not retryable or attempt == self.max_attempts:
+                            self.errors += 1
+                            raise
+                        self.retries += 1
+                        logger.info(f"Gemini call failed ({e}), attempt {attempt + 1}/{self.max_attempts}")
+                        if status != 429:
+                            await asyncio.sleep(attempt)  # 429s are backed off per key by the scheduler
+                        continue
+                    self.calls += 1
+                    self.total_latency += reply.latency
+                    return reply
+            finally:
+                self.active -= 1
+
+    # ---------------- public API ----------------
+
+    async def generate(self, model, parts, generation_config=None, stream=False, records_key=None, on_record=None):
+        """One model call from any event loop. Returns a ModelReply.
+
+        With stream=True the reply is read through json_stream (records_key and
+        on_record as in consume_stream) and reply.parsed holds the StreamResult.
+        on_record runs on the client's thread.
+        """
+        return await asyncio.wrap_future(
+            self._submit(self._generate(model, parts, generation_config, stream, records_key, on_record)))
+
+    def generate_sync(self, model, parts, generation_config=None, stream=False, records_key=None, on_record=None):
+        """Blocking variant for synchronous code paths."""
+        return self._submit(self._generate(model, parts, generation_config, stream, records_key, on_record)).result()
+
+    def log_stats(self):
+        average = self.total_latency / self.calls if self.calls else 0.0
+        logger.info(f"Model client: {self.calls} calls, {self.retries} retries, {self.errors} failed, "
+                    f"avg latency {average:.2f}s, peak {self.peak_active} in flight (limit {self.in_flight})")
+
+    def close(self):
+        with self._start_lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+
+        async def _close_session():
+            if self._session is not None and not self._session.closed:
+                await self._session.close()
+
+        try:
+            asyncio.run_coroutine_threadsafe(_close_session(), loop).result(timeout=10)
+        except Exception as e:
+            logger.debug(f"Error closing model client session: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join(timeout=10)
+        loop.close()
+        self._session = None
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_model_client(keys=None):
+    """Return the process-wide model client, on the key scheduler for `keys` (see get_key_scheduler)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ModelClient(get_key_scheduler(keys))
+        return _client
+
+
+def close_model_client():
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client is not None:
+        client.log_stats()
+        client.close()
+
+
+atexit.register(close_model_client)
@@ -0,0 +1,124 @@
+# page_settle.py - wait for lazy-loaded content by watching the page, not the clock
+#
+# Instead of "scroll 10 times and sleep 3 s each", keep scrolling to the bottom
+# and stop as soon as the page has been quiet for SETTLE_QUIET_PERIOD: no DOM
+# mutations, no scroll-height change and no network requests in flight.
+# SETTLE_MAX_WAIT caps the wait on pages that never go quiet (tickers,
+# carousels, analytics beacons). Both helpers return the settle time in seconds.
+
+import asyncio
+import logging
+import time
+
+from .config import SETTLE_MAX_WAIT, SETTLE_QUIET_PERIOD, SETTLE_POLL_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Requests open longer than this (long-polling, streaming video) don't hold the page up
+STALE_REQUEST_AGE = 5.0
+
+# Installs a mutation counter once, optionally scrolls to the bottom and returns
+# [mutation count, scroll height, finished resource count].
+POLL_SCRIPT = """
+(scroll) => {
+    if (!window.__settleState) {
+        window.__settleState = {mutations: 0};
+        new MutationObserver((records) => { window.__settleState.mutations += records.length; })
+            .observe(document, {childList: true, subtree: true, characterData: true});
+    }
+    const body = document.body || document.documentElement;
+    if (scroll) { window.scrollTo(0, body.scrollHeight); }
+    return [window.__settleState.mutations, body.scrollHeight,
+            performance.getEntriesByType('resource').length];
+}
+"""
+
+# Selenium's execute_script takes a function body, not a function
+SELENIUM_POLL_SCRIPT = f"return ({POLL_SCRIPT.strip()})(arguments[0]);"
+
+
+class _QuietTracker:
+    def __init__(self, quiet_period):
+        self.quiet_period = quiet_period
+        self.last_state = None
+        self.last_change = time.perf_counter()
+
+    def update(self, state, network_busy=False):
+        now = time.perf_counter()
+        if state != self.last_state or network_busy:
+            self.last_state = state
+            self.last_change = now
+        return now - self.last_change >= self.quiet_period
+
+
+async def settle_page(page, max_wait=SETTLE_MAX_WAIT, quiet_period=SETTLE_QUIET_PERIOD,
+                      poll_interval=SETTLE_POLL_INTERVAL, scroll=True):
+    """Scroll a Playwright page until it stops changing. Returns seconds spent."""
+    start = time.perf_counter()
+    in_flight = {}
+
+    def on_request(request):
+        in_flight[request] = time.perf_counter()
+
+    def on_done(request):
+        in_flight.pop(request, None)
+
+    page.on('request', on_request)
+    page.on('requestfinished', on_done)
+    page.on('requestfailed', on_done)
+    tracker = _QuietTracker(quiet_period)
+    timed_out = False
+    try:
+        while True:
+            state = tuple(await page.evaluate(POLL_SCRIPT, scroll))
+            now = time.perf_counter()
+            busy = any(now - started < STALE_REQUEST_AGE for started in in_flight.values())
+            if tracker.update(state, busy):
+                break
+            if now - start >= max_wait:
+                timed_out = True
+                break
+            await asyncio.sleep(poll_interval)
+        if scroll:
+            await page.evaluate("window.scrollTo(0, 0)")
+    finally:
+        page.remove_listener('request', on_request)
+        page.remove_listener('requestfinished', on_done)
+        page.remove_listener('requestfailed', on_done)
+
+    elapsed = time.perf_counter() - start
+    _log_settle(page.url, elapsed, timed_out)
+    return elapsed
+
+
+def settle_driver(driver, max_wait=SETTLE_MAX_WAIT, quiet_period=SETTLE_QUIET_PERIOD,
+                  poll_interval=SETTLE_POLL_INTERVAL, scroll=True):
+    """Selenium version. Blocking - call it via asyncio.to_thread() from async code.
+
+    WebDriver can't see in-flight requests, so finished resource timing entries
+    stand in for network activity: the page is quiet once no new ones appear.
+    """
+    start = time.perf_counter()
+    tracker = _QuietTracker(quiet_period)
+    timed_out = False
+    while True:
+        state = tuple(driver.execute_script(SELENIUM_POLL_SCRIPT, scroll))
+        if tracker.update(state):
+            break
+        if time.perf_counter() - start >= max_wait:
+            timed_out = True
+            break
+        time.sleep(poll_interval)
+    if scroll:
+        driver.execute_script("window.scrollTo(0, 0);")
+
+    elapsed = time.perf_counter() - start
+    _log_settle(driver.current_url, elapsed, timed_out)
+    return elapsed
+
+
+def _log_settle(url, elapsed, timed_out):
+    if timed_out:
+        logger.info(f"Page did not settle within {elapsed:.1f}s, continuing anyway: {url}")
+    else:
+        logger.info(f"Page settled in {elapsed:.2f}s: {url}")
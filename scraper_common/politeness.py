@@ -0,0 +1,150 @@
+# politeness.py - per-host token-bucket scheduler for fetches and browser navigations
+#
+# Every request to a site first reserves a token from the bucket of its
+# registrable domain (so www.goheels.com and static.goheels.com share one
+# budget). Buckets refill at a configurable rate, and a Retry-After from the
+# server pauses the whole domain. This replaces the random.uniform() sleeps that
+# used to be scattered through the scrapers.
+
+import asyncio
+import logging
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+from .config import HOST_RATE, HOST_BURST, HOST_RATES, HOST_MAX_RETRY_AFTER
+
+logger = logging.getLogger(__name__)
+
+# Public suffixes with more than one label that show up in our data
+MULTI_LABEL_SUFFIXES = {
+    'co.uk', 'ac.uk', 'org.uk', 'com.au', 'edu.au', 'co.nz', 'ac.nz', 'co.jp', 'ac.jp',
+    'com.mx', 'edu.mx', 'co.ca', 'k12.ca.us', 'cc.ca.us', 'com.br', 'edu.br',
+}
+
+
+def registrable_domain(url):
+    host = (urlsplit(url).hostname or url).lower().rstrip('.')
+    labels = host.split('.')
+    if len(labels) <= 2 or host.replace('.', '').isdigit():
+        return host
+    for size in (3, 2):
+        if '.'.join(labels[-size:]) in MULTI_LABEL_SUFFIXES and len(labels) > size:
+            return '.'.join(labels[-(size + 1):])
+    return '.'.join(labels[-2:])
+
+
+def parse_host_rates(value):
+    rates = {}
+    for item in value.split(','):
+        if '=' in item:
+            host, rate = item.split('=', 1)
+            rates[host.strip().lower()] = float(rate)
+    return rates
+
+
+def parse_retry_after(value):
+    """Retry-After is either a number of seconds or an HTTP date."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def reserve(self, now):
+        """Take one token and return how long the caller has to wait for it.
+
+        Tokens may go negative: that is the queue of callers already waiting.
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        wait_for_token = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait_for_token, self.blocked_until - now, 0.0)
+
+
+class HostScheduler:
+    def __init__(self, default_rate=HOST_RATE, default_burst=HOST_BURST, host_rates=None,
+                 max_retry_after=HOST_MAX_RETRY_AFTER):
+        self.default_rate = default_rate
+        self.default_burst = default_burst
+        self.host_rates = host_rates if host_rates is not None else parse_host_rates(HOST_RATES)
+        self.max_retry_after = max_retry_after
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.total_wait = 0.0
+
+    def _bucket(self, domain):
+        bucket = self._buckets.get(domain)
+        if bucket is None:
+            rate = self.host_rates.get(domain, self.default_rate)
+            bucket = TokenBucket(rate, max(1.0, self.default_burst))
+            self._buckets[domain] = bucket
+        return bucket
+
+    def reserve(self, url):
+        domain = registrable_domain(url)
+        with self._lock:
+            delay = self._bucket(domain).reserve(time.monotonic())
+            self.total_wait += delay
+        return delay
+
+    async def acquire(self, url):
+        """Wait until the host of `url` may be hit again. Safe from any event loop or thread."""
+        delay = self.reserve(url)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def acquire_sync(self, url):
+        delay = self.reserve(url)
+        if delay > 0:
+            time.sleep(delay)
+
+    def note_retry_after(self, url, value, default=30.0):
+        """Pause the host after a 429/503. `value` is the raw Retry-After header (may be None)."""
+        seconds = parse_retry_after(value)
+        if seconds is None:
+            seconds = default
+        seconds = min(seconds, self.max_retry_after)
+        domain = registrable_domain(url)
+        with self._lock:
+            bucket = self._bucket(domain)
+            now = time.monotonic()
+            bucket.blocked_until = max(bucket.blocked_until, now + seconds)
+            bucket.tokens = min(bucket.tokens, 0.0)
+        logger.warning(f"{domain} asked us to back off, pausing it for {seconds:.0f}s")
+
+    def note_response(self, url, status, headers):
+        if status in (429, 503):
+            # Playwright hands back lower-cased header dicts
+            retry_after = (headers.get('Retry-After') or headers.get('retry-after')) if headers else None
+            self.note_retry_after(url, retry_after)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_host_scheduler():
+    """Return the process-wide host scheduler."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = HostScheduler()
+        return _scheduler
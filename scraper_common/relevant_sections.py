@@ -0,0 +1,288 @@
+# relevant_sections.py - cut a page down to the sections that mention what we're extracting
+#
+# Sending a whole staff directory to Gemini costs tens of thousands of tokens for
+# the four softball coaches on it. extract_sections() parses the page with lxml,
+# drops scripts/navigation and most attributes, and makes one bottom-up pass that
+# totals, for every element, its size and signals: keyword hits, companion words
+# ('coach'), contact details (mailto/tel links, emails, phone numbers), table rows
+# and person-card containers. Each keyword hit then maps to the smallest section
+# around it that carries those signals:
+#   - in a table row: the rows up to the next group header row,
+#   - in a heading: the siblings up to the next heading of the same level,
+#   - otherwise: the lowest ancestor with a companion word and contact details.
+# Sections are ranked by signal density and packed into a token budget.
+#
+#     excerpt = extract_sections(html, ['softball'], ['coach'], render=compact_elements)
+#     reply = await model_client.generate(model, [prompt, excerpt.text], generation_config=json_config(STAFF_SCHEMA))
+
+import logging
+import re
+
+from lxml import etree, html as lxml_html
+
+from .config import RELEVANT_TOKEN_BUDGET
+
+logger = logging.getLogger(__name__)
+
+DROP_TAGS = ('script', 'style', 'noscript', 'template', 'svg', 'iframe', 'canvas', 'video', 'audio',
+             'form', 'select', 'button', 'nav', 'footer')
+KEEP_ATTRS = ('href', 'colspan', 'rowspan', 'alt')
+CHARS_PER_TOKEN = 3.5  # serialized, attribute-stripped HTML
+MAX_GROUP_ROWS = 60
+GROW_FACTOR = 1.5  # climb through wrappers that add less than this much size
+
+_EMAIL_RE = re.compile(r'[\w.+-]+@[\w-]+\.[\w.-]+')
+_PHONE_RE = re.compile(r'\(?\d{3}\)?[\s.-]\d{3}[.-]\d{4}')
+_CARD_RE = re.compile(r'staff|coach|bio|person|people|member|profile|card|directory|roster', re.I)
+_HREF_KEEP_RE = re.compile(r'^(?:mailto:|tel:|https?://(?:www\.)?(?:twitter|x)\.com/)', re.I)
+_HEADING_TAGS = ('h1', 'h2', 'h3', 'h4', 'h5', 'h6')
+
+# Indices into an element's signal vector
+CHARS, KEYWORD, COMPANION, CONTACT, ROWS, CARDS = range(6)
+
+
+class Excerpt:
+    def __init__(self, text, sections, tokens, page_tokens):
+        self.text = text
+        self.sections = sections
+        self.tokens = tokens
+        self.page_tokens = page_tokens
+
+    @property
+    def matched(self):
+        return self.sections > 0
+
+
+def approx_tokens(chars):
+    return int(chars / CHARS_PER_TOKEN)
+
+
+def _keep_attr(name, value):
+    return name in KEEP_ATTRS and (name != 'href' or _HREF_KEEP_RE.match(value))
+
+
+def parse_html(html):
+    """lxml tree of a page with scripts, navigation and comments removed."""
+    root = lxml_html.fromstring(html) if html and html.strip() else lxml_html.fromstring('<html><body></body></html>')
+    etree.strip_elements(root, etree.Comment, etree.ProcessingInstruction, *DROP_TAGS, with_tail=False)
+    return root
+
+
+def _count(text, keywords, companions):
+    lowered = text.lower()
+    return (
+        sum(lowered.count(k) for k in keywords),
+        sum(lowered.count(c) for c in companions),
+        len(_EMAIL_RE.findall(text)) + len(_PHONE_RE.findall(text)),
+    )
+
+
+def _is_group_row(row):
+    cells = [c for c in row if isinstance(c.tag, str) and c.tag in ('td', 'th')]
+    return any(c.tag == 'th' for c in cells) or (len(cells) == 1 and int(cells[0].get('colspan', '1') or 1) > 1)
+
+
+def _row_group(row):
+    rows = [row]
+    for sibling in row.itersiblings():
+        if len(rows) >= MAX_GROUP_ROWS or (isinstance(sibling.tag, str) and _is_group_row(sibling)):
+            break
+        rows.append(sibling)
+    return rows
+
+
+def _heading_group(heading):
+    level = int(heading.tag[1])
+    parts = [heading]
+    for sibling in heading.itersiblings():
+        if len(parts) >= MAX_GROUP_ROWS:
+            break
+        if sibling.tag in _HEADING_TAGS and int(sibling.tag[1]) <= level:
+            break
+        parts.append(sibling)
+    return parts
+
+
+class _Signals:
+    """Bottom-up totals of every element's size and signals, built in one pass."""
+
+    def __init__(self, root, keywords, companions):
+        self.keywords = [k.lower() for k in keywords]
+        self.companions = [c.lower() for c in companions]
+        self.totals = {}
+        self.order = {}
+        self.hits = []
+        elements = [el for el in root.iter() if isinstance(el.tag, str)]
+        for position, el in enumerate(elements):
+            self.order[el] = position
+        # Reverse document order visits every element after all of its descendants
+        for el in reversed(elements):
+            self._visit(el)
+
+    def _visit(self, el):
+        keywords, companions = self.keywords, self.companions
+        totals = self.totals.setdefault(el, [0] * 6)
+        cls = f"{el.get('class', '')} {el.get('id', '')}"
+        if _CARD_RE.search(cls):
+            totals[CARDS] += 1
+        if el.tag == 'tr':
+            totals[ROWS] += 1
+        if el.get('href', '').lower().startswith(('mailto:', 'tel:')):
+            totals[CONTACT] += 1
+        totals[CHARS] += 2 * len(el.tag) + 5 + sum(len(k) + len(v) + 4 for k, v in el.attrib.items() if _keep_attr(k, v))
+
+        if el.text:
+            kw, comp, contact = _count(el.text, keywords, companions)
+            totals[CHARS] += len(el.text.strip())
+            totals[KEYWORD] += kw
+            totals[COMPANION] += comp
+            totals[CONTACT] += contact
+            if kw:
+                self.hits.append(el)
+
+        parent = el.getparent()
+        if parent is None:
+            return
+        parent_totals = self.totals.setdefault(parent, [0] * 6)
+        for i in range(6):
+            parent_totals[i] += totals[i]
+        if el.tail:
+            kw, comp, contact = _count(el.tail, keywords, companions)
+            parent_totals[CHARS] += len(el.tail.strip())
+            parent_totals[KEYWORD] += kw
+            parent_totals[COMPANION] += comp
+            parent_totals[CONTACT] += contact
+            if kw:
+                self.hits.append(parent)
+
+    def group_totals(self, group):
+        summed = [0] * 6
+        for el in group:
+            for i, value in enumerate(self.totals.get(el, ())):
+                summed[i] += value
+        return summed
+
+    def qualifies(self, totals):
+        has_people = totals[CONTACT] > 0 or totals[CARDS] > 0 or totals[ROWS] >= 2
+        return totals[KEYWORD] > 0 and (totals[COMPANION] > 0 or not self.companions) and has_people
+
+    def score(self, totals):
+        signal = 3 * totals[KEYWORD] + totals[COMPANION] + 2 * totals[CONTACT] + totals[CARDS] + 0.5 * totals[ROWS]
+        return signal / (approx_tokens(totals[CHARS]) + 50)
+
+
+def _section_for(el, signals, token_budget):
+    """Smallest group of elements around one keyword hit that looks like the section we want."""
+    row = next((a for a in el.iterancestors() if a.tag == 'tr'), None) if el.tag != 'tr' else el
+    if row is not None and _is_group_row(row):
+        group = _row_group(row)
+        if signals.qualifies(signals.group_totals(group)):
+            return group
+    heading = el if el.tag in _HEADING_TAGS else next(
+        (a for _, a in zip(range(3), el.iterancestors()) if a.tag in _HEADING_TAGS), None)
+    if heading is not None:
+        group = _heading_group(heading)
+        if signals.qualifies(signals.group_totals(group)):
+            return group
+
+    best = None
+    node = el
+    while node is not None and node.tag not in ('body', 'html'):
+        totals = signals.totals[node]
+        if approx_tokens(totals[CHARS]) > token_budget:
+            break
+        if best is None:
+            if signals.qualifies(totals):
+                best = node
+        elif totals[CHARS] <= signals.totals[best][CHARS] * GROW_FACTOR:
+            best = node  # a thin wrapper, usually the section's own container
+        else:
+            break
+        node = node.getparent()
+    return [best] if best is not None else None
+
+
+def _inside(el, group):
+    return el in group or any(a in group for a in el.iterancestors())
+
+
+def _contains(outer, inner):
+    return all(_inside(el, outer) for el in inner)
+
+
+def _contains_strictly(outer, inner):
+    return _contains(outer, inner) and not _contains(inner, outer)
+
+
+def _overlaps(group, chosen):
+    for el in group:
+        if el in chosen or any(a in chosen for a in el.iterancestors()):
+            return True
+    return any(el in chosen_el.iterancestors() for chosen_el in chosen for el in group)
+
+
+def select_sections(root, keywords, companions=(), token_budget=RELEVANT_TOKEN_BUDGET):
+    """Groups of elements (lists, in document order) that best cover the keyword sections within the budget."""
+    signals = _Signals(root, keywords, companions)
+    candidates = []
+    seen = set()
+    for hit in signals.hits:
+        group = _section_for(hit, signals, token_budget)
+        if group is None or group[0] in seen:
+            continue
+        seen.add(group[0])
+        totals = signals.group_totals(group)
+        candidates.append((signals.score(totals), approx_tokens(totals[CHARS]), group))
+
+    # A hit inside another hit's section (a coach row under the "Softball" header
+    # row) must not crowd out the section itself
+    candidates = [c for c in candidates if not any(_contains_strictly(other[2], c[2]) for other in candidates)]
+
+    chosen_groups = []
+    chosen = set()
+    used = 0
+    for score, tokens, group in sorted(candidates, key=lambda c: -c[0]):
+        if used + tokens > token_budget or _overlaps(group, chosen):
+            continue
+        chosen_groups.append(group)
+        chosen.update(group)
+        used += tokens
+    chosen_groups.sort(key=lambda g: signals.order[g[0]])
+    return chosen_groups, signals
+
+
+def _serialize(el):
+    for node in el.iter():
+        if isinstance(node.tag, str):
+            for name in [k for k, v in node.attrib.items() if not _keep_attr(k, v)]:
+                del node.attrib[name]
+    return lxml_html.tostring(el, encoding='unicode', with_tail=False)
+
+
+def _serialize_group(group):
+    return '\n'.join(_serialize(el) for el in group)
+
+
+def extract_sections(html, keywords, companions=(), token_budget=RELEVANT_TOKEN_BUDGET, render=None):
+    """Excerpt of `html` holding the keyword sections; the cleaned body when no section qualifies.
+
+    `render` turns a group of elements into text (compact_html.compact_elements
+    for a plain-text excerpt); the default keeps attribute-stripped HTML.
+    """
+    render = render or _serialize_group
+    root = parse_html(html)
+    groups, signals = select_sections(root, keywords, companions, token_budget)
+    body = root.find('body')
+    if body is None:
+        body = root
+    page_tokens = approx_tokens(signals.totals.get(body, [0])[CHARS])
+
+    if not groups:
+        logger.info(f"No {'/'.join(keywords)} section found, sending the whole page (~{page_tokens} tokens)")
+        text = render([body])
+        return Excerpt(text, 0, approx_tokens(len(text)), page_tokens)
+
+    text = '\n\n---\n\n'.join(render(group) for group in groups)
+    tokens = approx_tokens(len(text))
+    logger.info(f"Relevant sections: {len(groups)} of ~{page_tokens} page tokens -> ~{tokens} tokens")
+    return Excerpt(text, len(groups), tokens, page_tokens)
@@ -0,0 +1,204 @@
+# render_pool.py - Selenium Chrome drivers behind a non-blocking async interface
+#
+# WebDriver calls block. The old per-script WebDriverPools ran driver.get() and
+# execute_script() straight on the event loop, so one slow page stalled every
+# other school and the semaphores bought no real concurrency. Here every driver
+# call runs on a worker thread, so `size` renders really do progress side by side
+# on one event loop. The chromedriver binary is resolved once per process instead
+# of once per driver.
+#
+#     render_pool = RenderPool(size=10, options=chrome_options, block_profile='html')
+#     async with render_pool.driver() as driver:
+#         await driver.get(url)
+#         await driver.settle()
+#         html = await driver.page_source()
+
+import asyncio
+import copy
+import functools
+import logging
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+from webdriver_manager.chrome import ChromeDriverManager
+
+from .config import RENDER_POOL_SIZE, BROWSER_MAX_NAVIGATIONS
+from .page_settle import settle_driver
+from .resource_blocking import chrome_prefs, block_driver_requests
+
+logger = logging.getLogger(__name__)
+
+_driver_path = None
+_driver_path_lock = threading.Lock()
+
+
+def chromedriver_path():
+    """Resolve (downloading if needed) the chromedriver binary once per process."""
+    global _driver_path
+    with _driver_path_lock:
+        if _driver_path is None:
+            _driver_path = ChromeDriverManager().install()
+        return _driver_path
+
+
+def default_chrome_options():
+    options = Options()
+    options.add_argument("--headless=new")
+    options.add_argument("--start-maximized")
+    options.add_argument("--disable-extensions")
+    options.add_argument("--disable-gpu")
+    options.add_experimental_option('excludeSwitches', ['enable-logging'])
+    return options
+
+
+def _quit_driver(driver):
+    try:
+        driver.quit()
+    except Exception as e:
+        logger.debug(f"Error quitting driver: {e}")
+
+
+class AsyncDriver:
+    """Awaitable wrappers around one borrowed driver. `raw` is the Selenium driver itself."""
+
+    def __init__(self, driver, executor):
+        self.raw = driver
+        self._executor = executor
+
+    async def run(self, fn, *args, **kwargs):
+        """Run any blocking call against the driver off the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    async def get(self, url):
+        return await self.run(self.raw.get, url)
+
+    async def execute_script(self, script, *args):
+        return await self.run(self.raw.execute_script, script, *args)
+
+    async def page_source(self):
+        return await self.run(lambda: self.raw.page_source)
+
+    async def screenshot_base64(self):
+        return await self.run(self.raw.get_screenshot_as_base64)
+
+    async def settle(self, **kwargs):
+        return await self.run(settle_driver, self.raw, **kwargs)
+
+
+class DriverSlot:
+    def __init__(self, index):
+        self.index = index
+        self.driver = None
+        self.uses = 0
+        self.broken = False
+
+
+class RenderPool:
+    def __init__(self, size=RENDER_POOL_SIZE, options=None, block_profile=None, user_agents=None,
+                 max_navigations=BROWSER_MAX_NAVIGATIONS, page_load_timeout=None):
+        self.size = size
+        # A copy, so the caller's options (often shared with other pools) don't pick up our prefs
+        self.options = copy.deepcopy(options) if options is not None else default_chrome_options()
+        self.block_profile = block_profile
+        self.user_agents = user_agents
+        self.max_navigations = max_navigations
+        self.page_load_timeout = page_load_timeout
+        if block_profile:
+            self.options.add_experimental_option('prefs', chrome_prefs(block_profile))
+        # One worker per driver: a driver is only ever used by one task at a time
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='render')
+        self._slots = None
+        self.created = 0
+        self.recycled = 0
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def _slot_queue(self):
+        # Created lazily so the queue binds to the loop that actually uses the pool
+        if self._slots is None:
+            self._slots = asyncio.Queue()
+            for i in range(self.size):
+                self._slots.put_nowait(DriverSlot(i))
+        return self._slots
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    def _new_driver(self):
+        options = self.options
+        if self.user_agents:
+            options = copy.deepcopy(options)
+            options.add_argument(f"user-agent={random.choice(self.user_agents)}")
+        driver = webdriver.Chrome(service=Service(chromedriver_path()), options=options)
+        if self.page_load_timeout:
+            driver.set_page_load_timeout(self.page_load_timeout)
+        if self.block_profile:
+            block_driver_requests(driver, self.block_profile)
+        return driver
+
+    async def start(self):
+        """Optional: launch every driver up front instead of on first use."""
+        slots = [await self.acquire() for _ in range(self.size)]
+        for slot in slots:
+            self._slots.put_nowait(slot)
+        logger.info(f"Render pool ready with {self.size} drivers")
+
+    async def acquire(self):
+        slot = await self._slot_queue().get()
+        if slot.driver is None:
+            try:
+                slot.driver = await self._run(self._new_driver)
+            except Exception:
+                self._slots.put_nowait(slot)
+                raise
+            slot.uses = 0
+            slot.broken = False
+            self.created += 1
+        return slot
+
+    async def release(self, slot):
+        slot.uses += 1
+        try:
+            if slot.broken or slot.uses >= self.max_navigations:
+                self.recycled += 1
+                driver, slot.driver = slot.driver, None
+                await self._run(_quit_driver, driver)
+        finally:
+            self._slots.put_nowait(slot)
+
+    @asynccontextmanager
+    async def driver(self):
+        """Borrow a driver for one page. A driver whose use raised is replaced."""
+        slot = await self.acquire()
+        try:
+            yield AsyncDriver(slot.driver, self._executor)
+        except BaseException:
+            slot.broken = True
+            raise
+        finally:
+            await self.release(slot)
+
+    async def close(self):
+        drivers = []
+        if self._slots is not None:
+            while not self._slots.empty():
+                slot = self._slots.get_nowait()
+                if slot.driver is not None:
+                    drivers.append(slot.driver)
+                    slot.driver = None
+            self._slots = None
+        await asyncio.gather(*(self._run(_quit_driver, driver) for driver in drivers))
+        self._executor.shutdown(wait=False)
+        logger.info(f"Render pool closed ({self.created} drivers started, {self.recycled} recycled)")
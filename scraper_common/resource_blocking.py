@@ -0,0 +1,130 @@
+# resource_blocking.py - keep ads, trackers and heavy media out of headless renders
+#
+# Athletics sites pull in dozens of ad/analytics scripts, autoplay video and web
+# fonts. None of it matters to us, so every render path picks a profile:
+#
+#     'html'    - we only read the DOM: block images, media, fonts and trackers
+#     'vision'  - we screenshot the page: keep images, block media and trackers
+#
+# Playwright contexts/pages get a route() handler (block_requests), Selenium
+# drivers get Chrome prefs plus CDP Network.setBlockedURLs (chrome_prefs /
+# block_driver_requests).
+
+import logging
+import threading
+from collections import Counter
+from urllib.parse import urlsplit
+
+from .config import BLOCK_EXTRA_DOMAINS
+
+logger = logging.getLogger(__name__)
+
+# Ad, analytics and social widget hosts seen on the sites we scrape (suffix match)
+BLOCKED_DOMAINS = {
+    'doubleclick.net', 'googlesyndication.com', 'googleadservices.com', 'google-analytics.com',
+    'googletagmanager.com', 'googletagservices.com', 'adservice.google.com', 'adnxs.com',
+    'amazon-adsystem.com', 'criteo.com', 'criteo.net', 'taboola.com', 'outbrain.com',
+    'scorecardresearch.com', 'quantserve.com', 'quantcount.com', 'chartbeat.com', 'chartbeat.net',
+    'hotjar.com', 'newrelic.com', 'nr-data.net', 'segment.io', 'segment.com', 'optimizely.com',
+    'facebook.net', 'connect.facebook.net', 'platform.twitter.com', 'ads-twitter.com',
+    'analytics.tiktok.com', 'bat.bing.com', 'clarity.ms', 'moatads.com', 'pubmatic.com',
+    'rubiconproject.com', 'openx.net', 'casalemedia.com', 'teads.tv', 'adsrvr.org',
+    'krxd.net', 'bluekai.com', 'demdex.net', 'omtrdc.net', 'everesttech.net', 'imrworldwide.com',
+    'onetrust.com', 'cookielaw.org', 'trustarc.com', 'jwpcdn.com', 'jwplayer.com', 'brightcove.net',
+}
+
+PROFILES = {
+    'html': {'resource_types': {'image', 'media', 'font'}, 'block_trackers': True},
+    'vision': {'resource_types': {'media'}, 'block_trackers': True},
+}
+
+# Selenium can only block by URL pattern, so resource types map to file extensions
+TYPE_URL_PATTERNS = {
+    'image': ['*.jpg', '*.jpeg', '*.png', '*.gif', '*.webp', '*.avif', '*.svg', '*.ico'],
+    'media': ['*.mp4', '*.webm', '*.m3u8', '*.ts', '*.mov', '*.mp3', '*.ogg'],
+    'font': ['*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot'],
+}
+
+
+def _blocked_domains():
+    extra = {d.strip().lower() for d in BLOCK_EXTRA_DOMAINS.split(',') if d.strip()}
+    return BLOCKED_DOMAINS | extra
+
+
+def is_blocked_host(url, domains=None):
+    domains = domains if domains is not None else _blocked_domains()
+    host = (urlsplit(url).hostname or '').lower()
+    labels = host.split('.')
+    return any('.'.join(labels[i:]) in domains for i in range(len(labels) - 1))
+
+
+def get_profile(name):
+    if name not in PROFILES:
+        raise ValueError(f"Unknown block profile '{name}', expected one of {sorted(PROFILES)}")
+    return PROFILES[name]
+
+
+class BlockStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.blocked = Counter()
+
+    def record(self, reason=None):
+        with self._lock:
+            if reason is None:
+                self.allowed += 1
+            else:
+                self.blocked[reason] += 1
+
+    def log_stats(self):
+        total = sum(self.blocked.values())
+        breakdown = ', '.join(f"{reason} {count}" for reason, count in self.blocked.most_common())
+        logger.info(f"Resource blocking: {total} requests blocked ({breakdown or 'none'}), {self.allowed} allowed")
+
+
+block_stats = BlockStats()
+
+
+async def block_requests(target, profile):
+    """Install a route handler on a Playwright BrowserContext or Page."""
+    settings = get_profile(profile)
+    blocked_types = settings['resource_types']
+    domains = _blocked_domains() if settings['block_trackers'] else set()
+
+    async def handle(route):
+        request = route.request
+        if request.resource_type in blocked_types:
+            reason = request.resource_type
+        elif domains and is_blocked_host(request.url, domains):
+            reason = 'tracker'
+        else:
+            reason = None
+        block_stats.record(reason)
+        if reason is None:
+            await route.continue_()
+        else:
+            await route.abort()
+
+    await target.route('**/*', handle)
+
+
+def chrome_prefs(profile):
+    """Chrome prefs for Options.add_experimental_option('prefs', ...)."""
+    blocked_types = get_profile(profile)['resource_types']
+    prefs = {}
+    if 'image' in blocked_types:
+        prefs['profile.managed_default_content_settings.images'] = 2
+    return prefs
+
+
+def block_driver_requests(driver, profile):
+    """Block trackers and heavy resource types on a Selenium Chrome driver via CDP."""
+    settings = get_profile(profile)
+    patterns = []
+    for resource_type in settings['resource_types']:
+        patterns.extend(TYPE_URL_PATTERNS.get(resource_type, []))
+    if settings['block_trackers']:
+        patterns.extend(f"*{domain}/*" for domain in sorted(_blocked_domains()))
+    driver.execute_cdp_cmd('Network.enable', {})
+    driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': patterns})
@@ -0,0 +1,150 @@
+# response_cache.py - disk-backed HTTP response cache with conditional revalidation
+#
+# Entries are keyed by the normalized URL and store the body plus the headers
+# needed to revalidate (ETag / Last-Modified). On a rerun the fetch engine sends
+# If-None-Match / If-Modified-Since and a 304 costs a few hundred bytes instead
+# of the whole page.
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from .config import CACHE_DIR, HTTP_CACHE_MAX_AGE
+
+logger = logging.getLogger(__name__)
+
+# Query parameters that never change the page content
+TRACKING_PARAMS = {'fbclid', 'gclid', 'msclkid', 'mc_cid', 'mc_eid', '_ga'}
+
+# Response headers worth keeping alongside the body
+STORED_HEADERS = ['Content-Type', 'ETag', 'Last-Modified', 'Cache-Control', 'Date']
+
+
+def normalize_url(url):
+    """Canonical form of a URL for cache keys (case, default ports, fragments, tracking params)."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    port = parts.port
+    if port and not ((scheme == 'http' and port == 80) or (scheme == 'https' and port == 443)):
+        host = f"{host}:{port}"
+    path = parts.path or '/'
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+             if not k.lower().startswith('utm_') and k.lower() not in TRACKING_PARAMS]
+    return urlunsplit((scheme, host, path, urlencode(sorted(query)), ''))
+
+
+class CachedResponse:
+    def __init__(self, meta, body):
+        self.meta = meta
+        self.body = body
+
+    @property
+    def etag(self):
+        return self.meta['headers'].get('ETag')
+
+    @property
+    def last_modified(self):
+        return self.meta['headers'].get('Last-Modified')
+
+    @property
+    def age(self):
+        return time.time() - self.meta.get('validated_at', self.meta['stored_at'])
+
+    def conditional_headers(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    def __init__(self, cache_dir=None, max_age=HTTP_CACHE_MAX_AGE):
+        self.cache_dir = cache_dir or os.path.join(CACHE_DIR, 'http')
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+    def _paths(self, url):
+        key = hashlib.sha256(normalize_url(url).encode('utf-8')).hexdigest()
+        folder = os.path.join(self.cache_dir, key[:2])
+        return os.path.join(folder, key + '.json'), os.path.join(folder, key + '.body')
+
+    def load(self, url):
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(body_path, 'rb') as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        return CachedResponse(meta, body)
+
+    def is_fresh(self, entry):
+        return self.max_age > 0 and entry.age < self.max_age
+
+    def store(self, url, status, headers, body, encoding=None):
+        """Save a 200 response. Returns False if there is nothing worth caching."""
+        if status != 200:
+            return False
+        if 'no-store' in (headers.get('Cache-Control') or '').lower():
+            return False
+        now = time.time()
+        meta = {
+            'url': normalize_url(url),
+            'status': status,
+            'headers': {name: headers[name] for name in STORED_HEADERS if headers.get(name)},
+            'encoding': encoding,
+            'stored_at': now,
+            'validated_at': now,
+        }
+        meta_path, body_path = self._paths(url)
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        _atomic_write(body_path, body)
+        _atomic_write(meta_path, json.dumps(meta).encode('utf-8'))
+        return True
+
+    def mark_revalidated(self, url, entry, headers):
+        """A 304 came back: bump the timestamp and pick up any refreshed validators."""
+        entry.meta['validated_at'] = time.time()
+        for name in ('ETag', 'Last-Modified', 'Cache-Control', 'Date'):
+            if headers.get(name):
+                entry.meta['headers'][name] = headers[name]
+        meta_path, _ = self._paths(url)
+        _atomic_write(meta_path, json.dumps(entry.meta).encode('utf-8'))
+
+    def count(self, outcome):
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def log_stats(self):
+        logger.info(f"Response cache: {self.hits} fresh hits, {self.revalidated} revalidated (304), {self.misses} full downloads")
+
+
+def _atomic_write(path, data):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Return the process-wide response cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
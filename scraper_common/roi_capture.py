@@ -0,0 +1,155 @@
+# roi_capture.py - screenshot only the parts of a page the model needs to read
+#
+# A staff directory lists every sport and the softball block is a small slice of
+# it; a majors page is mostly navigation and marketing. capture_regions() finds
+# the DOM regions around keyword matches (the table rows under a "Softball"
+# header, the list under a "Majors" heading, ...) plus any explicit selectors,
+# merges nearby boxes and screenshots each one with a clip. JPEG quality drops
+# as the region grows: small crops keep fine print legible, huge ones don't need
+# quality 100 to be read. Falls back to one full-page capture when nothing
+# matches or the regions would cover most of the page anyway.
+
+import logging
+
+from .config import ROI_PADDING, ROI_MERGE_GAP, ROI_MAX_REGIONS, ROI_MAX_COVERAGE, ROI_MAX_QUALITY, ROI_MIN_QUALITY
+
+logger = logging.getLogger(__name__)
+
+# Returns {rects: [{x, y, width, height}], pageWidth, pageHeight} in page coordinates.
+# A match inside a table row takes the rows up to the next group header row; a
+# match in a heading takes the siblings up to the next heading; anything else
+# climbs to the nearest list/table/section or block taller than minHeight.
+FIND_REGIONS_SCRIPT = """
+({keywords, selectors, minHeight, maxRows}) => {
+    const rects = [];
+    const seen = new Set();
+    const unionRect = (elements) => {
+        let top = Infinity, left = Infinity, bottom = -Infinity, right = -Infinity;
+        for (const el of elements) {
+            const r = el.getBoundingClientRect();
+            if (r.width < 2 || r.height < 2) continue;
+            top = Math.min(top, r.top); left = Math.min(left, r.left);
+            bottom = Math.max(bottom, r.bottom); right = Math.max(right, r.right);
+        }
+        if (top === Infinity) return null;
+        return {x: left + window.scrollX, y: top + window.scrollY, width: right - left, height: bottom - top};
+    };
+    const add = (key, elements) => {
+        if (!key || seen.has(key)) return;
+        seen.add(key);
+        const rect = unionRect(elements);
+        if (rect && rect.width >= 10 && rect.height >= 10) rects.push(rect);
+    };
+    const isGroupRow = (row) => row.querySelector('th') !== null ||
+        (row.cells.length === 1 && row.cells[0].colSpan > 1);
+    const rowSection = (row) => {
+        const rows = [row];
+        let next = row.nextElementSibling;
+        while (next && rows.length < maxRows && !isGroupRow(next)) { rows.push(next); next = next.nextElementSibling; }
+        return rows;
+    };
+    const headingSection = (heading) => {
+        const level = Number(heading.tagName[1]);
+        const parts = [heading];
+        let next = heading.nextElementSibling;
+        while (next && parts.length < maxRows) {
+            if (/^H[1-6]$/.test(next.tagName) && Number(next.tagName[1]) <= level) break;
+            parts.push(next);
+            next = next.nextElementSibling;
+        }
+        return parts;
+    };
+    const blockOf = (el) => {
+        let node = el;
+        while (node && node !== document.body) {
+            if (['TABLE', 'UL', 'OL', 'DL', 'SECTION', 'ARTICLE'].includes(node.tagName) ||
+                node.getBoundingClientRect().height >= minHeight) return node;
+            node = node.parentElement;
+        }
+        return null;
+    };
+
+    for (const selector of selectors) {
+        document.querySelectorAll(selector).forEach((el) => add(el, [el]));
+    }
+    if (keywords.length && document.body) {
+        const lowered = keywords.map((k) => k.toLowerCase());
+        const walker = document.createTreeWalker(document.body, NodeFilter.SHOW_TEXT);
+        let node;
+        while ((node = walker.nextNode())) {
+            const text = node.textContent.toLowerCase();
+            if (!lowered.some((k) => text.includes(k))) continue;
+            const parent = node.parentElement;
+            if (!parent || parent.closest('nav, header, footer, script, style, noscript, [role=navigation], [aria-hidden=true]')) continue;
+            const row = parent.closest('tr');
+            const heading = parent.closest('h1, h2, h3, h4, h5, h6');
+            if (row) add(row, rowSection(row));
+            else if (heading) add(heading, headingSection(heading));
+            else { const block = blockOf(parent); add(block, block ? [block] : []); }
+        }
+    }
+    const doc = document.documentElement;
+    return {rects, pageWidth: doc.scrollWidth, pageHeight: doc.scrollHeight};
+}
+"""
+
+
+def merge_regions(rects, page_width, page_height, padding=ROI_PADDING, gap=ROI_MERGE_GAP):
+    """Pad, clamp and merge boxes that overlap or sit within `gap` px of each other vertically."""
+    boxes = []
+    for r in sorted(rects, key=lambda r: r['y']):
+        left = max(0, r['x'] - padding)
+        top = max(0, r['y'] - padding)
+        right = min(page_width, r['x'] + r['width'] + padding)
+        bottom = min(page_height, r['y'] + r['height'] + padding)
+        if right <= left or bottom <= top:
+            continue
+        if boxes and top <= boxes[-1][3] + gap:
+            prev = boxes[-1]
+            boxes[-1] = [min(prev[0], left), prev[1], max(prev[2], right), max(prev[3], bottom)]
+        else:
+            boxes.append([left, top, right, bottom])
+    return [{'x': l, 'y': t, 'width': r - l, 'height': b - t} for l, t, r, b in boxes]
+
+
+def adaptive_quality(width, height, max_quality=ROI_MAX_QUALITY, min_quality=ROI_MIN_QUALITY):
+    """JPEG quality for a region: max_quality up to 1 MP, sliding down to min_quality at 8 MP."""
+    megapixels = width * height / 1_000_000
+    if megapixels <= 1:
+        return max_quality
+    if megapixels >= 8:
+        return min_quality
+    return int(round(max_quality - (max_quality - min_quality) * (megapixels - 1) / 7))
+
+
+async def capture_regions(page, keywords=(), selectors=(), min_height=200, max_rows=60,
+                          max_regions=ROI_MAX_REGIONS, max_coverage=ROI_MAX_COVERAGE):
+    """Screenshot the regions of a Playwright page around `keywords` / `selectors`.
+
+    Returns a list of JPEG images in page order (a single full-page image when
+    no region qualifies).
+    """
+    found = await page.evaluate(FIND_REGIONS_SCRIPT, {
+        'keywords': list(keywords), 'selectors': list(selectors),
+        'minHeight': min_height, 'maxRows': max_rows,
+    })
+    page_width, page_height = found['pageWidth'], found['pageHeight']
+    regions = merge_regions(found['rects'], page_width, page_height)[:max_regions]
+    page_area = max(1, page_width * page_height)
+    covered = sum(r['width'] * r['height'] for r in regions) / page_area
+
+    if not regions or covered > max_coverage:
+        quality = adaptive_quality(page_width, page_height)
+        image = await page.screenshot(full_page=True, type='jpeg', quality=quality)
+        logger.info(f"ROI capture: no usable regions on {page.url}, full page at quality {quality} ({len(image) // 1024} KB)")
+        return [image]
+
+    images = []
+    for region in regions:
+        quality = adaptive_quality(region['width'], region['height'])
+        images.append(await page.screenshot(full_page=True, clip=region, type='jpeg', quality=quality))
+    logger.info(
+        f"ROI capture: {len(images)} regions covering {covered:.0%} of {page.url} "
+        f"({sum(len(i) for i in images) // 1024} KB)"
+    )
+    return images
@@ -0,0 +1,351 @@
+# roster_parser.py - pull full player rows out of roster pages without a browser or an LLM
+#
+# The HTML passes used to stop at the player's name (or run a dozen select_one()
+# calls per player on html.parser trees), so most schools went on to a
+# screenshot and a Gemini vision call. parse_roster() parses the page once with
+# lxml and handles the layouts most athletics sites use:
+#   - player cards (Sidearm's li.sidearm-roster-player, the newer s-person-card
+#     and similar): every element of a card is looked up once, by class name
+#     or by its screen-reader label ("Position", "Academic Year", ...),
+#   - roster tables: columns are mapped from the header row ("#", "Pos.", "Yr.",
+#     "Hometown / High School", ...), so column order doesn't matter.
+# It returns number, name, position, class year, hometown, high school and the
+# derived graduation year, plus per-field coverage so callers can tell a
+# complete roster from a partial one and only send the latter to Gemini.
+#
+# extract_roster() first fingerprints the site's CMS (cms_fingerprint.py) and
+# only looks for that template's layouts.
+#
+#     roster, fp = extract_roster(url, response.text())
+#     if roster.complete:
+#         df = pd.DataFrame(roster.players)
+#     logger.info(roster.summary())
+
+import logging
+import re
+import threading
+from collections import Counter
+from datetime import datetime
+
+from lxml import etree
+
+from .cms_fingerprint import ExtractorDispatch
+from .config import ROSTER_MIN_COVERAGE
+from .relevant_sections import parse_html
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('Number', 'Name', 'Position', 'Year', 'Hometown', 'High School')
+CORE_FIELDS = ('Name', 'Position', 'Year', 'Hometown', 'High School')
+MIN_PLAYERS = 5
+
+# Card element class -> field. Classes are matched whole; when two elements of a card map
+# to the same field, the class listed first wins ('-position-long-short' holds just the
+# position, its '-position' wrapper the height too).
+CLASS_FIELDS = {
+    'sidearm-roster-player-jersey-number': 'Number',
+    'sidearm-roster-player-name': 'Name',
+    'sidearm-roster-player-position-long-short': 'Position',
+    'sidearm-roster-player-position': 'Position',
+    'sidearm-roster-player-academic-year': 'Year',
+    'sidearm-roster-player-hometown': 'Hometown',
+    'sidearm-roster-player-highschool': 'High School',
+    'sidearm-roster-player-previous-school': 'High School',
+    's-person-details__personal-single-line': 'Name',
+    's-person-card__content__person__name': 'Name',
+    's-stamp__text': 'Number',
+    'roster-card-item__jersey-number': 'Number',
+    'roster-card-item__title': 'Name',
+    'roster-card-item__position': 'Position',
+    'roster-player-card__name': 'Name',
+    'roster-player-card__number': 'Number',
+    'roster-player-card__position': 'Position',
+    'roster-player-card__year': 'Year',
+    'roster-player-card__hometown': 'Hometown',
+    'roster-player-card__highschool': 'High School',
+}
+_CLASS_RANK = {cls: rank for rank, cls in enumerate(CLASS_FIELDS)}
+CARD_CLASSES = ('sidearm-roster-player', 's-person-card', 'roster-card-item', 'roster-player-card')
+
+# Header or screen-reader label text (lowercased, dots and colons dropped) -> field
+LABEL_FIELDS = {
+    '#': 'Number', 'no': 'Number', 'num': 'Number', 'number': 'Number', 'jersey': 'Number',
+    'jersey number': 'Number',
+    'name': 'Name', 'full name': 'Name', 'player': 'Name', 'first name': '_first', 'last name': '_last',
+    'pos': 'Position', 'position': 'Position', 'position(s)': 'Position',
+    'yr': 'Year', 'year': 'Year', 'cl': 'Year', 'class': 'Year', 'academic year': 'Year', 'eligibility': 'Year',
+    'class year': 'Year', 'elig': 'Year',
+    'hometown': 'Hometown', 'home town': 'Hometown', 'hometown/state': 'Hometown',
+    'high school': 'High School', 'highschool': 'High School', 'previous school': 'High School',
+    'last school': 'High School', 'high school/previous school': 'High School',
+    'high school/last school': 'High School',
+}
+TABLE = 'table'
+# Layouts to look for per CMS fingerprint, in order: card classes and/or TABLE
+ROSTER_LAYOUTS = {
+    'sidearm/classic': ('sidearm-roster-player', TABLE),
+    'sidearm/nextgen': ('s-person-card', TABLE),
+    'sidearm': ('sidearm-roster-player', 's-person-card', TABLE),
+    'wmt/cards': ('roster-card-item', 'roster-player-card'),
+    'wmt': ('roster-card-item', 'roster-player-card', TABLE),
+    'prestosports': (TABLE,),
+    'stretch': (TABLE,),
+}
+
+_LABEL_CLASSES = ('sidearm-visually-hidden', 'visually-hidden', 'sr-only', 'screen-reader-text', 'label')
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_ROSTER_YEAR_RE = re.compile(r'\b(20\d\d)(?:\s*[-–]\s*(?:20)?\d\d)?\b[^.\n]{0,40}?\broster\b', re.I)
+# Class year -> years left after the roster year
+_YEAR_PATTERNS = (
+    (re.compile(r'^(?:r|rs|redshirt)[\s.-]*(?:fr|freshman|first)', re.I), 4),
+    (re.compile(r'^(?:r|rs|redshirt)[\s.-]*(?:so|sophomore|second)', re.I), 3),
+    (re.compile(r'^(?:r|rs|redshirt)[\s.-]*(?:jr|junior|third)', re.I), 2),
+    (re.compile(r'^(?:r|rs|redshirt)[\s.-]*(?:sr|senior|fourth)', re.I), 1),
+    (re.compile(r'^(?:fr|freshman|first|1st)', re.I), 3),
+    (re.compile(r'^(?:so|sophomore|second|2nd)', re.I), 2),
+    (re.compile(r'^(?:jr|junior|third|3rd)', re.I), 1),
+    (re.compile(r'^(?:sr|senior|fourth|4th|gr|grad|graduate|fifth|5th|6th)', re.I), 0),
+)
+
+_cell_path = etree.XPath('./*[self::td or self::th]')
+_table_rows_path = etree.XPath('.//tr')
+_tables_path = etree.XPath('//table')
+_card_paths = [
+    (card_class, etree.XPath(f'//*[contains(concat(" ", normalize-space(@class), " "), " {card_class} ")]'))
+    for card_class in CARD_CLASSES
+]
+
+
+class RosterParse:
+    def __init__(self, players, layout, roster_year):
+        self.players = players
+        self.layout = layout
+        self.roster_year = roster_year
+
+    @property
+    def coverage(self):
+        """Field -> share of players that have it."""
+        if not self.players:
+            return {field: 0.0 for field in FIELDS}
+        counts = Counter(field for player in self.players for field in FIELDS if player.get(field))
+        return {field: counts[field] / len(self.players) for field in FIELDS}
+
+    @property
+    def complete(self):
+        """Enough players, each core field on at least ROSTER_MIN_COVERAGE of them."""
+        coverage = self.coverage
+        return len(self.players) >= MIN_PLAYERS and all(coverage[f] >= ROSTER_MIN_COVERAGE for f in CORE_FIELDS)
+
+    def as_result(self):
+        """The roster in the shape of schemas.ROSTER_SCHEMA, like a successful Gemini extraction."""
+        return {
+            'success': True,
+            'reason': None,
+            'rosterYear': self.roster_year,
+            'players': [{
+                'name': p['Name'],
+                'position': p.get('Position'),
+                'year': p.get('Year'),
+                'hometown': p.get('Hometown'),
+                'highSchool': p.get('High School'),
+                'graduationYear': p.get('Graduation Year'),
+            } for p in self.players],
+        }
+
+    def summary(self):
+        coverage = ', '.join(f"{field} {share:.0%}" for field, share in self.coverage.items())
+        return f"{len(self.players)} players from {self.layout or 'no known layout'} ({coverage})"
+
+
+def _clean(text):
+    return _WHITESPACE_RE.sub(' ', text or '').strip()
+
+
+def _label_key(text):
+    text = _clean(text).lower().replace('.', '').replace(':', '')
+    return re.sub(r'\s*/\s*', '/', text)
+
+
+def _classes(el):
+    return (el.get('class') or '').split()
+
+
+def _is_label(el):
+    return any(c in _LABEL_CLASSES for c in _classes(el))
+
+
+def graduation_year(year, roster_year):
+    """Graduation year from a class year like 'R-So.', 'Junior' or 'Gr.'; None when it can't be read."""
+    year = _clean(year)
+    if not year or not roster_year:
+        return None
+    for pattern, left in _YEAR_PATTERNS:
+        if pattern.match(year):
+            return roster_year + left
+    return None
+
+
+def find_roster_year(root):
+    """Season of a roster page from its title or headings ('2024 Softball Roster'); next season if none."""
+    texts = [root.findtext('.//title') or '']
+    texts.extend(el.text_content() for el in root.iter('h1', 'h2'))
+    for text in texts:
+        match = _ROSTER_YEAR_RE.search(_clean(text))
+        if match:
+            return int(match.group(1))
+    return datetime.now().year + 1
+
+
+def _text_without(el, skip):
+    """Text of `el` leaving out the subtrees in `skip` (nested fields, screen-reader labels)."""
+    parts = [el.text or '']
+    for child in el:
+        if isinstance(child.tag, str) and child not in skip:
+            parts.append(_text_without(child, skip))
+        parts.append(child.tail or '')
+    return _clean(' '.join(parts))
+
+
+def _card_fields(card):
+    """Field -> value for one player card, from a single walk over its elements."""
+    found = {}  # field -> (rank, element)
+    labels = set()
+    for el in card.iterdescendants():
+        if not isinstance(el.tag, str):
+            continue
+        if _is_label(el):
+            labels.add(el)
+            # "<span><span class=sr-only>Hometown</span> Austin, Texas</span>"
+            field = LABEL_FIELDS.get(_label_key(el.text_content()))
+            parent = el.getparent()
+            if field and field not in found and parent is not None and parent is not card:
+                found[field] = (len(_CLASS_RANK), parent)
+            continue
+        for cls in _classes(el):
+            field = CLASS_FIELDS.get(cls)
+            if field and (field not in found or _CLASS_RANK[cls] < found[field][0]):
+                found[field] = (_CLASS_RANK[cls], el)
+                break
+    found = {field: el for field, (_, el) in found.items()}
+    skip = labels | set(found.values())
+    values = {}
+    for field, el in found.items():
+        if field == 'Name':
+            link = el.find('.//a')
+            value = _text_without(link if link is not None else el, skip - {el})
+        else:
+            value = _text_without(el, skip - {el})
+        if value:
+            values[field] = value
+    return values
+
+
+def _parse_cards(root, layouts):
+    for card_class, path in _card_paths:
+        if layouts is not None and card_class not in layouts:
+            continue
+        cards = path(root)
+        if cards:
+            return [_card_fields(card) for card in cards], card_class
+    return [], None
+
+
+def _header_fields(cells):
+    """Column index -> field (or 'Hometown/High School' for a combined column) from a header row."""
+    columns = {}
+    for index, cell in enumerate(cells):
+        key = _label_key(cell.text_content())
+        field = LABEL_FIELDS.get(key)
+        if field is None and '/' in key:
+            halves = [LABEL_FIELDS.get(half) for half in key.split('/', 1)]
+            if halves == ['Hometown', 'High School']:
+                field = 'Hometown/High School'
+        if field and field not in columns.values():
+            columns[index] = field
+    return columns
+
+
+def _row_values(cells, columns):
+    values = {}
+    for index, field in columns.items():
+        if index >= len(cells):
+            continue
+        value = _clean(cells[index].text_content())
+        if not value:
+            continue
+        if field == 'Hometown/High School':
+            hometown, _, school = value.partition('/')
+            values['Hometown'], values['High School'] = hometown.strip(), school.strip()
+        else:
+            values[field] = value
+    if '_first' in values or '_last' in values:
+        values['Name'] = _clean(f"{values.pop('_first', '')} {values.pop('_last', '')}")
+    return {k: v for k, v in values.items() if v}
+
+
+def _parse_tables(root):
+    best = []
+    for table in _tables_path(root):
+        rows = _table_rows_path(table)
+        columns, players = None, []
+        for row in rows:
+            cells = _cell_path(row)
+            if columns is None:
+                header = _header_fields(cells)
+                if 'Name' in header.values() or {'_first', '_last'} <= set(header.values()):
+                    if len(header) >= 3:
+                        columns = header
+                continue
+            values = _row_values(cells, columns)
+            if values.get('Name'):
+                players.append(values)
+        if len(players) > len(best):
+            best = players
+    return best
+
+
+def parse_roster(html, roster_year=None, layouts=None):
+    """RosterParse of a roster page: cards if it has them, else the largest roster table.
+
+    `layouts` limits the search to those card classes and/or TABLE (see ROSTER_LAYOUTS).
+    """
+    root = parse_html(html)
+    if roster_year is None:
+        roster_year = find_roster_year(root)
+    players, layout = _parse_cards(root, layouts)
+    players = [p for p in players if p.get('Name')]
+    if len(players) < MIN_PLAYERS and (layouts is None or TABLE in layouts):
+        table_players = _parse_tables(root)
+        if len(table_players) > len(players):
+            players, layout = table_players, TABLE
+    for player in players:
+        player['Graduation Year'] = graduation_year(player.get('Year', ''), roster_year)
+    return RosterParse(players, layout if players else None, roster_year)
+
+
+def _roster_extractor(layouts):
+    def extract(html):
+        roster = parse_roster(html, layouts=layouts)
+        return roster if roster.players else None
+    return extract
+
+
+_dispatch = None
+_dispatch_lock = threading.Lock()
+
+
+def get_roster_dispatch():
+    """Return the process-wide roster dispatcher (CMS fingerprint -> layouts to parse)."""
+    global _dispatch
+    with _dispatch_lock:
+        if _dispatch is None:
+            extractors = {key: _roster_extractor(layouts) for key, layouts in ROSTER_LAYOUTS.items()}
+            _dispatch = ExtractorDispatch('roster', extractors, default=_roster_extractor(None))
+        return _dispatch
+
+
+def extract_roster(url, html):
+    """(RosterParse, Fingerprint) of a roster page, parsed for the layouts of its CMS template."""
+    roster, fp = get_roster_dispatch().extract(url, html)
+    return roster or RosterParse([], None, find_roster_year(parse_html(html))), fp
@@ -0,0 +1,187 @@
+# schemas.py - the JSON shapes our extraction prompts ask Gemini for
+#
+# Each payload (coaching staff, roster, majors) is declared once, in the schema
+# dialect Gemini takes as response_schema. The same schema is sent with the
+# request, so the model is constrained to emit exactly that JSON (no fences, no
+# prose, no missing brackets), and it drives our side as well:
+#   validate(schema, value) -> list of problems, [] when the value fits
+#   decode(schema, value)   -> a copy with types coerced ("2024" -> 2024,
+#                              "null"/"N/A"/"" -> None where nullable)
+#
+#     reply = await model_client.generate('gemini-1.5-flash', parts, generation_config=json_config(ROSTER_SCHEMA),
+#                                         stream=True, records_key='players')
+#     data, problems = check(ROSTER_SCHEMA, reply.parsed.data, school_name)
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+_NULL_STRINGS = frozenset(('', 'null', 'none', 'n/a', 'na', '-', '--'))
+
+
+def string(nullable=False, enum=None):
+    schema = {'type': 'STRING'}
+    if nullable:
+        schema['nullable'] = True
+    if enum:
+        schema['enum'] = list(enum)
+    return schema
+
+
+def integer(nullable=False):
+    return {'type': 'INTEGER', 'nullable': True} if nullable else {'type': 'INTEGER'}
+
+
+def boolean():
+    return {'type': 'BOOLEAN'}
+
+
+def array(items):
+    return {'type': 'ARRAY', 'items': items}
+
+
+def obj(properties, required=None):
+    return {
+        'type': 'OBJECT',
+        'properties': properties,
+        'required': list(required if required is not None else properties),
+    }
+
+
+COACH_SCHEMA = obj({
+    'name': string(),
+    'title': string(nullable=True),
+    'email': string(nullable=True),
+    'phone': string(nullable=True),
+    'twitter': string(nullable=True),
+}, required=['name', 'title'])
+
+STAFF_SCHEMA = obj({
+    'success': boolean(),
+    'reason': string(nullable=True),
+    'coachingStaff': array(COACH_SCHEMA),
+})
+
+# coaches/scs5.py asks for a bare list of coaches
+COACH_LIST_SCHEMA = obj({'coaches': array(COACH_SCHEMA)})
+
+PLAYER_SCHEMA = obj({
+    'name': string(),
+    'position': string(nullable=True),
+    'year': string(nullable=True),
+    'hometown': string(nullable=True),
+    'highSchool': string(nullable=True),
+    'graduationYear': integer(nullable=True),
+}, required=['name', 'position', 'year', 'hometown', 'highSchool', 'graduationYear'])
+
+ROSTER_SCHEMA = obj({
+    'success': boolean(),
+    'reason': string(nullable=True),
+    'rosterYear': integer(nullable=True),
+    'players': array(PLAYER_SCHEMA),
+})
+
+MAJORS_SCHEMA = obj({
+    'success': boolean(),
+    'reason': string(nullable=True),
+    'majors': array(string()),
+})
+
+SCHEMAS = {
+    'staff': STAFF_SCHEMA,
+    'coach_list': COACH_LIST_SCHEMA,
+    'roster': ROSTER_SCHEMA,
+    'majors': MAJORS_SCHEMA,
+}
+
+
+def get_schema(name):
+    return SCHEMAS[name]
+
+
+def batch_schema(item_schema, ids):
+    """Schema of a batched reply: one `item_schema` value per item id."""
+    return obj({str(item_id): item_schema for item_id in ids})
+
+
+def json_config(schema, **generation_config):
+    """generation_config for JSON mode constrained to `schema`, merged into any other settings."""
+    return dict(generation_config, response_mime_type='application/json', response_schema=schema)
+
+
+def validate(schema, value, path=''):
+    """Problems with `value` against `schema`, as 'path: message' strings; [] when it fits."""
+    if value is None:
+        return [] if schema.get('nullable') else [f"{path or '$'}: missing"]
+    kind = schema['type']
+    if kind == 'OBJECT':
+        if not isinstance(value, dict):
+            return [f"{path or '$'}: expected an object"]
+        problems = []
+        for name in schema.get('required', ()):
+            if name not in value:
+                problems.append(f"{path}.{name}: missing")
+        for name, sub_schema in schema['properties'].items():
+            if name in value:
+                problems.extend(validate(sub_schema, value[name], f"{path}.{name}"))
+        return problems
+    if kind == 'ARRAY':
+        if not isinstance(value, list):
+            return [f"{path or '$'}: expected a list"]
+        problems = []
+        for index, item in enumerate(value):
+            problems.extend(validate(schema['items'], item, f"{path}[{index}]"))
+        return problems
+    if kind == 'BOOLEAN' and not isinstance(value, bool):
+        return [f"{path or '$'}: expected true/false"]
+    if kind == 'INTEGER' and (isinstance(value, bool) or not isinstance(value, int)):
+        return [f"{path or '$'}: expected an integer"]
+    if kind == 'NUMBER' and (isinstance(value, bool) or not isinstance(value, (int, float))):
+        return [f"{path or '$'}: expected a number"]
+    if kind == 'STRING':
+        if not isinstance(value, str):
+            return [f"{path or '$'}: expected a string"]
+        if schema.get('enum') and value not in schema['enum']:
+            return [f"{path or '$'}: not one of {schema['enum']}"]
+    return []
+
+
+def decode(schema, value):
+    """Copy of `value` coerced to `schema`'s types where that is unambiguous; other values pass through."""
+    kind = schema['type']
+    nullable = schema.get('nullable')
+    if isinstance(value, str) and nullable and kind != 'OBJECT' and value.strip().lower() in _NULL_STRINGS:
+        return None
+    if value is None:
+        return None
+    if kind == 'OBJECT' and isinstance(value, dict):
+        decoded = dict(value)
+        for name, sub_schema in schema['properties'].items():
+            if name in decoded:
+                decoded[name] = decode(sub_schema, decoded[name])
+            elif sub_schema.get('nullable'):
+                decoded[name] = None
+        return decoded
+    if kind == 'ARRAY' and isinstance(value, list):
+        return [decode(schema['items'], item) for item in value]
+    if kind == 'INTEGER' and isinstance(value, (str, float)) and not isinstance(value, bool):
+        try:
+            return int(float(value.strip() if isinstance(value, str) else value))
+        except ValueError:
+            return value
+    if kind == 'BOOLEAN' and isinstance(value, str) and value.strip().lower() in ('true', 'false'):
+        return value.strip().lower() == 'true'
+    if kind == 'STRING' and isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    if kind == 'STRING' and isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def check(schema, value, label=''):
+    """decode() then validate(); returns (decoded value, problems) and logs the first few problems."""
+    decoded = decode(schema, value)
+    problems = validate(schema, decoded)
+    if problems:
+        logger.warning(f"Schema check failed{' for ' + label if label else ''}: {'; '.join(problems[:3])}")
+    return decoded, problems
@@ -0,0 +1,295 @@
+# staff_parser.py - coach records from a staff directory in one walk over the page
+#
+# extract_softball_coaches() used to run six independent searches over a
+# BeautifulSoup tree (header cells, lambda class matchers, every s-person-card
+# in the page, ...) and then three more searches per candidate for email, phone
+# and Twitter. parse_staff() parses the page once with lxml and walks it once,
+# in document order:
+#   - section headers (h1-h6, captions, Sidearm's category rows spanning the table,
+#     "category" / s-text-title blocks) set the current section, and an element
+#     whose class names the sport scopes its subtree to that sport,
+#   - record containers (table rows, s-person-card, "member" divs) become coach
+#     records; their contact fields are read in the same pass over the container,
+#   - records are deduplicated by name, filling fields one copy was missing.
+# Records under a section for the sport are kept. Records outside any such
+# section are kept only from a page the caller knows to be the sport's own (a
+# /sports/softball/coaches page: sport_page, which extract_staff reads off the
+# URL) and whose sections name no other sport; on a whole-department directory
+# they could be anyone's.
+#
+#     coaches, fp = extract_staff(url, html)
+#     # [{'Name': ..., 'Title': ..., 'Email': ..., 'Phone': ..., 'Twitter': ...}, ...]
+
+import logging
+import re
+import threading
+from urllib.parse import urlsplit
+
+from .cms_fingerprint import ExtractorDispatch
+from .relevant_sections import parse_html
+
+logger = logging.getLogger(__name__)
+
+SPORT = 'softball'
+
+ROW = 'row'
+CARD = 'card'
+MEMBER = 'member'
+KINDS = (ROW, CARD, MEMBER)
+
+# Record containers to look for per CMS fingerprint (see cms_fingerprint.py)
+STAFF_LAYOUTS = {
+    'sidearm/nextgen': (CARD,),
+    'sidearm/classic': (ROW,),
+    'sidearm': (ROW, CARD),
+    'prestosports': (ROW,),
+    'stretch': (ROW, MEMBER),
+}
+
+SPORTS_RE = re.compile(
+    r'\b(?:(?:base|basket|foot|soft|volley|hand)ball|soccer|golf|tennis|swimming|diving|lacrosse|hockey|'
+    r'wrestling|rowing|gymnastics|track|cross country|bowling|rifle|fencing|skiing|equestrian|water polo)\b',
+    re.I,
+)
+_SPORT_PATH_RE = re.compile(rf'/(?:{SPORT}|sball)(?:/|$)', re.I)  # /sports/softball/coaches, Presto's /sports/sball/
+_PHONE_RE = re.compile(r'\d{3}[-.)]?\s?\d{3}[-.]?\d{4}')
+_TITLE_RE = re.compile(r'Head Coach|Assistant Coach', re.I)
+_WHITESPACE_RE = re.compile(r'\s+')
+
+_HEADER_TAGS = frozenset(('h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'caption', 'legend'))
+_HEADER_CLASSES = frozenset(('category', 's-text-title', 'sidearm-staff-category'))
+_MAX_HEADER_CHARS = 60
+_CELL_TAGS = frozenset(('td', 'th'))
+
+
+def _clean(text):
+    return _WHITESPACE_RE.sub(' ', text or '').strip()
+
+
+def _colspan(cell):
+    try:
+        return max(int(cell.get('colspan') or 1), 1)
+    except ValueError:
+        return 1
+
+
+def _contacts(el):
+    """(email, phone, twitter) of a record container, from one pass over its subtree."""
+    email = phone = twitter = ''
+    for node in el.iter():
+        if not isinstance(node.tag, str):
+            continue
+        if node.tag == 'a':
+            href = (node.get('href') or '').strip()
+            lowered = href.lower()
+            if not email and lowered.startswith('mailto:'):
+                email = href[7:].split('?')[0].strip()
+            elif not twitter and ('twitter.com' in lowered or '//x.com' in lowered):
+                twitter = href
+            elif not phone and lowered.startswith('tel:'):
+                phone = re.sub(r'\D', '', href)
+        if not phone:
+            for text in (node.text, node.tail if node is not el else None):
+                match = _PHONE_RE.search(text or '')
+                if match:
+                    phone = re.sub(r'\D', '', match.group())
+                    break
+    return email, phone, twitter
+
+
+def _record(name, title, el):
+    email, phone, twitter = _contacts(el)
+    if name and any([title, email, phone, twitter]):
+        return {'Name': name, 'Title': title, 'Email': email, 'Phone': phone, 'Twitter': twitter}
+    return None
+
+
+def _from_row(row, cells):
+    return _record(_clean(cells[0].text_content()), _clean(cells[1].text_content()), row)
+
+
+def _from_card(card):
+    name = title = ''
+    for node in card.iter():
+        if not isinstance(node.tag, str):
+            continue
+        classes = (node.get('class') or '').split()
+        if not name and (node.tag == 'h4' or 's-person-details__personal-single-line' in classes):
+            name = _clean(node.text_content())
+        elif not title and 's-person-details__position' in classes:
+            title = _clean(node.text_content())
+    return _record(name, title, card)
+
+
+def _from_member(div):
+    name = title = ''
+    for node in div.iter():
+        if not isinstance(node.tag, str):
+            continue
+        if not name:
+            href = (node.get('href') or '').lower()
+            if node.tag == 'a' and not href.startswith(('mailto:', 'tel:')) and 'twitter.com' not in href:
+                name = _clean(node.text_content())
+            elif 'name' in (node.get('class') or '').split():
+                name = _clean(node.text_content())
+        if not title:
+            for text in (node.text, node.tail):
+                if text and _TITLE_RE.search(text):
+                    title = _clean(text)
+                    break
+    return _record(name, title, div)
+
+
+class _Walk:
+    def __init__(self, sport, kinds, sport_page=False):
+        self.sport_re = re.compile(rf'\b{re.escape(sport)}\b', re.I)
+        self.kinds = kinds
+        self.sport_page = sport_page
+        self.section = None
+        self.sections = []
+        self.records = []  # (section, record)
+        self.columns = {}  # table -> column count
+
+    def _header(self, text):
+        self.section = text
+        self.sections.append(text)
+
+    def _spans_table(self, row, cells):
+        """Whether a row is a header across its table rather than a record with empty cells."""
+        if len(cells) == 1 or all(c.tag == 'th' for c in cells):
+            return True
+        table = next(row.iterancestors('table'), None)
+        if table is None:
+            return False
+        if table not in self.columns:
+            self.columns[table] = max(sum(_colspan(c) for c in r if c.tag in _CELL_TAGS) for r in table.iter('tr'))
+        return any(_colspan(c) >= self.columns[table] for c in cells)
+
+    def visit(self, el):
+        for child in el:
+            tag = child.tag
+            if not isinstance(tag, str):
+                continue
+            classes = child.get('class') or ''
+            class_set = classes.split()
+
+            if tag == 'tr':
+                cells = [c for c in child if c.tag in _CELL_TAGS]
+                texts = [c for c in cells if _clean(c.text_content())]
+                if (len(texts) == 1 and len(_clean(texts[0].text_content())) <= _MAX_HEADER_CHARS
+                        and self._spans_table(child, cells)):
+                    self._header(_clean(texts[0].text_content()))  # "Softball" row spanning the table
+                elif ROW in self.kinds and len(cells) >= 2 and any(c.tag == 'td' for c in cells):
+                    self._emit(_from_row(child, cells))
+                continue
+            if 's-person-card' in class_set:
+                if CARD in self.kinds:
+                    self._emit(_from_card(child))
+                continue
+            if MEMBER in self.kinds and tag in ('div', 'li') and 'member' in classes.lower():
+                self._emit(_from_member(child))
+                continue
+            if tag in _HEADER_TAGS or _HEADER_CLASSES.intersection(class_set):
+                text = _clean(child.text_content())
+                if text and len(text) <= _MAX_HEADER_CHARS:
+                    self._header(text)
+                    continue
+
+            if self.sport_re.search(classes):
+                # <div class="staff-softball">: everything inside is the sport's
+                outer = self.section
+                self._header(self.sport_re.search(classes).group())
+                self.visit(child)
+                self.section = outer
+            else:
+                self.visit(child)
+
+    def _emit(self, record):
+        if record:
+            self.records.append((self.section, record))
+
+    def kept(self):
+        if any(self.sport_re.search(s) for s in self.sections):
+            keep = [r for section, r in self.records if section and self.sport_re.search(section)]
+        elif self.sport_page and not any(SPORTS_RE.search(s) for s in self.sections):
+            keep = [r for _, r in self.records]
+        else:
+            keep = []  # no section for the sport on a page that isn't only the sport's
+        return _dedupe(keep)
+
+
+def _dedupe(records):
+    by_name = {}
+    for record in records:
+        key = record['Name'].casefold()
+        seen = by_name.get(key)
+        if seen is None:
+            by_name[key] = record
+        else:
+            for field, value in record.items():
+                if value and not seen[field]:
+                    seen[field] = value
+    return list(by_name.values())
+
+
+def parse_staff(html, sport=SPORT, kinds=None, sport_page=False):
+    """Coach records for `sport` from a staff page; `kinds` limits the record containers (see STAFF_LAYOUTS).
+
+    Only records under a section naming the sport are returned, unless
+    `sport_page` says the whole page is the sport's.
+    """
+    root = parse_html(html)
+    walk = _Walk(sport, kinds or KINDS, sport_page)
+    walk.visit(root)
+    return walk.kept()
+
+
+def as_staff_result(coaches):
+    """Coach records in the shape of schemas.STAFF_SCHEMA, like a successful Gemini extraction."""
+    return {
+        'success': True,
+        'reason': None,
+        'coachingStaff': [{
+            'name': c['Name'],
+            'title': c['Title'] or None,
+            'email': c['Email'] or None,
+            'phone': c['Phone'] or None,
+            'twitter': c['Twitter'] or None,
+        } for c in coaches],
+    }
+
+
+def _staff_extractor(kinds):
+    def extract(html, sport_page=False):
+        return parse_staff(html, kinds=kinds, sport_page=sport_page)
+    return extract
+
+
+_dispatch = None
+_dispatch_lock = threading.Lock()
+
+
+def get_staff_dispatch():
+    """Return the process-wide staff dispatcher (CMS fingerprint -> record containers to look for)."""
+    global _dispatch
+    with _dispatch_lock:
+        if _dispatch is None:
+            extractors = {key: _staff_extractor(kinds) for key, kinds in STAFF_LAYOUTS.items()}
+            _dispatch = ExtractorDispatch('staff', extractors, default=_staff_extractor(None))
+        return _dispatch
+
+
+def is_sport_page(url):
+    """Whether a staff page URL is SPORT's own page rather than a department-wide directory."""
+    return _SPORT_PATH_RE.search(urlsplit(url).path) is not None
+
+
+def extract_staff(url, html, sport_page=None):
+    """(coach records, Fingerprint) of a staff directory page for SPORT.
+
+    See parse_staff for `sport_page`; by default it is read off the URL.
+    """
+    if sport_page is None:
+        sport_page = is_sport_page(url)
+    coaches, fp = get_staff_dispatch().extract(url, html, sport_page=sport_page)
+    return coaches or [], fp
@@ -0,0 +1,182 @@
+# token_estimator.py - count Gemini tokens locally instead of calling count_tokens()
+#
+# model.count_tokens() is a network round trip, and the scrapers made two per
+# call (prompt and reply) just for accounting. TokenEstimator counts word pieces,
+# digits and punctuation runs with a regex and scales the result by a factor
+# learned from the model's own numbers: every response's usage_metadata gives the
+# true prompt token count, so each call is a free calibration sample. The learned
+# scale and error bound are kept per model in .scraper_cache/token_calibration.json.
+#
+#     # what model_client.generate() does around each request
+#     estimator = get_token_estimator(model)
+#     async with key_scheduler.lease(estimator.budget(parts)) as lease:
+#         reply = await post(model, parts, lease.key)
+#         input_tokens, output_tokens = estimator.usage(reply, parts, reply.text)
+#         lease.report(input_tokens + output_tokens)
+
+import logging
+import re
+import threading
+
+from .json_store import JsonStore
+
+logger = logging.getLogger(__name__)
+
+# Letter runs, single digits (the tokenizer splits numbers digit by digit),
+# punctuation/markup runs
+_PIECE_RE = re.compile(r'[^\W\d_]+|\d|[^\w\s]+|_+')
+WORD_CHARS_PER_TOKEN = 8  # most words are one piece in a 256k vocabulary; long ones split
+PUNCT_CHARS_PER_TOKEN = 2  # '</', '">', '="' and friends are single pieces
+IMAGE_TOKENS = 258  # flat cost of one image part on Gemini 1.5
+
+DEFAULT_ERROR_BOUND = 0.25  # relative error assumed until there are enough samples
+MIN_SAMPLES = 20
+MAX_SAMPLES = 200
+SAVE_EVERY = 10
+BOUND_PERCENTILE = 0.95
+
+
+def raw_count(text):
+    """Uncalibrated token count of one string."""
+    tokens = 0
+    for match in _PIECE_RE.finditer(text):
+        piece = match.group()
+        first = piece[0]
+        if first.isalpha():
+            tokens += 1 + (len(piece) - 1) // WORD_CHARS_PER_TOKEN
+            if not piece.isascii():
+                tokens += sum(1 for c in piece if not c.isascii()) // 2
+        elif first.isdigit():
+            tokens += 1
+        else:
+            tokens += (len(piece) + PUNCT_CHARS_PER_TOKEN - 1) // PUNCT_CHARS_PER_TOKEN
+    return tokens
+
+
+def _split_parts(parts):
+    """(raw text tokens, image tokens) of a prompt given as a string or a list of SDK-style parts."""
+    if isinstance(parts, str):
+        return raw_count(parts), 0
+    text_tokens = image_tokens = 0
+    for part in parts:
+        if isinstance(part, (dict, bytes, bytearray)):
+            image_tokens += IMAGE_TOKENS
+        else:
+            text_tokens += raw_count(str(part))
+    return text_tokens, image_tokens
+
+
+def usage_tokens(response):
+    """(prompt tokens, output tokens) from a response's usage_metadata, or None when it has none."""
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is None:
+        return None
+    if isinstance(usage, dict):
+        prompt, output = usage.get('promptTokenCount'), usage.get('candidatesTokenCount')
+    else:
+        prompt, output = getattr(usage, 'prompt_token_count', None), getattr(usage, 'candidates_token_count', None)
+    if not prompt:
+        return None
+    return prompt, output or 0
+
+
+class TokenEstimator:
+    def __init__(self, model, store=None):
+        self.model = model
+        self.store = store or JsonStore('token_calibration')
+        self._lock = threading.Lock()
+        entry = self.store.get(model) or {}
+        self._samples = [tuple(s) for s in entry.get('samples', [])][-MAX_SAMPLES:]
+        self._unsaved = 0
+        self._refit()
+        self.from_metadata = 0
+        self.estimated = 0
+
+    def _refit(self):
+        # Caller holds the lock (or is __init__)
+        raw = sum(s[0] for s in self._samples)
+        actual = sum(s[1] for s in self._samples)
+        self.scale = actual / raw if raw else 1.0
+        if len(self._samples) < MIN_SAMPLES:
+            self.error_bound = DEFAULT_ERROR_BOUND
+            return
+        errors = sorted(abs(self.scale * r / a - 1) for r, a in self._samples)
+        self.error_bound = errors[min(len(errors) - 1, int(len(errors) * BOUND_PERCENTILE))]
+
+    def estimate(self, parts):
+        """Expected token count of a string or a list of prompt parts."""
+        text_tokens, image_tokens = _split_parts(parts)
+        return int(round(text_tokens * self.scale)) + image_tokens
+
+    def budget(self, parts):
+        """Upper bound on the token count: the estimate plus the calibrated error margin."""
+        text_tokens, image_tokens = _split_parts(parts)
+        return int(text_tokens * self.scale * (1 + self.error_bound)) + 1 + image_tokens
+
+    def observe(self, parts, actual_tokens):
+        """Record the model's real prompt token count for `parts` to refine the scale."""
+        text_tokens, image_tokens = _split_parts(parts)
+        actual_text = actual_tokens - image_tokens
+        if text_tokens <= 0 or actual_text <= 0:
+            return
+        with self._lock:
+            self._samples.append((text_tokens, actual_text))
+            del self._samples[:-MAX_SAMPLES]
+            self._refit()
+            self._unsaved += 1
+            save = self._unsaved >= SAVE_EVERY
+        if save:
+            self.save()
+
+    def usage(self, response, parts=None, output_text=None):
+        """(input tokens, output tokens) of a generation call.
+
+        Reads usage_metadata when the response carries it (and calibrates on
+        `parts`), otherwise falls back to estimating `parts` and the reply text
+        (`output_text`, for streamed replies, or response.text).
+        """
+        counted = usage_tokens(response)
+        if counted is not None:
+            with self._lock:
+                self.from_metadata += 1
+            if parts is not None:
+                self.observe(parts, counted[0])
+            return counted
+        with self._lock:
+            self.estimated += 1
+        input_tokens = self.estimate(parts) if parts is not None else 0
+        if output_text is not None:
+            return input_tokens, self.estimate(output_text)
+        try:
+            output_tokens = self.estimate(response.text)
+        except (AttributeError, ValueError):
+            output_tokens = 0  # blocked or empty candidates have no text
+        return input_tokens, output_tokens
+
+    def save(self):
+        with self._lock:
+            samples = list(self._samples)
+            self._unsaved = 0
+        self.store.set(self.model, {'samples': samples, 'scale': self.scale, 'error_bound': self.error_bound})
+
+    def log_stats(self):
+        if self._unsaved:
+            self.save()
+        logger.info(
+            f"Token estimates for {self.model}: scale {self.scale:.3f}, error bound ±{self.error_bound:.0%} "
+            f"over {len(self._samples)} samples; {self.from_metadata} calls counted from usage metadata, "
+            f"{self.estimated} estimated"
+        )
+
+
+_estimators = {}
+_estimators_lock = threading.Lock()
+
+
+def get_token_estimator(model='gemini-1.5-flash'):
+    """Return the process-wide estimator for `model` (SDK names like 'models/gemini-1.5-flash' work too)."""
+    name = model.split('/')[-1]
+    with _estimators_lock:
+        if name not in _estimators:
+            _estimators[name] = TokenEstimator(name)
+        return _estimators[name]
@@ -0,0 +1,507 @@
+# wrapper_induction.py - learn XPath extraction rules from successful Gemini extractions
+#
+# When Gemini pulls coaches or players out of a page we know the answer for
+# that page, but not where it came from, so the next run pays for the same
+# extraction again. WrapperRegistry.learn() aligns the extracted values back
+# onto the DOM (names and titles by text, emails by their mailto: link, phones
+# by their digits), finds the element that holds each record, and derives:
+#   - a record XPath scoped to the records' own section: their tag (and the
+#     class they share) under the nearest common ancestor with an id or class,
+#     or after the section header they follow; the shared class page-wide only
+#     when that alone picks out just these records,
+#   - one relative path per field: a class unique within the record, or the
+#     element's position.
+# The rule is kept only if re-applying it to the same page reproduces the
+# model's records (WRAPPER_MIN_AGREEMENT); fields that don't agree are dropped.
+# Rules live in .scraper_cache/wrapper_rules.json per (site, kind, CMS
+# fingerprint). WrapperRegistry.extract() tries them before the model and
+# checks the field shapes of what comes back (names look like names, emails
+# like emails, ...); a rule that keeps failing is forgotten.
+#
+#     wrappers = get_wrapper_registry('staff')
+#     coaches = wrappers.extract(url, html)
+#     if coaches is None:
+#         result = ...  # ask Gemini
+#         wrappers.learn(url, html, result['coachingStaff'])
+
+import functools
+import logging
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+from lxml import etree
+
+from .cms_fingerprint import fingerprint
+from .config import WRAPPER_MIN_AGREEMENT, WRAPPER_MIN_SHAPE, WRAPPER_MAX_FAILURES
+from .json_store import JsonStore
+from .politeness import registrable_domain
+from .relevant_sections import parse_html
+
+logger = logging.getLogger(__name__)
+
+TEXT = 'text'
+MAILTO = 'mailto'
+TWITTER = 'twitter'
+DIGITS = 'digits'
+
+_YEAR_RE = re.compile(
+    r'^(?:(?:r|rs|redshirt)[\s.-]*)?(?:fr|freshman|so|sophomore|jr|junior|sr|senior|gr|grad|graduate|first|second|'
+    r'third|fourth|fifth|1st|2nd|3rd|4th|5th|6th)\b', re.I)
+
+# Per-field value shapes, checked on every record a learned rule extracts
+SHAPES = {
+    'name': lambda v: 3 <= len(v) <= 60 and ' ' in v and not re.search(r'[\d@]', v),
+    'title': lambda v: 2 <= len(v) <= 100 and not v.replace('-', '').isdigit(),
+    'email': lambda v: re.fullmatch(r'[^@\s]+@[^@\s]+\.\w+', v) is not None,
+    'phone': lambda v: len(v) in (10, 11) and v.isdigit(),
+    'twitter': lambda v: 1 <= len(v) <= 100,
+    'position': lambda v: 1 <= len(v) <= 40,
+    'year': lambda v: _YEAR_RE.match(v) is not None,
+    'hometown': lambda v: 2 <= len(v) <= 80,
+    'highSchool': lambda v: 2 <= len(v) <= 120,
+}
+
+# What a rule extracts per page kind. `read` says how a field's value is matched and read.
+WRAPPER_KINDS = {
+    'staff': {
+        'fields': ('name', 'title', 'email', 'phone', 'twitter'),
+        'required': ('name', 'title'),
+        'read': {'email': MAILTO, 'twitter': TWITTER, 'phone': DIGITS},
+        'min_records': 1,
+    },
+    'roster': {
+        'fields': ('name', 'position', 'year', 'hometown', 'highSchool'),
+        'required': ('name', 'position', 'year', 'hometown', 'highSchool'),
+        'read': {},
+        'min_records': 5,
+    },
+}
+
+MAX_RECORD_LEVELS = 6  # how far above a name element a record's root may be
+
+_HEADER_TAGS = frozenset(('h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'caption'))
+_MAX_HEADER_CHARS = 60
+_MAX_TEXT = 150
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def _clean(text):
+    return _WHITESPACE_RE.sub(' ', text or '').strip()
+
+
+def _twitter_handle(value):
+    value = (value or '').strip().lower()
+    match = re.search(r'(?:twitter\.com|x\.com)/(?:#!/)?@?([a-z0-9_]+)', value)
+    if match:
+        return match.group(1)
+    return value.lstrip('@') if re.fullmatch(r'@?[a-z0-9_]+', value) else ''
+
+
+def normalize(value, read=TEXT):
+    """Comparable form of a field value."""
+    if value is None:
+        return ''
+    value = str(value)
+    if read == DIGITS:
+        digits = re.sub(r'\D', '', value)
+        return digits[-10:] if len(digits) >= 10 else ''
+    if read == MAILTO:
+        return value.strip().lower().replace('mailto:', '').split('?')[0]
+    if read == TWITTER:
+        return _twitter_handle(value)
+    return _clean(value).casefold()
+
+
+def read_value(el, read=TEXT):
+    """Field value of an element as a rule reads it (None when it has none)."""
+    if read == MAILTO:
+        href = el.get('href') or ''
+        return href[7:].split('?')[0].strip() if href.lower().startswith('mailto:') else None
+    if read == TWITTER:
+        href = el.get('href') or ''
+        return href if _twitter_handle(href) else None
+    text = _clean(el.text_content())
+    if read == DIGITS:
+        digits = re.sub(r'\D', '', text)
+        return digits if len(digits) >= 10 else None
+    return text or None
+
+
+def _has_class(cls):
+    return f'contains(concat(" ", normalize-space(@class), " "), " {cls} ")'
+
+
+@functools.lru_cache(maxsize=512)
+def _xpath(expression):
+    return etree.XPath(expression)
+
+
+class _Index:
+    """Elements of a page by the normalized values they could hold."""
+
+    def __init__(self, root):
+        self.by_value = {TEXT: defaultdict(list), MAILTO: defaultdict(list),
+                         TWITTER: defaultdict(list), DIGITS: defaultdict(list)}
+        for el in root.iter():
+            if not isinstance(el.tag, str):
+                continue
+            text = _clean(el.text_content())
+            if text and len(text) <= _MAX_TEXT:
+                self.by_value[TEXT][text.casefold()].append(el)
+                digits = normalize(text, DIGITS)
+                if digits and len(text) <= 40:
+                    self.by_value[DIGITS][digits].append(el)
+            if el.tag == 'a':
+                href = el.get('href') or ''
+                if href.lower().startswith('mailto:'):
+                    self.by_value[MAILTO][normalize(href, MAILTO)].append(el)
+                elif _twitter_handle(href):
+                    self.by_value[TWITTER][_twitter_handle(href)].append(el)
+
+    def find(self, value, read):
+        """Deepest elements holding `value`."""
+        key = normalize(value, read)
+        elements = self.by_value[read].get(key, []) if key else []
+        if len(elements) < 2:
+            return list(elements)
+        ancestors = {id(a) for el in elements for a in el.iterancestors()}
+        return [el for el in elements if id(el) not in ancestors]
+
+
+def _inside(el, root):
+    return el is root or any(a is root for a in el.iterancestors())
+
+
+def _align(root, records, spec):
+    """[(record element, {field: element}), ...] for the records that could be placed on the page."""
+    index = _Index(root)
+    reads = spec['read']
+    candidates = []  # per record: (name elements, {field: elements})
+    for record in records:
+        names = index.find(record.get('name'), TEXT)
+        fields = {f: index.find(record.get(f), reads.get(f, TEXT)) for f in spec['fields'] if f != 'name'}
+        candidates.append((names, fields))
+
+    # Which records each ancestor holds a name of, so a record's root can't swallow its neighbours
+    owners = defaultdict(set)
+    for i, (names, _) in enumerate(candidates):
+        for name in names:
+            for ancestor in name.iterancestors():
+                owners[id(ancestor)].add(i)
+
+    aligned = []
+    for i, (names, fields) in enumerate(candidates):
+        best = None  # (fields covered, -level, root, name element)
+        for name in names:
+            level, node = 0, name
+            while node is not None and level <= MAX_RECORD_LEVELS:
+                if owners[id(node)] - {i}:
+                    break
+                covered = sum(1 for els in fields.values() if any(_inside(e, node) for e in els))
+                score = (covered, -level)
+                if best is None or score > best[:2]:
+                    best = (covered, -level, node, name)
+                node, level = node.getparent(), level + 1
+        if best is None:
+            continue
+        _, _, record_el, name = best
+        elements = {'name': name}
+        for field, els in fields.items():
+            inside = [e for e in els if _inside(e, record_el)]
+            if inside:
+                elements[field] = inside[0]
+        aligned.append((record_el, elements))
+    return aligned
+
+
+def _relative_path(record_el, el):
+    """Path from a record element to one of its fields: a class unique in the record, else by position."""
+    if el is record_el:
+        return '.'
+    for cls in (el.get('class') or '').split():
+        if len(_xpath(f'.//*[{_has_class(cls)}]')(record_el)) == 1:
+            return f'.//*[{_has_class(cls)}]'
+    steps, node = [], el
+    while node is not record_el:
+        parent = node.getparent()
+        same = [c for c in parent if c.tag == node.tag]
+        steps.append(f'{node.tag}[{same.index(node) + 1}]')
+        node = parent
+    return './' + '/'.join(reversed(steps))
+
+
+def _anchor(el):
+    """XPath of the nearest element at or above `el` with an id or class ('' at the top of the page)."""
+    node = el
+    while node is not None and node.tag not in ('body', 'html'):
+        if node.get('id'):
+            return f'//*[@id="{node.get("id")}"]'
+        classes = (node.get('class') or '').split()
+        if classes:
+            return f'//{node.tag}[{_has_class(classes[0])}]'
+        node = node.getparent()
+    return ''
+
+
+def _common_ancestor(elements):
+    path = list(reversed([elements[0]] + list(elements[0].iterancestors())))
+    for el in elements[1:]:
+        ancestors = {id(a) for a in [el] + list(el.iterancestors())}
+        while path and id(path[-1]) not in ancestors:
+            path.pop()
+    return path[-1] if path else None
+
+
+def _is_header(el):
+    if el.tag == 'tr':
+        return len([c for c in el if c.tag in ('td', 'th')]) == 1
+    return el.tag in _HEADER_TAGS
+
+
+def _preceding_header(el, in_records):
+    """Nearest section header before `el` in document order that isn't inside another record."""
+    node = el
+    while node is not None and node.tag not in ('body', 'html'):
+        for sibling in node.itersiblings(preceding=True):
+            if not isinstance(sibling.tag, str) or sibling in in_records:
+                continue
+            headers = [h for h in sibling.iter() if isinstance(h.tag, str) and _is_header(h)]
+            if headers:
+                return headers[-1]
+        node = node.getparent()
+    return None
+
+
+def _literal(text):
+    if '"' not in text:
+        return f'"{text}"'
+    if "'" not in text:
+        return f"'{text}'"
+    return None
+
+
+def _header_predicate(record_els):
+    """XPath predicate for 'the section header these records all follow', or None."""
+    in_records = set()
+    for el in record_els:
+        in_records.update([el] + list(el.iterancestors()))
+    headers = {_preceding_header(el, in_records) for el in record_els}
+    if len(headers) != 1 or None in headers:
+        return None
+    header = headers.pop()
+    text = _clean(header.text_content())
+    literal = _literal(text)
+    if not text or len(text) > _MAX_HEADER_CHARS or literal is None:
+        return None
+    if header.tag == 'tr':
+        # Header rows have one cell; the rows after them are the records
+        return f'[count(td|th)>1][preceding::tr[count(td|th)=1][1][normalize-space()={literal}]]'
+    return f'[preceding::{header.tag}[1][normalize-space()={literal}]]'
+
+
+def _record_xpaths(record_els):
+    """Candidate record XPaths, narrowest scope first.
+
+    The records' own container (their common ancestor with an id or class),
+    then the section header they follow, and the class they share anywhere in
+    the page last: on a department-wide directory the class alone also picks
+    up every other sport's staff.
+    """
+    tags = Counter(el.tag for el in record_els)
+    tag = tags.most_common(1)[0][0]
+    same_tag = [el for el in record_els if el.tag == tag]
+    shared = set((same_tag[0].get('class') or '').split())
+    for el in same_tag[1:]:
+        shared &= set((el.get('class') or '').split())
+    root = same_tag[0].getroottree()
+    classed = tag
+    if shared:
+        # The class that picks out the fewest extra elements
+        cls = min(sorted(shared), key=lambda c: len(_xpath(f'//{tag}[{_has_class(c)}]')(root)))
+        classed = f'{tag}[{_has_class(cls)}]'
+    ancestor = _common_ancestor(same_tag) if len(same_tag) > 1 else same_tag[0].getparent()
+    anchor = _anchor(ancestor) if ancestor is not None else ''
+
+    candidates = [f'{anchor}//{classed}'] if anchor else []
+    header = _header_predicate(same_tag)
+    if header:
+        candidates.append(f'//{classed}{header}')
+    candidates.append(f'//{classed}')
+    return candidates
+
+
+def apply_rule(root, rule, spec):
+    """Records a rule extracts from a page, with every field of the kind present (None when missing)."""
+    reads = spec['read']
+    records = []
+    for record_el in _xpath(rule['records'])(root):
+        record = {field: None for field in spec['fields']}
+        for field, path in rule['fields'].items():
+            for el in _xpath(path)(record_el):
+                value = read_value(el, reads.get(field, TEXT))
+                if value:
+                    record[field] = value
+                    break
+        if record['name']:
+            records.append(record)
+    return records
+
+
+def _agreement(extracted, records, spec):
+    """(name recall, name precision, {field: share of matched records whose values agree})."""
+    reads = spec['read']
+    expected = {normalize(r.get('name')): r for r in records if r.get('name')}
+    found = {normalize(r['name']): r for r in extracted}
+    matched = [name for name in found if name in expected]
+    recall = len(matched) / len(expected) if expected else 0.0
+    precision = len(matched) / len(found) if found else 0.0
+    fields = {}
+    for field in spec['fields']:
+        compared = [name for name in matched if normalize(expected[name].get(field), reads.get(field, TEXT))]
+        if compared:
+            agree = sum(1 for name in compared
+                        if normalize(found[name].get(field), reads.get(field, TEXT))
+                        == normalize(expected[name].get(field), reads.get(field, TEXT)))
+            fields[field] = agree / len(compared)
+    return recall, precision, fields
+
+
+def induce(root, records, spec):
+    """Extraction rule reproducing `records` on the page, or None if none does."""
+    records = [r for r in records if r.get('name')]
+    if len(records) < spec['min_records']:
+        return None
+    aligned = _align(root, records, spec)
+    if len(aligned) < max(spec['min_records'], WRAPPER_MIN_AGREEMENT * len(records)):
+        return None
+
+    fields = {}
+    for field in spec['fields']:
+        paths = Counter(_relative_path(record_el, elements[field])
+                        for record_el, elements in aligned if field in elements)
+        if paths:
+            fields[field] = paths.most_common(1)[0][0]
+    if 'name' not in fields:
+        return None
+
+    for records_xpath in _record_xpaths([record_el for record_el, _ in aligned]):
+        rule = {'records': records_xpath, 'fields': dict(fields)}
+        recall, precision, agreement = _agreement(apply_rule(root, rule, spec), records, spec)
+        if recall >= WRAPPER_MIN_AGREEMENT and precision >= WRAPPER_MIN_AGREEMENT:
+            break
+        logger.debug(f"Rule {records_xpath} found {recall:.0%} of the records at {precision:.0%} precision")
+    else:
+        return None
+    for field in list(rule['fields']):
+        if field != 'name' and agreement.get(field, 0.0) < WRAPPER_MIN_AGREEMENT:
+            del rule['fields'][field]
+    if any(field not in rule['fields'] for field in spec['required']):
+        return None
+    return rule
+
+
+def shape_problems(records, spec):
+    """Why extracted records don't look like `spec`'s records (empty list = they do)."""
+    if len(records) < spec['min_records']:
+        return [f"{len(records)} records"]
+    problems = []
+    for field in spec['fields']:
+        values = [r[field] for r in records if r.get(field)]
+        if field in spec['required'] and len(values) < WRAPPER_MIN_SHAPE * len(records):
+            problems.append(f"{field} on {len(values)}/{len(records)} records")
+            continue
+        good = sum(1 for v in values if SHAPES[field](v))
+        if values and good < WRAPPER_MIN_SHAPE * len(values):
+            problems.append(f"{field} malformed on {len(values) - good}/{len(values)} records")
+    return problems
+
+
+class WrapperRegistry:
+    def __init__(self, kind, store=None):
+        self.kind = kind
+        self.spec = WRAPPER_KINDS[kind]
+        self.store = store or JsonStore('wrapper_rules')
+        self._lock = threading.Lock()
+        self.outcomes = Counter()
+
+    def _key(self, url, html):
+        return f"{registrable_domain(url)}|{self.kind}|{fingerprint(html)}"
+
+    def _count(self, outcome):
+        with self._lock:
+            self.outcomes[outcome] += 1
+
+    def extract(self, url, html):
+        """Records from the learned rule for this site and template, or None when there is none or it failed."""
+        key = self._key(url, html)
+        rule = self.store.get(key)
+        if rule is None:
+            self._count('miss')
+            return None
+        try:
+            records = apply_rule(parse_html(html), rule, self.spec)
+            problems = shape_problems(records, self.spec)
+        except etree.Error as e:
+            records, problems = [], [str(e)]
+        if not problems:
+            self._count('hit')
+            if rule.get('failures'):
+                self.store.set(key, dict(rule, failures=0))
+            return records
+
+        self._count('rejected')
+        failures = rule.get('failures', 0) + 1
+        if failures >= WRAPPER_MAX_FAILURES:
+            logger.info(f"Dropping wrapper rule for {key}: {'; '.join(problems)}")
+            self.store.delete(key)
+        else:
+            logger.info(f"Wrapper rule for {key} rejected on {url}: {'; '.join(problems)}")
+            self.store.set(key, dict(rule, failures=failures))
+        return None
+
+    def learn(self, url, html, records):
+        """Derive and keep a rule from a successful model extraction, unless the site already has a working one."""
+        if not records or not html:
+            return None
+        key = self._key(url, html)
+        existing = self.store.get(key)
+        if existing is not None and not existing.get('failures'):
+            return None
+        start = time.perf_counter()
+        try:
+            rule = induce(parse_html(html), records, self.spec)
+        except (etree.Error, ValueError) as e:
+            logger.debug(f"Wrapper induction failed for {url}: {e}")
+            rule = None
+        if rule is None:
+            self._count('unlearnable')
+            return None
+        rule.update({'learned_from': url, 'learned_at': time.time(), 'failures': 0})
+        self.store.set(key, rule)
+        self._count('learned')
+        logger.info(f"Learned wrapper rule for {key} in {time.perf_counter() - start:.3f}s: "
+                    f"{rule['records']} with {', '.join(rule['fields'])}")
+        return rule
+
+    def log_stats(self):
+        o = self.outcomes
+        logger.info(
+            f"{self.kind} wrapper rules: {o['hit']} pages extracted, {o['rejected']} rejected, {o['miss']} without "
+            f"a rule; {o['learned']} learned, {o['unlearnable']} extractions not reproducible"
+        )
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_wrapper_registry(kind):
+    """Return the process-wide rule registry for a page kind ('staff' or 'roster')."""
+    with _registries_lock:
+        if kind not in _registries:
+            store = next((r.store for r in _registries.values()), None)  # one store per file
+            _registries[kind] = WrapperRegistry(kind, store)
+        return _registries[kind]